@@ -1,10 +1,45 @@
 # backend/main.py – FastAPI Application Entry Point
 
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from backend.routes import travel
+from backend.services import metrics, session_store
+from backend.services.backend_router import agent_router
+from backend.services.coalescing import prompt_coalescer
+from backend.services.concurrency import agent_limiter
+from backend.services.response_cache import response_cache
+from backend.services.tracing import TracingMiddleware, configure_logging
+from backend.services.upstream import upstream_scheduler
+from backend.tools import expense_calculator
+from config import settings
 
-app = FastAPI(title="AI Travel Planner Agent", version="1.0")
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher = expense_calculator.make_refresher()
+    if refresher is not None:
+        refresher.start()
+    # Build the agent before taking traffic so the first user does not pay for it
+    if settings.AGENT_WARMUP:
+        try:
+            await agent_router.warm_up(prime=settings.AGENT_WARMUP_PRIME)
+        except Exception as e:
+            # Keep serving; /ready stays 503 and the next request retries the build
+            logger.error("Agent warm-up failed: %s", e)
+    yield
+    if refresher is not None:
+        refresher.stop()
+    # Write-behind: persist the last turns before the worker exits
+    session_store.close()
+
+
+app = FastAPI(title="AI Travel Planner Agent", version="1.0", lifespan=lifespan)
 
 # CORS for frontend access
 app.add_middleware(
@@ -15,9 +50,86 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(TracingMiddleware)
+
 # Route registration
 app.include_router(travel.router)
 
 @app.get("/")
 def root():
     return {"message": "Welcome to the AI Travel Planner API"}
+
+@app.get("/ready")
+def ready():
+    status = agent_router.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+def _component_metrics():
+    """Scrape-time samples read from the caches, limiter, router and session pools."""
+    expense = expense_calculator.stats()
+    caches = {"response": response_cache.stats(), "expense": expense["cache"], "expense_llm": expense["llm_cache"]}
+    response = caches["response"]
+    response["hits"] = response["exact_hits"] + response["semantic_hits"]
+    for cache, stats in caches.items():
+        lookups = stats["hits"] + stats["misses"]
+        yield "cache_hits_total", "counter", {"cache": cache}, stats["hits"]
+        yield "cache_misses_total", "counter", {"cache": cache}, stats["misses"]
+        yield "cache_entries", "gauge", {"cache": cache}, stats["entries"]
+        yield "cache_hit_ratio", "gauge", {"cache": cache}, stats["hits"] / lookups if lookups else 0.0
+    yield "expense_lookups_coalesced_total", "counter", {}, expense["coalesced"]
+    if expense["index"]:
+        for outcome in ("hits", "stale", "misses"):
+            yield "cost_index_lookups_total", "counter", {"outcome": outcome}, expense["index"][outcome]
+        yield "cost_index_entries", "gauge", {}, expense["index"]["entries"]
+
+    runs = agent_limiter.stats()
+    yield "agent_runs_in_flight", "gauge", {}, runs["in_flight"]
+    yield "agent_runs_queued", "gauge", {}, runs["queued"]
+    yield "agent_runs_rejected_total", "counter", {}, runs["rejected"]
+    yield "agent_runs_shared_in_flight", "gauge", {}, prompt_coalescer.stats()["flights"]
+
+    yield "agent_failovers_total", "counter", {}, agent_router.failovers
+    yield "agent_hedges_total", "counter", {}, agent_router.hedges
+    yield "agent_hedge_wins_total", "counter", {}, agent_router.hedge_wins
+    for backend in agent_router.backends:
+        stats = backend.stats.snapshot()
+        labels = {"backend": backend.name}
+        yield "agent_backend_runs_total", "counter", labels, stats["runs"]
+        yield "agent_backend_errors_total", "counter", labels, stats["errors"]
+        yield "agent_backend_rate_limited_total", "counter", labels, stats["rate_limited"]
+        yield "agent_backend_error_rate", "gauge", labels, stats["error_rate"]
+        yield "agent_backend_cooling_down", "gauge", labels, int(stats["cooling_down"])
+        if backend.provider.ready:
+            sessions = backend.provider.get().session_manager.stats()
+            yield "agent_sessions", "gauge", labels, sessions["sessions"]
+            yield "agent_session_history_bytes", "gauge", labels, sessions["approx_history_bytes"]
+            yield "agent_session_evictions_total", "counter", labels, sessions["evictions"]
+            yield "agent_session_restores_total", "counter", labels, sessions["restores"]
+            yield "agent_session_compactions_total", "counter", labels, sessions["compactions"]
+    for name, stats in upstream_scheduler.stats().items():
+        labels = {"upstream": name}
+        yield "upstream_concurrency_limit", "gauge", labels, stats["limit"]
+        yield "upstream_in_flight", "gauge", labels, stats["in_flight"]
+        yield "upstream_queued", "gauge", labels, stats["queued"]
+        yield "upstream_paused_seconds", "gauge", labels, stats["paused_for"]
+    writer = session_store.shared_writer()
+    if writer is not None:
+        yield "session_store_backlog", "gauge", {"store": writer.store.name}, writer.backlog()
+
+
+metrics.register_collector(_component_metrics)
+
+
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """Prometheus text exposition by default; `?format=json` returns the same data with percentiles."""
+    if format == "json":
+        return {
+            "metrics": metrics.snapshot(),
+            "agent_runs": agent_limiter.stats(),
+            "coalescing": prompt_coalescer.stats(),
+            "agent_backends": agent_router.stats(),
+            "response_cache": response_cache.stats(),
+            "upstreams": upstream_scheduler.stats(),
+        }
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -1,9 +1,40 @@
 # backend/models.py – Pydantic Schemas
 
+from typing import List, Optional
 from pydantic import BaseModel
 
 class TravelPrompt(BaseModel):
     prompt: str
+    # Reuse a previous response's session_id for follow-ups; omit it to start a fresh conversation
+    session_id: Optional[str] = None
 
 class TravelResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+    # True when served from the response cache (no session is created in that case)
+    cached: bool = False
+    # True when an identical in-flight prompt's run was shared; only that prompt's caller gets the session
+    coalesced: bool = False
+    # Token usage of the run that produced this answer (turns, prompt/output/cached tokens, trimming);
+    # estimated from characters when the model reports none. Absent for cached and shared answers.
+    usage: Optional[dict] = None
+    # True when the agent missed the request deadline and this is a quicker fallback answer
+    degraded: bool = False
+
+class TravelBatchRequest(BaseModel):
+    prompts: List[TravelPrompt]
+    # Destinations to pre-fetch expense estimates for, once each, before the prompts run
+    destinations: List[str] = []
+
+class TravelBatchItem(BaseModel):
+    index: int
+    response: Optional[str] = None
+    session_id: Optional[str] = None
+    cached: bool = False
+    usage: Optional[dict] = None
+    # True when this prompt missed its deadline and the answer is a quicker fallback
+    degraded: bool = False
+    error: Optional[str] = None
+
+class TravelBatchResponse(BaseModel):
+    results: List[TravelBatchItem]
@@ -1,12 +1,171 @@
 # backend/routes/travel.py – Travel Planner Endpoint
 
-from fastapi import APIRouter
-from backend.models import TravelPrompt, TravelResponse
-from backend.services.ai_service import run_travel_agent
+import json
+import math
+import time
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from backend.models import TravelPrompt, TravelResponse, TravelBatchRequest, TravelBatchResponse
+from backend.services.batch import run_batch
+from backend.services.coalescing import prompt_coalescer
+from backend.services.backend_router import agent_router
+from backend.services.concurrency import agent_limiter, AgentOverloadedError
+from backend.services.deadline import DeadlineExceeded, deadline, until_deadline, within_deadline
+from backend.services.fallback import agent_budget, fallback_planner
+from backend.services.response_cache import response_cache
+from backend.services.upstream import is_rate_limit_error, retry_after_of
+from backend.services import metrics
+from config import settings
 
 router = APIRouter()
 
+deadline_misses = metrics.counter("agent_deadline_exceeded_total", "Requests whose agent run missed the deadline")
+
+
+def _use_cache(prompt: TravelPrompt, cache_control: Optional[str], bypass: Optional[str]) -> bool:
+    """Only fresh conversations are cacheable; follow-ups depend on their session history."""
+    if not settings.RESPONSE_CACHE_ENABLED or prompt.session_id:
+        return False
+    return not (bypass == "1" or (cache_control and "no-cache" in cache_control.lower()))
+
+
+def _coalesce(prompt: TravelPrompt) -> bool:
+    """Fresh prompts share in-flight runs; even on a cache bypass the shared answer is freshly generated."""
+    return settings.PROMPT_COALESCE_ENABLED and not prompt.session_id
+
+
+async def _plan(prompt: TravelPrompt):
+    if _coalesce(prompt):
+        return await prompt_coalescer.run(prompt.prompt)
+    async with agent_limiter.slot():
+        response_text, session_id, usage = await agent_router.run(prompt.prompt, prompt.session_id)
+    return response_text, session_id, False, usage
+
+
 @router.post("/travel-plan", response_model=TravelResponse)
-def get_travel_plan(prompt: TravelPrompt):
-    response_text = run_travel_agent(prompt.prompt)
-    return TravelResponse(response=response_text)
+async def get_travel_plan(prompt: TravelPrompt,
+                          cache_control: Optional[str] = Header(default=None),
+                          x_cache_bypass: Optional[str] = Header(default=None)):
+    use_cache = _use_cache(prompt, cache_control, x_cache_bypass)
+    if use_cache:
+        cached = response_cache.get(prompt.prompt)
+        if cached is not None:
+            return TravelResponse(response=cached, cached=True)
+
+    try:
+        # Queueing for a slot counts against the deadline too
+        with deadline(agent_budget()):
+            response_text, session_id, shared, usage = await within_deadline(_plan(prompt))
+    except DeadlineExceeded:
+        deadline_misses.inc(endpoint="plan")
+        fallback = await fallback_planner.answer(prompt.prompt, fresh=not prompt.session_id)
+        if fallback is None:
+            raise HTTPException(status_code=504, detail="No travel plan could be made in time, please retry.")
+        # The conversation continues from before this prompt: its run was abandoned
+        return TravelResponse(response=fallback, session_id=prompt.session_id, degraded=True)
+    except AgentOverloadedError as e:
+        # Also raised when the model upstream is rate limited (UpstreamRateLimited)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        if is_rate_limit_error(e):
+            # A provider 429 that bypassed the scheduler; a 200 would invite immediate retries
+            retry_after = math.ceil(retry_after_of(e) or settings.UPSTREAM_DEFAULT_RETRY_AFTER_SECONDS)
+            raise HTTPException(status_code=429, detail="The travel model is rate limited, please retry later.",
+                                headers={"Retry-After": str(retry_after)})
+        return TravelResponse(response=f"Error during agent execution: {e}", session_id=prompt.session_id)
+
+    # Store fresh answers even on bypass so the next caller benefits
+    if not prompt.session_id and not shared and settings.RESPONSE_CACHE_ENABLED:
+        response_cache.set(prompt.prompt, response_text)
+    return TravelResponse(response=response_text, session_id=session_id, coalesced=shared, usage=usage)
+
+
+@router.post("/travel-plan/batch", response_model=TravelBatchResponse)
+async def get_travel_plans(batch: TravelBatchRequest, stream: bool = False):
+    """Run many prompts concurrently. With `?stream=true`, results arrive as NDJSON lines as they finish."""
+    if len(batch.prompts) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} prompts per batch.")
+
+    if stream:
+        async def ndjson():
+            async for item in run_batch(batch.prompts, batch.destinations):
+                yield item.model_dump_json() + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = [item async for item in run_batch(batch.prompts, batch.destinations)]
+    return TravelBatchResponse(results=sorted(results, key=lambda item: item.index))
+
+
+@router.post("/travel-plan/stream")
+async def stream_travel_plan(prompt: TravelPrompt,
+                             cache_control: Optional[str] = Header(default=None),
+                             x_cache_bypass: Optional[str] = Header(default=None)):
+    """Stream the plan as Server-Sent Events: `session`, `text`, `tool_call`, `tool_result`, `final`/`error`."""
+    if _use_cache(prompt, cache_control, x_cache_bypass):
+        cached = response_cache.get(prompt.prompt)
+        if cached is not None:
+            return StreamingResponse(iter([_sse("final", {"type": "final", "text": cached, "cached": True})]),
+                                     media_type="text/event-stream")
+
+    # Reject before the response starts; once streaming, errors can only be sent as events.
+    # Joining an identical in-flight run needs no slot.
+    joinable = _coalesce(prompt) and prompt_coalescer.joinable("stream", prompt.prompt)
+    if agent_limiter.at_capacity() and not joinable:
+        raise HTTPException(status_code=429, detail="Travel agent is at capacity, please retry shortly.",
+                            headers={"Retry-After": "1"})
+    # Every model backend is backing off longer than a caller may queue: say so now, not mid-stream
+    retry_after = agent_router.retry_after()
+    if retry_after > settings.UPSTREAM_MAX_WAIT_SECONDS and not joinable:
+        raise HTTPException(status_code=429, detail="The travel model is rate limited, please retry later.",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+    return StreamingResponse(_sse_events(prompt), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _agent_events(prompt: TravelPrompt):
+    if _coalesce(prompt):
+        async for event in prompt_coalescer.stream(prompt.prompt):
+            yield event
+        return
+    async with agent_limiter.slot():
+        async for event in agent_router.stream(prompt.prompt, prompt.session_id):
+            yield event
+
+
+async def _sse_events(prompt: TravelPrompt):
+    started = time.perf_counter()
+    first = True
+    try:
+        async for event in until_deadline(_agent_events(prompt), agent_budget()):
+            if first:
+                # A run's first event is `session`, emitted right before the first agent output;
+                # callers sharing a run start at whatever it has produced so far
+                first = False
+                metrics.latency("travel_plan_stream_ttfb_seconds").observe(time.perf_counter() - started)
+            if (event["type"] == "final" and not prompt.session_id and not event.get("coalesced")
+                    and settings.RESPONSE_CACHE_ENABLED):
+                response_cache.set(prompt.prompt, event["text"])
+            yield _sse(event["type"], event)
+    except DeadlineExceeded:
+        deadline_misses.inc(endpoint="stream")
+        fallback = await fallback_planner.answer(prompt.prompt, fresh=not prompt.session_id)
+        if fallback is None:
+            yield _sse("error", {"type": "error", "message": "No travel plan could be made in time, please retry."})
+        else:
+            # Replaces whatever partial text was streamed; never cached
+            yield _sse("final", {"type": "final", "text": fallback, "degraded": True})
+    except AgentOverloadedError as e:
+        # Includes upstream rate limits; clients treat `retry_after` like the Retry-After header
+        yield _sse("error", {"type": "error", "message": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        error = {"type": "error", "message": f"Error during agent execution: {e}"}
+        if is_rate_limit_error(e):
+            error["retry_after"] = math.ceil(retry_after_of(e) or settings.UPSTREAM_DEFAULT_RETRY_AFTER_SECONDS)
+        yield _sse("error", error)
+    finally:
+        metrics.latency("travel_plan_stream_duration_seconds").observe(time.perf_counter() - started)
+
+
+def _sse(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
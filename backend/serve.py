@@ -0,0 +1,213 @@
+# backend/serve.py – Production launcher: preload once, fork uvicorn workers, drain on SIGTERM
+#
+# Usage: python -m backend.serve [--host 0.0.0.0] [--port 8000] [--workers N]
+#
+# The parent imports the app, reads settings, loads the cost index and builds the agent once, then
+# forks N workers that inherit all of it copy-on-write and accept from one shared listening socket.
+# Dead workers are replaced. On SIGTERM/SIGINT every worker stops accepting, finishes its in-flight
+# requests (streams and agent runs included) for up to SERVE_GRACEFUL_SHUTDOWN_SECONDS and exits;
+# stragglers are killed after that. The Streamlit frontend is a separate process/service.
+
+import argparse
+import asyncio
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Tuple
+
+import uvicorn
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is restarted only after a pause
+CRASH_BACKOFF_SECONDS = 1.0
+MIN_UPTIME_SECONDS = 5.0
+
+
+def worker_count(requested: int = 0) -> int:
+    """`requested` workers, or one per CPU core available to this process when 0."""
+    if requested > 0:
+        return requested
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+def share_sessions(workers: int) -> None:
+    """Follow-ups can reach any worker, so with several of them conversations must live outside the process."""
+    if workers > 1 and settings.SESSION_STORE_BACKEND == "memory":
+        settings.SESSION_STORE_BACKEND = "sqlite"
+        logger.info("Sessions are shared between workers through %s", settings.SESSION_STORE_PATH)
+
+
+def preload(app_path: str = "backend.main:app"):
+    """Import the app and warm what the workers will share; returns the ASGI app."""
+    module_name, _, attr = app_path.partition(":")
+    app = getattr(importlib.import_module(module_name), attr or "app")
+
+    from backend.services.backend_router import agent_router
+    from backend.tools import expense_calculator
+
+    if expense_calculator.cost_index is not None:
+        expense_calculator.cost_index.stats()
+    if settings.SERVE_PRELOAD_AGENT:
+        for backend in agent_router.backends:
+            try:
+                backend.provider.get()
+            except Exception as e:
+                # Each worker's lifespan warm-up tries again
+                logger.warning("Preloading agent backend '%s' failed: %s", backend.name, e)
+    return app
+
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn server whose first signal starts a graceful drain; the launcher enforces the hard stop."""
+
+    def handle_exit(self, sig, frame) -> None:
+        if not self.should_exit:
+            from backend.services.concurrency import agent_limiter
+
+            logger.info("Worker %d draining: %d agent run(s) in flight", os.getpid(),
+                        agent_limiter.stats()["in_flight"])
+        # Neither forced nor re-raised on exit: a second signal (e.g. Ctrl-C reaching the whole
+        # process group as well as the launcher's SIGTERM) must not cut the drain short
+        self.should_exit = True
+
+
+class Launcher:
+    """Pre-fork process manager for the API, in the spirit of gunicorn's master process."""
+
+    def __init__(self, app, host: str, port: int, workers: int, graceful_seconds: float):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_seconds = graceful_seconds
+        self.sock = None
+        self.stopping = False
+        # pid -> (worker slot, start time)
+        self._children: Dict[int, Tuple[int, float]] = {}
+
+    def run(self) -> int:
+        self.sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_signal)
+
+        # Keep the preloaded objects out of the collector so it never touches (and un-shares) their pages
+        gc.collect()
+        gc.freeze()
+        logger.info("Serving on %s:%d with %d worker(s)", self.host, self.port, self.workers)
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while not self.stopping:
+            for pid, status, slot, uptime in self._reap():
+                logger.warning("Worker %d exited (status %d) after %.1fs; replacing it", pid, status, uptime)
+                if uptime < MIN_UPTIME_SECONDS:
+                    time.sleep(CRASH_BACKOFF_SECONDS)
+                if not self.stopping:
+                    self._spawn(slot)
+            time.sleep(0.2)
+        return self._drain()
+
+    def _on_signal(self, sig, frame) -> None:
+        if not self.stopping:
+            logger.info("Received %s; draining %d worker(s)", signal.Signals(sig).name, len(self._children))
+        self.stopping = True
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (slot, time.monotonic())
+            return
+        code = 1
+        try:
+            code = self._serve_worker()
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+        finally:
+            from backend.services.tracing import stop_logging
+
+            stop_logging()
+            os._exit(code)
+
+    def _serve_worker(self) -> int:
+        from backend.services.upstream import upstream_scheduler
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        # Workers share each API key's quota
+        upstream_scheduler.set_share(1 / self.workers)
+        config = uvicorn.Config(self.app, lifespan="on", access_log=False, log_level=settings.LOG_LEVEL.lower(),
+                                timeout_graceful_shutdown=self.graceful_seconds)
+        server = _WorkerServer(config)
+        asyncio.run(server.serve(sockets=[self.sock]))
+        return 0 if server.started else 3
+
+    def _reap(self):
+        """(pid, exit status, slot, uptime) for each worker that has exited since the last call."""
+        exited = []
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            slot, started = self._children.pop(pid, (None, time.monotonic()))
+            if slot is not None:
+                exited.append((pid, os.waitstatus_to_exitcode(status), slot, time.monotonic() - started))
+        return exited
+
+    def _drain(self) -> int:
+        for pid in self._children:
+            os.kill(pid, signal.SIGTERM)
+        # uvicorn cancels what is left at the graceful timeout; the margin covers lifespan shutdown
+        deadline = time.monotonic() + self.graceful_seconds + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self._children:
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+        while self._children:
+            self._reap()
+            time.sleep(0.05)
+        self.sock.close()
+        logger.info("All workers stopped")
+        return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the Travel Planner API with preloaded, forked workers")
+    parser.add_argument("--app", default="backend.main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS, help="0 = one per CPU core")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVE_GRACEFUL_SHUTDOWN_SECONDS)
+    args = parser.parse_args(argv)
+
+    workers = worker_count(args.workers)
+    share_sessions(workers)
+    app = preload(args.app)
+    if not hasattr(os, "fork"):
+        logger.warning("No fork() on this platform; serving from a single process")
+        uvicorn.run(app, host=args.host, port=args.port, timeout_graceful_shutdown=args.graceful_timeout)
+        return 0
+    return Launcher(app, args.host, args.port, workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
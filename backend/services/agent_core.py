@@ -0,0 +1,208 @@
+# backend/services/agent_core.py – Shared agent run loop used by every backend adapter
+
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, Tuple
+from backend.services.agent_provider import AgentProvider
+from backend.services.deadline import DeadlineExceeded
+from backend.services.session_manager import USER_ID
+from backend.services.upstream import is_rate_limit_error, upstream_scheduler
+from backend.services import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+run_tokens = metrics.histogram("agent_run_tokens", "Tokens per agent run, by kind (estimated when the "
+                               "model reports no usage)", TOKEN_BUCKETS)
+
+
+class AgentRunError(Exception):
+    """The agent run failed or produced no answer."""
+
+
+def new_message(prompt: str):
+    from google.genai import types
+    return types.Content(role="user", parts=[types.Part(text=prompt)])
+
+
+def _event_text(event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if getattr(part, "text", None))
+
+
+class BackendStats:
+    """Rolling health of one backend: latency percentiles plus EWMA latency and error rate."""
+
+    def __init__(self, name: str, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency = metrics.latency("agent_run_seconds", "Successful agent runs").labels(backend=name)
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.runs = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.cooldown_until = 0.0
+
+    def record(self, seconds: float, ok: bool, rate_limited: bool = False, cooldown: float = 0.0) -> None:
+        self.runs += 1
+        if ok:
+            self.latency.observe(seconds)
+            self.ewma_latency = seconds if self.ewma_latency is None else (
+                self.alpha * seconds + (1 - self.alpha) * self.ewma_latency)
+        else:
+            self.errors += 1
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+        if rate_limited:
+            self.rate_limited += 1
+            self.cooldown_until = time.monotonic() + cooldown
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "in_flight": self.in_flight,
+            "ewma_latency": self.ewma_latency,
+            "p95_latency": self.latency.percentile(0.95),
+            "error_rate": round(self.error_rate, 3),
+            "cooling_down": self.cooling_down,
+        }
+
+
+class AgentBackend:
+    """One way of running the travel agent (API key, ADC/Vertex, ...) behind a common interface.
+
+    Adapters only supply `build`, which returns a bundle with `agent`, `runner` and
+    `session_manager`; the run loop, streaming and health tracking live here.
+    """
+
+    def __init__(self, name: str, build: Callable[[], object], upstream: Optional[Tuple[str, Optional[str]]] = None):
+        self.name = name
+        self.provider = AgentProvider(name, build)
+        self.stats = BackendStats(name)
+        # (provider, key) whose upstream limiter paces this backend's model calls
+        self.upstream = upstream
+
+    def retry_after(self) -> float:
+        """Seconds the model provider asked this backend to back off for (0 when it may be called)."""
+        return upstream_scheduler.limiter(*self.upstream).paused_for() if self.upstream else 0.0
+
+    def owns_session(self, session_id: Optional[str]) -> bool:
+        return bool(session_id) and self.provider.ready and self.provider.get().session_manager.has(session_id)
+
+    def discard_session(self, session_id: str) -> None:
+        if self.provider.ready:
+            self.provider.get().session_manager.discard(session_id)
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str] = None):
+        bundle = await self.provider.get_async()
+        async with bundle.session_manager.session(session_id) as session_id:
+            yield session_id
+
+    # --- Execution ---
+    def run_sync(self, prompt: str, session_id: Optional[str] = None) -> str:
+        """Blocking run for scripts; opens and releases its own session."""
+        bundle = self.provider.get()
+        session_id = bundle.session_manager.open(session_id)
+        final_response = None
+        full_response_text = ""
+        try:
+            for event in bundle.runner.run(user_id=USER_ID, session_id=session_id, new_message=new_message(prompt)):
+                if event.is_final_response():
+                    final_response = _event_text(event)
+                else:
+                    full_response_text += _event_text(event)
+        finally:
+            bundle.session_manager.release(session_id)
+        if final_response or full_response_text:
+            return final_response or full_response_text
+        raise AgentRunError("No response received from Travel Agent.")
+
+    async def run(self, prompt: str, session_id: str) -> Tuple[str, Optional[dict]]:
+        """Run one prompt on an open session; returns (final text, token usage). Raises on failure."""
+        final_response = None
+        full_response_text = ""
+        usage = None
+        async for event in self.stream(prompt, session_id, streaming=False):
+            if event["type"] == "final":
+                final_response = event["text"]
+                usage = event.get("usage")
+            elif event["type"] == "text":
+                full_response_text += event["text"]
+        if final_response or full_response_text:
+            return final_response or full_response_text, usage
+        raise AgentRunError("No response received from Travel Agent.")
+
+    async def stream(self, prompt: str, session_id: str, streaming: bool = True) -> AsyncIterator[dict]:
+        """Yield agent progress as plain dicts: partial text, tool calls/results, then the final answer.
+
+        The final event carries the run's token `usage` when the backend's hooks track it.
+
+        Raises on failure (after recording it); callers decide whether to fail over or report.
+        """
+        from google.adk.agents.run_config import RunConfig, StreamingMode
+
+        bundle = await self.provider.get_async()
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+        streamed_text = ""
+        final_sent = False
+        invocation_id = None
+        started = time.perf_counter()
+        self.stats.in_flight += 1
+        try:
+            # Drain the stream rather than breaking out, so the runner's generator closes in this context
+            async for event in bundle.runner.run_async(user_id=USER_ID, session_id=session_id,
+                                                       new_message=new_message(prompt), run_config=run_config):
+                invocation_id = invocation_id or event.invocation_id
+                for call in event.get_function_calls():
+                    yield {"type": "tool_call", "name": call.name, "args": dict(call.args or {})}
+                for result in event.get_function_responses():
+                    yield {"type": "tool_result", "name": result.name}
+
+                text = _event_text(event)
+                if event.partial:
+                    if text:
+                        streamed_text += text
+                        yield {"type": "text", "text": text}
+                elif event.is_final_response() and not final_sent:
+                    final_sent = True
+                    yield {"type": "final", "text": text or streamed_text,
+                           "usage": self._usage(bundle, invocation_id)}
+                elif text and not streaming:
+                    # Intermediate model text (e.g. before a tool call) when not streaming partials
+                    streamed_text += text
+                    yield {"type": "text", "text": text}
+
+            if not final_sent:
+                if not streamed_text:
+                    raise AgentRunError("No response received from Travel Agent.")
+                yield {"type": "final", "text": streamed_text, "usage": self._usage(bundle, invocation_id)}
+            self.stats.record(time.perf_counter() - started, ok=True)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                logger.warning("Backend '%s' is rate limited: %s", self.name, e)
+            elif not isinstance(e, (AgentRunError, DeadlineExceeded)):
+                logger.exception("Agent execution failed on backend '%s'", self.name)
+            # Steer new runs to other backends for as long as the provider asked us to back off
+            self.stats.record(time.perf_counter() - started, ok=False, rate_limited=is_rate_limit_error(e),
+                              cooldown=getattr(e, "retry_after", None) or settings.AGENT_BACKEND_COOLDOWN_SECONDS)
+            raise
+        finally:
+            self.stats.in_flight -= 1
+
+    def _usage(self, bundle, invocation_id: Optional[str]) -> Optional[dict]:
+        hooks = getattr(bundle, "hooks", None)
+        usage = hooks.take_usage(invocation_id) if hooks is not None and invocation_id else None
+        if usage:
+            for kind in ("prompt", "output", "cached"):
+                run_tokens.observe(usage[f"{kind}_tokens"], backend=self.name, kind=kind)
+        return usage
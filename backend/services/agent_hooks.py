@@ -0,0 +1,134 @@
+# backend/services/agent_hooks.py – ADK agent callbacks for LLM-turn and tool-call instrumentation
+
+from collections import OrderedDict
+from typing import Dict, Optional
+from backend.services import metrics
+from backend.services.context_budget import ContextBudget, content_chars, request_chars
+from backend.services.session_manager import CHARS_PER_TOKEN
+from backend.services.tracing import Span, start_span
+from backend.tools.parallel import ParallelToolExecutor
+from config import settings
+
+# Usage of runs whose caller never collected it (e.g. a dropped stream) is forgotten after this many
+MAX_TRACKED_RUNS = 4096
+
+
+class AgentHooks:
+    """Callbacks passed to the ADK `Agent` so every LLM turn and tool call is timed and counted.
+
+    ADK calls the model callbacks synchronously and awaits the tool callbacks; a turn or call
+    starts in the `before_*` hook and ends in the matching `after_*` hook. When `tools` are given
+    (and TOOL_PARALLEL is on) the function calls of each model response run concurrently. With a
+    `budget`, every request and tool result is fitted to it. Token usage is summed per run
+    (invocation id) for `take_usage`.
+    """
+
+    def __init__(self, backend: str, tools: Optional[list] = None, budget: Optional[ContextBudget] = None):
+        self.backend = backend
+        self.budget = budget
+        self.executor = None
+        if tools and settings.TOOL_PARALLEL:
+            self.executor = ParallelToolExecutor({tool.name: tool.func for tool in tools},
+                                                 timeout=settings.TOOL_TURN_TIMEOUT_SECONDS)
+        self._turns: Dict[str, Span] = {}
+        self._tools: Dict[str, Span] = {}
+        self._usage: "OrderedDict[str, dict]" = OrderedDict()
+        self.turn_latency = metrics.latency("llm_turn_seconds", "Model call latency per LLM turn")
+        self.tool_latency = metrics.latency("tool_call_seconds", "Tool execution latency")
+        self.tokens = metrics.counter("llm_tokens_total", "Model tokens by kind (usage metadata, else estimated)")
+        self.turns = metrics.counter("llm_turns_total", "Model calls made by the agent")
+        self.tool_calls = metrics.counter("tool_calls_total", "Tool calls made by the agent, by status")
+
+    def callbacks(self) -> dict:
+        return {
+            "before_model_callback": self.before_model,
+            "after_model_callback": self.after_model,
+            "before_tool_callback": self.before_tool,
+            "after_tool_callback": self.after_tool,
+        }
+
+    # --- Model turns ---
+    def before_model(self, callback_context, llm_request):
+        turn = start_span("llm_turn", backend=self.backend, model=llm_request.model)
+        if self.budget is not None:
+            fitted = self.budget.fit_request(llm_request)
+            turn.set(prompt_tokens=fitted["prompt_tokens"], cached_tokens=fitted["cached_tokens"],
+                     trimmed_contents=fitted["trimmed"])
+        else:
+            turn.set(prompt_tokens=request_chars(llm_request) // CHARS_PER_TOKEN, cached_tokens=0)
+        self._turns[callback_context.invocation_id] = turn
+        return None
+
+    def after_model(self, callback_context, llm_response):
+        # Streaming calls this once per chunk; the turn ends with the first non-partial response
+        if llm_response.partial:
+            return None
+        if self.executor and llm_response.content and llm_response.content.parts:
+            calls = [part.function_call for part in llm_response.content.parts if part.function_call]
+            if calls:
+                self.executor.start(callback_context.invocation_id, calls)
+        turn = self._turns.pop(callback_context.invocation_id, None)
+        self.turns.inc(backend=self.backend, status="error" if llm_response.error_code else "ok")
+        # Not every ADK/genai version surfaces usage metadata; fall back to a character estimate
+        usage = getattr(llm_response, "usage_metadata", None)
+        estimated = usage is None
+        if usage is not None:
+            prompt_tokens = usage.prompt_token_count or 0
+            output_tokens = usage.candidates_token_count or 0
+            cached_tokens = usage.cached_content_token_count or 0
+        else:
+            prompt_tokens = turn.attrs.get("prompt_tokens", 0) if turn else 0
+            output_tokens = content_chars(llm_response.content) // CHARS_PER_TOKEN
+            cached_tokens = turn.attrs.get("cached_tokens", 0) if turn else 0
+        for kind, count in (("prompt", prompt_tokens), ("output", output_tokens), ("cached", cached_tokens)):
+            if count:
+                self.tokens.inc(count, backend=self.backend, kind=kind)
+        run = self._run_usage(callback_context.invocation_id)
+        run["turns"] += 1
+        run["prompt_tokens"] += prompt_tokens
+        run["output_tokens"] += output_tokens
+        run["cached_tokens"] += cached_tokens
+        run["trimmed_contents"] += turn.attrs.get("trimmed_contents", 0) if turn else 0
+        run["estimated"] = run["estimated"] or estimated
+        if turn is not None:
+            turn.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+            self.turn_latency.observe(turn.end(), backend=self.backend)
+        return None
+
+    # --- Tool calls ---
+    async def before_tool(self, tool, args, tool_context):
+        self._tools[tool_context.function_call_id] = start_span("tool_call", backend=self.backend, tool=tool.name)
+        if self.executor:
+            # Already running since the model response arrived; a non-None result skips ADK's own call
+            return await self.executor.result(tool_context.invocation_id, tool.name, args)
+        return None
+
+    async def after_tool(self, tool, args, tool_context, tool_response):
+        call = self._tools.pop(tool_context.function_call_id, None)
+        status = tool_response.get("status", "ok") if isinstance(tool_response, dict) else "ok"
+        self.tool_calls.inc(tool=tool.name, status=status)
+        if call is not None:
+            call.set(status=status)
+            self.tool_latency.observe(call.end(), tool=tool.name)
+        if self.budget is not None:
+            fitted = self.budget.fit_tool_result(tool.name, tool_response)
+            if fitted is not tool_response:
+                # Returning a value replaces the result ADK stores in the session and sends to the model
+                self._run_usage(tool_context.invocation_id)["truncated_tool_results"] += 1
+                return fitted
+        return None
+
+    # --- Per-run usage ---
+    def take_usage(self, invocation_id: str) -> Optional[dict]:
+        """The summed token usage of one finished run, removed from tracking."""
+        return self._usage.pop(invocation_id, None)
+
+    def _run_usage(self, invocation_id: str) -> dict:
+        run = self._usage.get(invocation_id)
+        if run is None:
+            run = self._usage[invocation_id] = {"turns": 0, "prompt_tokens": 0, "output_tokens": 0,
+                                                "cached_tokens": 0, "trimmed_contents": 0,
+                                                "truncated_tool_results": 0, "estimated": False}
+            while len(self._usage) > MAX_TRACKED_RUNS:
+                self._usage.popitem(last=False)
+        return run
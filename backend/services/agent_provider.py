@@ -0,0 +1,81 @@
+# backend/services/agent_provider.py – Lazy, lifespan-managed agent construction
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from backend.services.session_manager import USER_ID
+
+logger = logging.getLogger(__name__)
+
+
+class AgentProvider:
+    """Builds an agent bundle (agent, runner, session manager) on first use instead of at import.
+
+    `build` does the slow work (ADK imports, auth, client setup) and returns any object with
+    `runner` and `session_manager` attributes. The FastAPI lifespan can call `warm_up()` so the
+    cost is paid before the worker reports ready; otherwise the first request pays it.
+    """
+
+    def __init__(self, name: str, build: Callable[[], object]):
+        self.name = name
+        self._build = build
+        self._bundle = None
+        self._lock = threading.Lock()
+        self.build_seconds: Optional[float] = None
+        self.primed = False
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._bundle is not None
+
+    def get(self):
+        if self._bundle is None:
+            with self._lock:
+                if self._bundle is None:
+                    started = time.perf_counter()
+                    try:
+                        self._bundle = self._build()
+                        self.error = None
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.build_seconds = time.perf_counter() - started
+                    logger.info("Agent provider '%s' ready in %.2fs", self.name, self.build_seconds)
+        return self._bundle
+
+    async def get_async(self):
+        """Like get(), but builds in a worker thread so the event loop keeps serving."""
+        if self._bundle is not None:
+            return self._bundle
+        return await asyncio.to_thread(self.get)
+
+    async def warm_up(self, prime: bool = False, prompt: str = "Reply with OK.") -> None:
+        """Build the bundle and optionally run one throwaway prompt to prime auth and connections."""
+        bundle = await self.get_async()
+        if not prime or self.primed:
+            return
+        from google.genai import types
+
+        session_manager = bundle.session_manager
+        async with session_manager.session() as session_id:
+            try:
+                content = types.Content(role="user", parts=[types.Part(text=prompt)])
+                async for _ in bundle.runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content):
+                    pass
+                self.primed = True
+            except Exception:
+                logger.warning("Agent provider '%s' priming failed", self.name, exc_info=True)
+            finally:
+                session_manager.discard(session_id)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "ready": self.ready,
+            "primed": self.primed,
+            "build_seconds": self.build_seconds,
+            "error": self.error,
+        }
@@ -1,93 +1,92 @@
 # backend/services/ai_apikey_service.py – Gemini Travel Planner Agent Logic (API Key version)
 
-import datetime
+import logging
 import os
-import traceback
+from typing import Optional
 from types import SimpleNamespace
-from google.adk.agents import Agent
-from google.adk.sessions import InMemorySessionService
-from google.adk.runners import Runner
-from google.adk.tools import google_search
 from config import settings
+from backend.services.agent_core import AgentBackend
+from backend.services.agent_hooks import AgentHooks
+from backend.services.context_budget import ContextBudget, InstructionCache
+from backend.services.session_manager import SessionManager
+from backend.services.session_store import shared_writer
+from backend.services.upstream import scheduled_gemini
 from backend.tools.expense_calculator import get_estimated_expense
 from backend.tools.current_time import get_current_time
-from google.adk.tools import FunctionTool
+from backend.tools.parallel import offload
+from backend.tools.trip_cost import get_trip_cost
 
-expense_tool = FunctionTool(func=get_estimated_expense)
-current_time_tool = FunctionTool(func=get_current_time)
+INSTRUCTION = ("You are an expert travel planner. For any user query, suggest the best time to visit, what to pack, "
+               "and estimate expenses. Use tools as needed. When a trip covers several destinations, request all "
+               "of their expenses in the same step; those calls run in parallel. For itineraries with several legs, "
+               "day counts, travelers or budget tiers, use get_trip_cost for totals and what-if comparisons "
+               "instead of doing the arithmetic yourself.")
 
+# Model quota this backend draws on: (provider, key) in the upstream scheduler
+UPSTREAM = ("gemini", settings.GOOGLE_API_KEY)
 
-# --- Configuration ---
-print("[INFO] Initializing Gemini with API Key")
-os.environ["GOOGLE_API_KEY"] = settings.GOOGLE_API_KEY
+logger = logging.getLogger(__name__)
 
-try:
-    from google.generativeai import configure
-    configure(api_key=settings.GOOGLE_API_KEY)
-except Exception as e:
-    print("[ERROR] Failed to configure Gemini with API Key:", e)
-    raise
 
-# --- Setup ADK Agent using model name string ---
-print("[INFO] Initializing Agent with model name string (API Key mode)")
-agent = Agent(
-    name="TravelPlanner",
-    model=settings.DEFAULT_MODEL,  # e.g., "gemini-1.5-flash"
-    instruction="You are an expert travel planner. For any user query, suggest the best time to visit, what to pack, and estimate expenses. Use tools as needed.",
-    tools=[expense_tool,current_time_tool],
-    description="Helps users plan trips with smart suggestions."
-)
+# --- Agent Setup (runs on first use or during app startup, not at import) ---
+def _build() -> SimpleNamespace:
+    # ADK pulls in the Vertex/Cloud client stack; keep that off the import path
+    from google.adk.agents import Agent
+    from google.adk.sessions import InMemorySessionService
+    from google.adk.runners import Runner
+    from google.adk.tools import FunctionTool
 
-
-# --- Session and Runner Setup ---
-session_service = InMemorySessionService()
-session_id = "travel_session"
-try:
-    session_service.create_session(app_name="TravelPlanner", user_id="demo_user", session_id=session_id)
-except Exception as e:
-    if "already exists" in str(e):
-        print(f"[WARN] Session '{session_id}' already exists. Continuing...")
-    else:
+    logger.info("Initializing Gemini with API key")
+    os.environ["GOOGLE_API_KEY"] = settings.GOOGLE_API_KEY or ""
+    try:
+        from google.generativeai import configure
+        configure(api_key=settings.GOOGLE_API_KEY)
+    except Exception as e:
+        logger.error("Failed to configure Gemini with API key: %s", e)
         raise
 
-runner = Runner(agent=agent, app_name="TravelPlanner", session_service=session_service)
+    logger.info("Initializing agent with model %s (API key mode)", settings.DEFAULT_MODEL)
+    # The expense lookup blocks on HTTP, so it runs on a worker thread rather than the event loop
+    tools = [FunctionTool(func=offload(get_estimated_expense)), FunctionTool(func=get_trip_cost),
+             FunctionTool(func=get_current_time)]
+    # One model object for the agent's lifetime (a model name alone builds a new client every turn);
+    # its calls share the API key's quota with the expense tool's LLM fallback
+    model = scheduled_gemini(settings.DEFAULT_MODEL, *UPSTREAM)  # e.g., "gemini-1.5-flash"
+    cache = InstructionCache(lambda: model.api_client) if settings.CONTEXT_CACHE_ENABLED else None
+    hooks = AgentHooks("api_key", tools=tools, budget=ContextBudget(instruction_cache=cache))
+    agent = Agent(
+        name="TravelPlanner",
+        model=model,
+        instruction=INSTRUCTION,
+        tools=tools,
+        description="Helps users plan trips with smart suggestions.",
+        **hooks.callbacks(),
+    )
+
+    session_service = InMemorySessionService()
+    return SimpleNamespace(
+        agent=agent,
+        hooks=hooks,
+        # One ADK session per caller; see SessionManager for TTL/LRU eviction, history caps and the shared store
+        session_manager=SessionManager(session_service, app_name="TravelPlanner", writer=shared_writer()),
+        runner=Runner(agent=agent, app_name="TravelPlanner", session_service=session_service),
+    )
+
+
+# Run loop, streaming and health tracking are shared in agent_core; this module only builds the agent
+backend = AgentBackend("api_key", _build, upstream=UPSTREAM)
+provider = backend.provider
 
-# --- Agent Execution Function ---
-def run_travel_agent(prompt: str) -> str:
-    print(f"\n--- [API KEY MODE] Running travel agent for prompt: '{prompt}' ---")
-    content = SimpleNamespace(role="user", parts=[SimpleNamespace(text=prompt)])
-    final_response = None
-    full_response_text = ""
 
+# --- Agent Execution Function ---
+def run_travel_agent(prompt: str, session_id: Optional[str] = None) -> str:
+    """Blocking convenience wrapper for scripts; the API goes through backend_router."""
     try:
-        events = runner.run(user_id="demo_user", session_id=session_id, new_message=content)
-        for event in events:
-            if event.is_final_response():
-                print("[DEBUG] Event type: final_response")
-            else:
-                print("[DEBUG] Event type: intermediate_response")
-
-            if hasattr(event, "is_final_response") and event.is_final_response():
-                final_response = "".join(part.text for part in event.content.parts if hasattr(part, "text"))
-                break
-            elif hasattr(event, "is_intermediate_response") and event.is_intermediate_response():
-                intermediate_text = "".join(part.text for part in event.content.parts if hasattr(part, "text"))
-                full_response_text += intermediate_text
-
-        if final_response:
-            return final_response
-        elif full_response_text:
-            return full_response_text
-        else:
-            return "Error: No response received from Travel Agent."
-
+        return backend.run_sync(prompt, session_id)
     except Exception as e:
-        print(f"[ERROR] Agent execution failed: {e}")
-        traceback.print_exc()
         return f"Error during agent execution: {e}"
 
 
-
 # --- Example Usage ---
 # if __name__ == "__main__":
 #     test_prompt = "Best time to visit Bali?"
@@ -0,0 +1,225 @@
+# backend/services/backend_router.py – Choose, balance and fail over between agent backends
+
+import asyncio
+import importlib
+import random
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from backend.services.agent_core import AgentBackend, AgentRunError
+from backend.services.deadline import DeadlineExceeded
+from backend.services.upstream import INTERACTIVE, current_priority
+from config import settings
+
+# Backend name -> module exposing a module-level `backend` (an AgentBackend)
+BACKEND_MODULES = {
+    "api_key": "backend.services.ai_service",
+    "adc": "backend.services.ai_adc_service",
+}
+
+
+class NoBackendAvailableError(AgentRunError):
+    """Every configured backend is cooling down or failed for this request."""
+
+
+class BackendRouter:
+    """Routes agent runs across one or more backends in the same process.
+
+    `weighted` mode picks a backend at random, with each configured weight scaled by how fast
+    (EWMA latency) and how healthy (EWMA error rate) the backend currently is, so load drifts
+    toward whichever backend is faster. `failover` mode always prefers the first healthy
+    backend in configured order. In both modes a fresh conversation that fails before any
+    output is retried on the next candidate; follow-ups stay pinned to the backend holding
+    their session history.
+
+    A fresh interactive run still going after its backend's recent p95 latency is hedged: the
+    same prompt is started on the next candidate, if there is a healthy one, and whichever
+    answers first wins. Hedges draw on a budget that refills by
+    AGENT_HEDGE_MAX_RATIO per run, so a backend that is slow for everyone is not sent double load.
+    """
+
+    def __init__(self, backends: List[AgentBackend], weights: Dict[str, float], mode: str = "weighted"):
+        if mode not in ("weighted", "failover"):
+            raise ValueError(f"Unknown routing mode: {mode}")
+        self.backends = backends
+        self.weights = weights
+        self.mode = mode
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._hedge_budget = 0.0
+
+    def _score(self, backend: AgentBackend) -> float:
+        stats = backend.stats
+        weight = self.weights.get(backend.name, 1.0)
+        # Untried backends get the best observed latency so they are sampled early
+        observed = [b.stats.ewma_latency for b in self.backends if b.stats.ewma_latency]
+        latency = stats.ewma_latency or (min(observed) if observed else 1.0)
+        return weight * (1.0 - min(stats.error_rate, 0.95)) / max(latency, 0.01)
+
+    def candidates(self, session_id: Optional[str] = None) -> List[AgentBackend]:
+        """Backends to try for one request, best first."""
+        for backend in self.backends:
+            if backend.owns_session(session_id):
+                return [backend]
+
+        healthy = [b for b in self.backends if not b.stats.cooling_down]
+        # If everything is cooling down, still try rather than refusing outright
+        pool = healthy or list(self.backends)
+        if self.mode == "failover" or len(pool) == 1:
+            return pool
+
+        ordered = []
+        remaining = list(pool)
+        while remaining:
+            scores = [self._score(b) for b in remaining]
+            pick = random.choices(remaining, weights=scores)[0]
+            ordered.append(pick)
+            remaining.remove(pick)
+        return ordered
+
+    async def run(self, prompt: str, session_id: Optional[str] = None) -> Tuple[str, str, Optional[dict]]:
+        """Run a prompt on the best backend; returns (response text, session id, token usage)."""
+        candidates = self.candidates(session_id)
+        if session_id:
+            return await self._attempt(candidates[0], prompt, session_id)
+
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(candidates):
+            if attempt:
+                self.failovers += 1
+            try:
+                # Only another healthy backend can be faster; re-running on a slow one just adds load
+                hedge = candidates[1] if not attempt and len(candidates) > 1 else None
+                delay = self._hedge_delay(backend) if hedge is not None and not hedge.stats.cooling_down else None
+                if delay is not None:
+                    return await self._hedged(prompt, backend, hedge, delay)
+                return await self._attempt(backend, prompt)
+            except DeadlineExceeded:
+                # No time left for another backend; the caller falls back instead
+                raise
+            except Exception as e:
+                last_error = e
+        raise last_error or NoBackendAvailableError("No agent backend is available.")
+
+    async def _attempt(self, backend: AgentBackend, prompt: str,
+                       session_id: Optional[str] = None) -> Tuple[str, str, Optional[dict]]:
+        async with backend.session(session_id) as opened_id:
+            try:
+                text, usage = await backend.run(prompt, opened_id)
+                return text, opened_id, usage
+            except BaseException:
+                # A failed or cancelled fresh run leaves nothing worth continuing
+                if not session_id:
+                    backend.discard_session(opened_id)
+                raise
+
+    def _hedge_delay(self, backend: AgentBackend) -> Optional[float]:
+        """Seconds after which a fresh run on `backend` gets a hedge, or None for no hedge."""
+        if not settings.AGENT_HEDGE_ENABLED:
+            return None
+        if current_priority() == INTERACTIVE:
+            ratio = settings.AGENT_HEDGE_MAX_RATIO
+            self._hedge_budget = min(self._hedge_budget + ratio, max(1.0, 10 * ratio))
+        latency = backend.stats.latency
+        if latency.count < settings.AGENT_HEDGE_MIN_SAMPLES:
+            return None
+        return latency.percentile(settings.AGENT_HEDGE_PERCENTILE)
+
+    async def _hedged(self, prompt: str, primary: AgentBackend, hedge: AgentBackend,
+                      delay: float) -> Tuple[str, str, Optional[dict]]:
+        first = asyncio.create_task(self._attempt(primary, prompt))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            # Priority is checked only now: an interactive caller may have joined a batch run since it started
+            if not done and current_priority() == INTERACTIVE and self._hedge_budget >= 1.0:
+                self._hedge_budget -= 1.0
+                self.hedges += 1
+                pending.add(asyncio.create_task(self._attempt(hedge, prompt)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The slower run is abandoned; cancelling it also releases and discards its session
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, prompt: str, session_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """Stream a run; yields a `session` event first. Fails over only before any agent output."""
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(self.candidates(session_id)):
+            if attempt:
+                self.failovers += 1
+            produced = False
+            async with backend.session(session_id) as opened_id:
+                try:
+                    async for event in backend.stream(prompt, opened_id):
+                        if not produced:
+                            produced = True
+                            yield {"type": "session", "session_id": opened_id, "backend": backend.name}
+                        yield event
+                    return
+                except BaseException as e:
+                    # As in _attempt: a failed or cancelled fresh run leaves nothing worth continuing
+                    if not session_id:
+                        backend.discard_session(opened_id)
+                    if produced or not isinstance(e, Exception):
+                        raise
+                    last_error = e
+            if session_id:
+                break
+        raise last_error or NoBackendAvailableError("No agent backend is available.")
+
+    def retry_after(self) -> float:
+        """Seconds until some backend's model quota may be used again (0 when one can be called now)."""
+        return min((backend.retry_after() for backend in self.backends), default=0.0)
+
+    async def warm_up(self, prime: bool = False) -> None:
+        errors = []
+        for backend in self.backends:
+            try:
+                await backend.provider.warm_up(prime=prime)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        # One working backend is enough to serve; only fail if none came up
+        if errors and not self.ready:
+            raise RuntimeError("; ".join(errors))
+
+    @property
+    def ready(self) -> bool:
+        return any(backend.provider.ready for backend in self.backends)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "backends": [backend.provider.status() for backend in self.backends],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "backends": {backend.name: backend.stats.snapshot() for backend in self.backends},
+        }
+
+
+def load_backend(name: str) -> AgentBackend:
+    if name not in BACKEND_MODULES:
+        raise ValueError(f"Unknown agent backend: {name}")
+    return importlib.import_module(BACKEND_MODULES[name]).backend
+
+
+agent_router = BackendRouter(
+    backends=[load_backend(name) for name in settings.AGENT_BACKENDS],
+    weights=settings.AGENT_BACKEND_WEIGHTS,
+    mode=settings.AGENT_ROUTING,
+)
@@ -0,0 +1,124 @@
+# backend/services/batch.py – Concurrent, de-duplicated execution of many travel prompts
+
+import asyncio
+import re
+from typing import AsyncIterator, Iterable, List
+from backend.models import TravelPrompt, TravelBatchItem
+from backend.services import metrics
+from backend.services.backend_router import agent_router
+from backend.services.coalescing import prompt_coalescer
+from backend.services.concurrency import agent_limiter
+from backend.services.deadline import DeadlineExceeded, deadline, within_deadline
+from backend.services.fallback import agent_budget, fallback_planner
+from backend.services.response_cache import normalize_prompt, response_cache
+from backend.services.upstream import BATCH, priority
+from backend.tools import expense_calculator
+from backend.tools.expense_calculator import get_estimated_expense, destination_key
+from config import settings
+
+deadline_misses = metrics.counter("agent_deadline_exceeded_total", "Requests whose agent run missed the deadline")
+
+
+def named_destinations(prompts: Iterable[str]) -> List[str]:
+    """Destinations named in the prompts that the cost index (names or aliases) or its seed list knows."""
+    index = expense_calculator.cost_index
+    seeds = [name for name in settings.COST_INDEX_SEED_DESTINATIONS if name.strip()]
+    seed_pattern = re.compile(r"\b(?:" + "|".join(
+        re.escape(name) for name in sorted(seeds, key=len, reverse=True)) + r")\b", re.IGNORECASE) if seeds else None
+    found = []
+    for prompt in prompts:
+        if index is not None:
+            found += [entry["name"] for entry in index.find_in_text(prompt)]
+        if seed_pattern is not None:
+            found += seed_pattern.findall(prompt)
+    return found
+
+
+async def prefetch_expenses(destinations: List[str]) -> None:
+    """Warm the expense cache once per distinct destination so the batch's tool calls hit it."""
+    distinct = {}
+    for destination in destinations:
+        distinct.setdefault(destination_key(destination), destination)
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def fetch(destination: str):
+        async with semaphore:
+            with priority(BATCH):
+                await asyncio.to_thread(get_estimated_expense, destination)
+
+    await asyncio.gather(*(fetch(d) for d in distinct.values()), return_exceptions=True)
+
+
+async def run_batch(prompts: List[TravelPrompt], destinations: List[str] = ()) -> AsyncIterator[TravelBatchItem]:
+    """Yield one TravelBatchItem per input prompt, in completion order.
+
+    Identical fresh prompts (same normalized text, no session) run once and share the answer.
+    Expense estimates for `destinations` and for known destinations the prompts name are fetched
+    once for the whole batch before any run starts, so the runs' tool calls hit the cache. At most
+    BATCH_MAX_CONCURRENCY agent runs are in flight for the batch; each has the request deadline of
+    /travel-plan from when it starts, with the same fallback, and a failing item reports its own
+    error instead of failing the batch.
+    """
+    # Group input indexes by the work they need; prompts with a session always run on their own
+    groups = {}
+    for index, prompt in enumerate(prompts):
+        key = ("fresh", normalize_prompt(prompt.prompt)) if not prompt.session_id else ("session", index)
+        groups.setdefault(key, []).append(index)
+
+    wanted = list(destinations) + named_destinations(prompts[indexes[0]].prompt for indexes in groups.values())
+    if wanted:
+        try:
+            # Warming is only an optimization: past the deadline the runs start and look up what is missing
+            with deadline(agent_budget()):
+                await within_deadline(prefetch_expenses(wanted))
+        except DeadlineExceeded:
+            pass
+
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def run_group(indexes: List[int]) -> List[TravelBatchItem]:
+        prompt = prompts[indexes[0]]
+        # Each group runs as its own task, so the batch priority covers only its own model and tool calls
+        with priority(BATCH):
+            async with semaphore:
+                try:
+                    cached = (response_cache.get(prompt.prompt)
+                              if not prompt.session_id and settings.RESPONSE_CACHE_ENABLED else None)
+                    if cached is not None:
+                        return [TravelBatchItem(index=i, response=cached, cached=True) for i in indexes]
+                    try:
+                        # Like /travel-plan: one slow prompt gets a fallback answer instead of holding up the batch
+                        with deadline(agent_budget()):
+                            text, session_id, shared, usage = await within_deadline(_plan(prompt))
+                    except DeadlineExceeded:
+                        deadline_misses.inc(endpoint="batch")
+                        fallback = await fallback_planner.answer(prompt.prompt, fresh=not prompt.session_id)
+                        if fallback is None:
+                            raise
+                        return [TravelBatchItem(index=i, response=fallback, degraded=True,
+                                                session_id=prompt.session_id if i == indexes[0] else None)
+                                for i in indexes]
+                    if not prompt.session_id and not shared and settings.RESPONSE_CACHE_ENABLED:
+                        response_cache.set(prompt.prompt, text)
+                    # Duplicates share the answer; only the first owns the session for follow-ups
+                    return [TravelBatchItem(index=i, response=text, session_id=session_id if i == indexes[0] else None,
+                                            usage=usage if i == indexes[0] else None)
+                            for i in indexes]
+                except DeadlineExceeded:
+                    return [TravelBatchItem(index=i, error="No travel plan could be made in time, please retry.")
+                            for i in indexes]
+                except Exception as e:
+                    return [TravelBatchItem(index=i, error=str(e) or type(e).__name__) for i in indexes]
+
+    for finished in asyncio.as_completed([run_group(indexes) for indexes in groups.values()]):
+        for item in await finished:
+            yield item
+
+
+async def _plan(prompt: TravelPrompt):
+    if not prompt.session_id and settings.PROMPT_COALESCE_ENABLED:
+        # Also shares runs with identical prompts from other requests and batches
+        return await prompt_coalescer.run(prompt.prompt, endpoint="batch")
+    async with agent_limiter.slot():
+        text, session_id, usage = await agent_router.run(prompt.prompt, prompt.session_id)
+    return text, session_id, False, usage
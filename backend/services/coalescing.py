@@ -0,0 +1,195 @@
+# backend/services/coalescing.py – Single-flight execution of identical fresh travel prompts
+
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional, Tuple
+from backend.services import deadline, metrics
+from backend.services.backend_router import agent_router
+from backend.services.concurrency import agent_limiter
+from backend.services.response_cache import normalize_prompt
+from backend.services.upstream import current_priority, raise_priority
+from config import settings
+
+coalesced_runs = metrics.counter(
+    "agent_runs_coalesced_total", "Callers that joined an identical prompt's agent run instead of starting their own")
+
+
+class _Flight:
+    """One agent execution and the events it produced so far, replayable by any number of followers."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        # Callers (the leader included) currently reading events; the run is cancelled when none are left
+        self.watching = 0
+        self.task: Optional[asyncio.Task] = None
+        # The run's own context: the latest deadline and most urgent priority among its callers
+        self.context = contextvars.copy_context()
+        self._changed = asyncio.Event()
+
+    def publish(self, event: dict) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """Every event from the start, then live ones; re-raises the run's error at the end.
+
+        When the last caller stops following before the run is done (deadline, disconnect), the run
+        is cancelled so it stops holding its concurrency slot and spending upstream quota for no one.
+        """
+        index = 0
+        self.watching += 1
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.watching -= 1
+            if not self.watching and not self.done and self.task is not None:
+                self.task.cancel()
+
+
+class PromptCoalescer:
+    """Shares one agent run between identical prompts that carry no session.
+
+    The first caller for a normalized prompt starts the run as its own task, so it keeps going
+    for everyone else even if that caller disconnects; once no caller is left it is cancelled.
+    Callers arriving within `window_seconds` of the start join it (also shortly after it finished,
+    if it succeeded) and receive the same events or answer; they take no concurrency slot. Like
+    duplicates in a batch, only the first caller gets the session id for follow-ups.
+
+    The run does not simply inherit its first caller's context: each joining caller extends its
+    deadline to their own and raises its upstream priority to theirs, while every caller still
+    waits only as long as their own deadline allows.
+    """
+
+    def __init__(self, window_seconds: float, max_followers: int):
+        self.window_seconds = window_seconds
+        self.max_followers = max_followers
+        # (mode, normalized prompt) -> flight, oldest first
+        self._flights: "OrderedDict[tuple, _Flight]" = OrderedDict()
+        # Callers that joined a run instead of starting one
+        self.runs_saved = 0
+
+    def joinable(self, mode: str, prompt: str) -> bool:
+        return self._live((mode, normalize_prompt(prompt)), time.monotonic()) is not None
+
+    async def run(self, prompt: str, endpoint: str = "plan") -> Tuple[str, Optional[str], bool, Optional[dict]]:
+        """Run or join a non-streaming run; returns (text, session id, shared, token usage).
+
+        Only the caller that started the run gets the session id and the usage it incurred.
+        """
+        flight, leader = self._join("run", prompt, endpoint, lambda: _run_events(prompt))
+        final = None
+        async for event in flight.follow():
+            final = event
+        if not leader:
+            return final["text"], None, True, None
+        return final["text"], final["session_id"], False, final["usage"]
+
+    async def stream(self, prompt: str) -> AsyncIterator[dict]:
+        """Run or join a streaming run. Followers get no `session` event and a `coalesced` final."""
+        flight, leader = self._join("stream", prompt, "stream", lambda: _stream_events(prompt))
+        async for event in flight.follow():
+            if leader:
+                yield event
+            elif event["type"] == "final":
+                yield {**event, "coalesced": True, "usage": None}
+            elif event["type"] != "session":
+                yield event
+
+    def stats(self) -> dict:
+        return {"flights": sum(not flight.done for flight in self._flights.values()), "runs_saved": self.runs_saved,
+                "window_seconds": self.window_seconds}
+
+    # --- Internals ---
+    def _join(self, mode: str, prompt: str, endpoint: str,
+              produce: Callable[[], AsyncIterator[dict]]) -> Tuple[_Flight, bool]:
+        key = (mode, normalize_prompt(prompt))
+        now = time.monotonic()
+        self._expire(now)
+        flight = self._live(key, now)
+        if flight is not None:
+            flight.followers += 1
+            self.runs_saved += 1
+            coalesced_runs.inc(endpoint=endpoint)
+            deadline.extend(flight.context, deadline.expiry())
+            raise_priority(flight.context, current_priority())
+            return flight, False
+
+        flight = _Flight()
+        self._flights[key] = flight
+        self._flights.move_to_end(key)
+        flight.task = asyncio.create_task(self._drive(key, flight, produce), context=flight.context)
+        return flight, True
+
+    def _live(self, key: tuple, now: float) -> Optional[_Flight]:
+        flight = self._flights.get(key)
+        if flight is None or now - flight.started > self.window_seconds or flight.followers >= self.max_followers:
+            return None
+        return None if flight.done and flight.error is not None else flight
+
+    def _expire(self, now: float) -> None:
+        # Finished flights linger until their window closes; running ones stay until they finish
+        expired = [key for key, flight in self._flights.items()
+                   if flight.done and now - flight.started > self.window_seconds]
+        for key in expired:
+            del self._flights[key]
+
+    async def _drive(self, key: tuple, flight: _Flight, produce: Callable[[], AsyncIterator[dict]]) -> None:
+        try:
+            async for event in produce():
+                flight.publish(event)
+        except Exception as e:
+            flight.finish(e)
+            # Failed runs are not shared with later callers; they retry instead
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        else:
+            flight.finish()
+        finally:
+            if not flight.done:
+                # Cancelled (shutdown, or every caller left): release any followers and let the next caller
+                # start afresh instead of joining a run that will never finish
+                flight.finish(asyncio.CancelledError())
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+
+async def _run_events(prompt: str) -> AsyncIterator[dict]:
+    async with agent_limiter.slot():
+        text, session_id, usage = await agent_router.run(prompt)
+    yield {"type": "final", "text": text, "session_id": session_id, "usage": usage}
+
+
+async def _stream_events(prompt: str) -> AsyncIterator[dict]:
+    async with agent_limiter.slot():
+        async for event in agent_router.stream(prompt):
+            yield event
+
+
+# Shared across the routes and the batch endpoint in this worker
+prompt_coalescer = PromptCoalescer(
+    window_seconds=settings.PROMPT_COALESCE_WINDOW_SECONDS,
+    max_followers=settings.PROMPT_COALESCE_MAX_FOLLOWERS,
+)
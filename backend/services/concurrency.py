@@ -0,0 +1,82 @@
+# backend/services/concurrency.py – Per-worker admission control for agent runs
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from config import settings
+
+
+class AgentOverloadedError(Exception):
+    """Raised when an agent run cannot be admitted (queue full or queue wait timed out)."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentConcurrencyLimiter:
+    """Bounds in-flight agent runs on one event loop and queues a limited backlog.
+
+    Up to `max_concurrent` runs execute at once, up to `max_queued` more wait for a slot
+    (for at most `queue_timeout` seconds), and anything beyond that is rejected immediately
+    so the route can answer 429 instead of piling work onto the loop.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the serving loop, not the import-time one
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def at_capacity(self) -> bool:
+        """True when a new run would be rejected outright (all slots busy and the queue is full)."""
+        return self.in_flight >= self.max_concurrent and self.queued >= self.max_queued
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._get_semaphore()
+        if self.at_capacity():
+            self.rejected += 1
+            raise AgentOverloadedError("Travel agent is at capacity, please retry shortly.")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AgentOverloadedError("Timed out waiting for a free travel agent slot.")
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+# Shared limiter for every agent-backed route in this worker
+agent_limiter = AgentConcurrencyLimiter(
+    max_concurrent=settings.MAX_CONCURRENT_AGENT_RUNS,
+    max_queued=settings.MAX_QUEUED_AGENT_RUNS,
+    queue_timeout=settings.AGENT_QUEUE_TIMEOUT_SECONDS,
+)
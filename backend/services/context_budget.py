@@ -0,0 +1,204 @@
+# backend/services/context_budget.py – Prompt-size budget, tool-result truncation and instruction caching
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+from backend.services import metrics
+from backend.services.session_manager import CHARS_PER_TOKEN
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# (max list items, max string chars) tried in turn until an oversized tool result fits
+_SHRINK_STEPS = ((20, 600), (10, 300), (5, 120), (3, 60))
+
+trimmed_contents = metrics.counter("llm_context_trimmed_total", "Oldest request contents dropped to fit the budget")
+truncated_results = metrics.counter("tool_results_truncated_total", "Tool results shrunk before entering the context")
+
+
+# --- Estimation ---
+def part_chars(part) -> int:
+    if getattr(part, "text", None):
+        return len(part.text)
+    if getattr(part, "function_call", None):
+        return len(part.function_call.name or "") + _json_chars(part.function_call.args)
+    if getattr(part, "function_response", None):
+        return len(part.function_response.name or "") + _json_chars(part.function_response.response)
+    return 0
+
+
+def content_chars(content) -> int:
+    return sum(part_chars(part) for part in content.parts) if content and content.parts else 0
+
+
+def request_chars(llm_request) -> int:
+    """Everything sent as input: contents plus the system instruction and tool declarations."""
+    config = llm_request.config
+    total = sum(content_chars(content) for content in llm_request.contents)
+    if config is not None:
+        total += len(config.system_instruction or "") if isinstance(config.system_instruction, str) else 0
+        total += sum(_json_chars(tool.model_dump(exclude_none=True)) for tool in config.tools or [])
+    return total
+
+
+def _json_chars(value) -> int:
+    return len(json.dumps(value, default=str, separators=(",", ":"))) if value else 0
+
+
+# --- Tool results ---
+def shrink_result(result: dict, max_chars: int) -> dict:
+    """Clip long lists and strings until the result's JSON fits in `max_chars`.
+
+    The model sees `"truncated": true` and keeps the leading items, which is where every tool in
+    this repo puts the important fields (status, totals, cheapest variants).
+    """
+    if _json_chars(result) <= max_chars:
+        return result
+    for items, chars in _SHRINK_STEPS:
+        clipped = _clip(result, items, chars)
+        clipped["truncated"] = True
+        if _json_chars(clipped) <= max_chars:
+            return clipped
+    preview = json.dumps(result, default=str, separators=(",", ":"))[:max_chars]
+    return {"status": result.get("status", "partial"), "truncated": True, "preview": preview}
+
+
+def _clip(value, items: int, chars: int):
+    if isinstance(value, dict):
+        return {key: _clip(item, items, chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clip(item, items, chars) for item in value[:items]]
+    if isinstance(value, str) and len(value) > chars:
+        return value[:chars - 1] + "…"
+    return value
+
+
+# --- Instruction caching ---
+class InstructionCache:
+    """Serves the static system instruction (and tool declarations) from provider-side context caching.
+
+    Gemini only caches prompts above a model-specific minimum size, so requests whose static part
+    is estimated below `min_tokens` are sent unchanged. Otherwise the cache is created once per
+    (model, instruction, tools) on a background thread; until it exists, or if creation fails,
+    requests go out as usual. A cached request references the cache by name instead of resending
+    the instruction and tools.
+    """
+
+    def __init__(self, client_factory: Callable[[], object], min_tokens: int = settings.CONTEXT_CACHE_MIN_TOKENS,
+                 ttl_seconds: float = settings.CONTEXT_CACHE_TTL_SECONDS):
+        self.client_factory = client_factory
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        # key -> {"name": cache name or None, "expires_at": float, "pending": bool}
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def apply(self, llm_request) -> int:
+        """Point the request at the cached instruction when ready; returns the tokens served from cache."""
+        config = llm_request.config
+        if config is None or not isinstance(config.system_instruction, str) or config.cached_content:
+            return 0
+        tools = [tool.model_dump(exclude_none=True) for tool in config.tools or []]
+        tokens = (len(config.system_instruction) + _json_chars(tools)) // CHARS_PER_TOKEN
+        if tokens < self.min_tokens:
+            return 0
+        key = hashlib.sha256(json.dumps([llm_request.model, config.system_instruction, tools],
+                                        default=str).encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            # Renew a minute early so no request references a cache that just expired
+            if entry is None or (not entry["pending"] and entry["expires_at"] - 60 <= now):
+                entry = self._entries[key] = {"name": None, "expires_at": now + self.ttl_seconds, "pending": True}
+                threading.Thread(target=self._create, args=(key, llm_request.model, config.system_instruction,
+                                                             list(config.tools or [])), daemon=True).start()
+            name = entry["name"] if entry["expires_at"] - 60 > now else None
+        if not name:
+            return 0
+        config.cached_content = name
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        return tokens
+
+    def _create(self, key: str, model: str, instruction: str, tools: list) -> None:
+        from google.genai import types
+
+        try:
+            cache = self.client_factory().caches.create(model=model, config=types.CreateCachedContentConfig(
+                system_instruction=instruction, tools=tools or None, ttl=f"{int(self.ttl_seconds)}s"))
+            name = cache.name
+            logger.info("Cached the system instruction for %s as %s", model, name)
+        except Exception as e:
+            # Not every model or tier supports caching; retry only after a full TTL
+            name = None
+            logger.warning("Context caching unavailable for %s: %s", model, e)
+        with self._lock:
+            self._entries[key] = {"name": name, "expires_at": time.time() + self.ttl_seconds, "pending": False}
+
+
+# --- Budget ---
+class ContextBudget:
+    """Bounds what one model call sends and receives.
+
+    `fit_request` caps output tokens and, when the estimated prompt exceeds `max_prompt_tokens`,
+    drops the oldest whole turns from this request (the stored session keeps them; the session
+    manager compacts it separately). The newest turn is always sent. `fit_tool_result` shrinks
+    oversized tool results before they enter the conversation.
+    """
+
+    def __init__(self, max_prompt_tokens: int = settings.CONTEXT_MAX_PROMPT_TOKENS,
+                 max_output_tokens: int = settings.CONTEXT_MAX_OUTPUT_TOKENS,
+                 max_tool_result_chars: int = settings.CONTEXT_MAX_TOOL_RESULT_CHARS,
+                 instruction_cache: Optional[InstructionCache] = None):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_tool_result_chars = max_tool_result_chars
+        self.instruction_cache = instruction_cache
+
+    def fit_request(self, llm_request) -> dict:
+        """Apply the budget in place; returns {"prompt_tokens", "cached_tokens", "trimmed"} estimates."""
+        from google.genai import types
+
+        if self.max_output_tokens:
+            if llm_request.config is None:
+                llm_request.config = types.GenerateContentConfig()
+            if not llm_request.config.max_output_tokens:
+                llm_request.config.max_output_tokens = self.max_output_tokens
+
+        contents = llm_request.contents
+        sizes = [content_chars(content) for content in contents]
+        static = request_chars(llm_request) - sum(sizes)
+        budget = self.max_prompt_tokens * CHARS_PER_TOKEN - static
+        start = 0
+        if self.max_prompt_tokens and sum(sizes) > budget:
+            turns = [i for i, content in enumerate(contents) if _starts_turn(content)]
+            total = sum(sizes)
+            for turn in turns[1:]:
+                if total - sum(sizes[:turn]) <= budget:
+                    start = turn
+                    break
+                start = turn
+            if start:
+                del contents[:start]
+                trimmed_contents.inc(start)
+
+        cached = self.instruction_cache.apply(llm_request) if self.instruction_cache else 0
+        return {"prompt_tokens": (static + sum(sizes[start:])) // CHARS_PER_TOKEN, "cached_tokens": cached,
+                "trimmed": start}
+
+    def fit_tool_result(self, tool_name: str, result):
+        if not self.max_tool_result_chars or not isinstance(result, dict):
+            return result
+        shrunk = shrink_result(result, self.max_tool_result_chars)
+        if shrunk is not result:
+            truncated_results.inc(tool=tool_name)
+        return shrunk
+
+
+def _starts_turn(content) -> bool:
+    # Function responses also have role "user"; a turn starts at a user message with text
+    return content.role == "user" and any(getattr(part, "text", None) for part in content.parts or [])
@@ -0,0 +1,109 @@
+# backend/services/deadline.py – Per-request deadlines shared by the agent run, tools and upstream calls
+
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+# Absolute time.monotonic() by which the current request must be answered, or None
+_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before this step could finish."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Work started inside this block (including its tasks and threads) must finish within `seconds`.
+
+    A nested block replaces the outer deadline until it exits, so a fallback can get its own
+    budget after the main one ran out. `None` or 0 means no deadline.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (may be negative), or None without one."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def expiry() -> Optional[float]:
+    """The current deadline as an absolute time.monotonic(), or None without one."""
+    return _deadline.get()
+
+
+def extend(context: contextvars.Context, expires: Optional[float]) -> None:
+    """Push the deadline carried by `context` (e.g. a task shared by several requests) out to `expires`.
+
+    It is never brought forward; `None` lifts it.
+    """
+    current = context.get(_deadline)
+    if current is not None and (expires is None or expires > current):
+        context.run(_deadline.set, expires)
+
+
+def bound(timeout: float) -> float:
+    """`timeout` shortened to the time left; raises DeadlineExceeded when none is left."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("The request deadline has passed.")
+    return min(timeout, left)
+
+
+async def within_deadline(awaitable):
+    """Await `awaitable`, cancelling it and raising DeadlineExceeded once the current deadline passes."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(left, 0.0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("The request deadline has passed.") from None
+
+
+async def until_deadline(events: AsyncIterator[dict], seconds: Optional[float]) -> AsyncIterator[dict]:
+    """Re-yield `events`, raising DeadlineExceeded if they have not all arrived within `seconds`.
+
+    The source is driven by its own task, which carries the deadline, and handed over through a
+    queue: the consumer (e.g. a response body generator) never holds the context variable across
+    its own yields, and the source can be cancelled between any two of its events.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    expires = time.monotonic() + seconds if seconds else None
+
+    async def pump():
+        # Set in this task's own copy of the context; nothing to reset
+        _deadline.set(expires)
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(done)
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            timeout = None if expires is None else max(expires - time.monotonic(), 0.0)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("The request deadline has passed.") from None
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
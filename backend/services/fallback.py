@@ -0,0 +1,112 @@
+# backend/services/fallback.py – Quick degraded answers for runs that miss their deadline
+
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import List, Optional
+from backend.services import metrics
+from backend.services.backend_router import agent_router
+from backend.services.deadline import deadline
+from backend.services.response_cache import response_cache
+from backend.services.upstream import upstream_scheduler
+from backend.tools import expense_calculator
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+fallback_answers = metrics.counter("agent_fallback_answers_total", "Degraded answers given after a missed "
+                                   "deadline, by source")
+
+FALLBACK_INSTRUCTION = (
+    "You are a travel planner answering in a hurry. In a few short paragraphs, suggest when to go, what to "
+    "pack and a rough budget. Use the cost figures given; do not invent prices for other places."
+)
+
+
+def agent_budget() -> float:
+    """The agent's share of the request deadline; the rest is kept for the fallback model."""
+    reserve = settings.FALLBACK_TIMEOUT_SECONDS if settings.FALLBACK_MODEL else 0.0
+    return max(settings.AGENT_DEADLINE_SECONDS - reserve, 1.0) if settings.AGENT_DEADLINE_SECONDS else 0.0
+
+
+class FallbackPlanner:
+    """Answers a prompt the agent could not answer in time, from what is already known.
+
+    Tried in order: a cached answer to the same prompt (fresh prompts only); `model`, a smaller,
+    faster model with no tools, given the cost index's figures for destinations named in the
+    prompt; and a short note built from those figures alone. Returns None when none applies.
+    """
+
+    def __init__(self, model: Optional[str], timeout_seconds: float, max_output_tokens: int):
+        self.model = model
+        self.timeout_seconds = timeout_seconds
+        self.max_output_tokens = max_output_tokens
+
+    async def answer(self, prompt: str, fresh: bool = True) -> Optional[str]:
+        if fresh and settings.RESPONSE_CACHE_ENABLED:
+            cached = response_cache.get(prompt)
+            if cached is not None:
+                fallback_answers.inc(source="cache")
+                return cached
+
+        facts = self.cost_facts(prompt)
+        if self.model:
+            try:
+                # Its own budget: the request's deadline has already passed
+                with deadline(self.timeout_seconds):
+                    text = await asyncio.wait_for(self._ask_model(prompt, facts), self.timeout_seconds)
+                if text:
+                    fallback_answers.inc(source="model")
+                    return text
+            except Exception as e:
+                logger.warning("Fallback model '%s' gave no answer: %s", self.model, e)
+
+        if facts:
+            fallback_answers.inc(source="cost_index")
+            return ("I couldn't finish a full plan in time, so here is a quick answer from recent cost data:\n\n"
+                    + "\n".join(f"- {fact}" for fact in facts)
+                    + "\n\nAsk again in a moment for timing and packing advice.")
+        fallback_answers.inc(source="none")
+        return None
+
+    def cost_facts(self, prompt: str) -> List[str]:
+        """One line per destination named in the prompt that the cost index knows about."""
+        index = expense_calculator.cost_index
+        if index is None:
+            return []
+        facts = []
+        for entry in index.find_in_text(prompt):
+            fact = f"{entry['name']}: about ${round(entry['daily_cost'])} per day"
+            if entry["low"] is not None:
+                fact += f" (typically ${round(entry['low'])}–${round(entry['high'])})"
+            facts.append(fact + ".")
+        return facts
+
+    async def _ask_model(self, prompt: str, facts: List[str]) -> Optional[str]:
+        from google.genai import types
+
+        # Borrow the genai client (and upstream quota) of a backend that is already built
+        for backend in agent_router.backends:
+            if not backend.provider.ready:
+                continue
+            client = getattr(backend.provider.get().agent.model, "api_client", None)
+            if client is None:
+                continue
+            contents = prompt if not facts else f"{prompt}\n\nKnown daily costs:\n" + "\n".join(facts)
+            limiter = upstream_scheduler.limiter(*backend.upstream) if backend.upstream else None
+            async with (limiter.call_async() if limiter else nullcontext()):
+                response = await client.aio.models.generate_content(
+                    model=self.model,
+                    contents=contents,
+                    config=types.GenerateContentConfig(system_instruction=FALLBACK_INSTRUCTION,
+                                                       max_output_tokens=self.max_output_tokens),
+                )
+            return response.text
+        return None
+
+
+fallback_planner = FallbackPlanner(
+    model=settings.FALLBACK_MODEL,
+    timeout_seconds=settings.FALLBACK_TIMEOUT_SECONDS,
+    max_output_tokens=settings.FALLBACK_MAX_OUTPUT_TOKENS,
+)
@@ -0,0 +1,191 @@
+# backend/services/metrics.py – In-process counters and latency histograms with Prometheus exposition
+
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; spans range from sub-millisecond cache hits to multi-second LLM turns
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    """Label value escaping of the text exposition format: backslash, double quote and newline."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _help_line(name: str, help: str) -> str:
+    # HELP text escapes backslashes and newlines only
+    return f"# HELP {name} " + (help or name).replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(key: Tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple, window: int):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self._samples.append(value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+
+    def percentile(self, q: float) -> float:
+        """Percentile over the most recent samples (a sliding window, not all time)."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Histogram:
+    """Latency histogram with optional labels; each label set also keeps a recent-sample window."""
+
+    def __init__(self, name: str, help: str = "", buckets: Tuple = DEFAULT_BUCKETS, window: int = 2048):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.window = window
+        self._children: Dict[Tuple, _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels) -> _HistogramChild:
+        key = _label_key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _HistogramChild(self.buckets, self.window))
+        return child
+
+    def observe(self, value: float, **labels) -> None:
+        self.labels(**labels).observe(value)
+
+    def percentile(self, q: float, **labels) -> float:
+        return self.labels(**labels).percentile(q)
+
+    def render(self) -> List[str]:
+        lines = [_help_line(self.name, self.help), f"# TYPE {self.name} histogram"]
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.bucket_counts):
+                cumulative += count
+                bucket_labels = _format_labels(key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {child.count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {child.total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {child.count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        return {",".join(f"{k}={v}" for k, v in key) or "all": child.summary()
+                for key, child in list(self._children.items())}
+
+
+class Counter:
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [_help_line(self.name, self.help), f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in list(self._values.items())]
+        return lines
+
+    def snapshot(self) -> dict:
+        return {",".join(f"{k}={v}" for k, v in key) or "all": value for key, value in list(self._values.items())}
+
+
+# --- Registry ---
+registry: dict = {}
+# Callables returning (name, type, labels, value) samples read from components at scrape time
+collectors: List[Callable[[], Iterable[Tuple[str, str, dict, float]]]] = []
+
+
+def latency(name: str, help: str = "") -> Histogram:
+    """Get or create the named latency histogram (seconds)."""
+    metric = registry.get(name)
+    if metric is None:
+        metric = registry.setdefault(name, Histogram(name, help))
+    return metric
+
+
+def histogram(name: str, help: str = "", buckets: Tuple = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram of any unit (sizes, token counts) with explicit buckets."""
+    metric = registry.get(name)
+    if metric is None:
+        metric = registry.setdefault(name, Histogram(name, help, buckets))
+    return metric
+
+
+def counter(name: str, help: str = "") -> Counter:
+    metric = registry.get(name)
+    if metric is None:
+        metric = registry.setdefault(name, Counter(name, help))
+    return metric
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, dict, float]]]) -> None:
+    collectors.append(collector)
+
+
+def snapshot() -> dict:
+    result = {name: metric.snapshot() for name, metric in registry.items()}
+    for collector in collectors:
+        for name, _, labels, value in collector():
+            result.setdefault(name, {})[",".join(f"{k}={v}" for k, v in _label_key(labels)) or "all"] = value
+    return result
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in list(registry.values()):
+        lines += metric.render()
+    # Collectors interleave families (per cache, per backend); every family's samples must form one group
+    families: Dict[str, Tuple[str, List[str]]] = {}
+    for collector in collectors:
+        for name, kind, labels, value in collector():
+            families.setdefault(name, (kind, []))[1].append(f"{name}{_format_labels(_label_key(labels))} {value}")
+    for name, (kind, samples) in families.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines += samples
+    return "\n".join(lines) + "\n"
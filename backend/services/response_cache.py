@@ -0,0 +1,146 @@
+# backend/services/response_cache.py – Exact and near-duplicate cache for fresh travel prompts
+
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from config import settings
+
+EMBEDDING_DIM = 512
+_WORD = re.compile(r"[a-z0-9]+")
+# Question phrasing that carries no destination-specific meaning. Whatever is left over
+# (destinations, months, budgets) must match exactly before a near-duplicate is reused.
+INTENT_WORDS = {
+    "a", "an", "the", "to", "of", "in", "on", "for", "at", "and", "or", "is", "are", "be", "it", "its",
+    "i", "me", "my", "we", "our", "you", "your", "do", "does", "should", "would", "could", "can",
+    "what", "when", "where", "which", "how", "much", "many", "best", "good", "ideal", "right",
+    "time", "times", "period", "season", "visit", "visiting", "go", "going", "travel", "traveling",
+    "trip", "there", "plan", "planning", "suggest", "tell", "about", "please", "recommend",
+    "get", "some", "tips", "need", "want", "know", "like", "there", "this", "that",
+}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(_WORD.findall(prompt.lower()))
+
+
+def _key_terms(normalized: str) -> frozenset:
+    return frozenset(word for word in normalized.split() if word not in INTENT_WORDS)
+
+
+def embed(normalized: str) -> np.ndarray:
+    """Hashed bag of words and character trigrams, L2-normalized. Local and deterministic."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in normalized.split():
+        vector[zlib.crc32(word.encode()) % EMBEDDING_DIM] += 2.0
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """Caches agent answers for prompts that carry no session context.
+
+    Lookups try the normalized prompt first, then (if `semantic` is on) the nearest stored
+    prompt by cosine similarity, accepted only above `threshold` and only when both prompts
+    name the same key terms. Entries expire after `ttl_seconds`; the least recently used
+    entry is evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, semantic: bool, threshold: float):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        # normalized prompt -> (expires_at, response, row in the embedding matrix)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Only allocated when near-duplicate matching is on (max_entries x 2 KiB)
+        self._vectors = np.zeros((max_entries if semantic else 0, EMBEDDING_DIM), dtype=np.float32)
+        self._row_keys: list = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, prompt: str) -> Optional[str]:
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            key = normalized if self._live(normalized, now) else None
+            if key is not None:
+                self.exact_hits += 1
+            elif self.semantic and self._entries:
+                key = self._nearest(normalized, now)
+                if key is not None:
+                    self.semantic_hits += 1
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+    def set(self, prompt: str, response: str) -> None:
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            entry = self._entries.pop(normalized, None)
+            if entry is not None:
+                row = entry[2]
+            else:
+                if not self._free_rows:
+                    self._evict(next(iter(self._entries)))
+                row = self._free_rows.pop()
+                if self.semantic:
+                    self._vectors[row] = embed(normalized)
+                self._row_keys[row] = normalized
+            self._entries[normalized] = (time.time() + self.ttl_seconds, response, row)
+
+    def _live(self, key: str, now: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry[0] < now:
+            self._evict(key)
+            return False
+        return True
+
+    def _nearest(self, normalized: str, now: float) -> Optional[str]:
+        scores = self._vectors @ embed(normalized)
+        terms = _key_terms(normalized)
+        # Best candidates first; stop at the first one under the threshold
+        for row in np.argsort(scores)[::-1][:8]:
+            key = self._row_keys[row]
+            if scores[row] < self.threshold:
+                break
+            if key is not None and _key_terms(key) == terms and self._live(key, now):
+                return key
+        return None
+
+    def _evict(self, key: str) -> None:
+        _, _, row = self._entries.pop(key)
+        if self.semantic:
+            self._vectors[row] = 0.0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache(
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    semantic=settings.RESPONSE_CACHE_SEMANTIC,
+    threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+)
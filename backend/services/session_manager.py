@@ -0,0 +1,277 @@
+# backend/services/session_manager.py – Per-caller ADK session pool
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+from config import settings
+from backend.services.session_store import decode_session, store_errors, store_loads, summarize_turns
+
+USER_ID = "demo_user"
+# Rough chars-per-token ratio used for history budgeting and memory accounting
+CHARS_PER_TOKEN = 4
+# Compacted history is kept as one leading user event carrying this marker in custom_metadata
+SUMMARY_MARKER = "history_summary"
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+_NOT_PENDING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """Keeps one ADK session per caller session id instead of a single shared conversation.
+
+    Sessions expire after `ttl_seconds` of inactivity, the least recently used ones are
+    evicted once `max_sessions` is reached, and each session's history is trimmed to
+    `max_history_events` / `max_history_tokens` after every run so prompt size stays bounded;
+    trimmed turns are folded into a short summary event instead of being forgotten.
+
+    With a `writer` (see session_store.WriteBehind), every released session is versioned and
+    written to the shared store in the background, and opening a session first checks the store
+    for a newer version, so any worker can continue a conversation another worker started. Two
+    workers running the same session at the same moment is last-writer-wins.
+    """
+
+    def __init__(self, session_service, app_name: str,
+                 ttl_seconds: float = settings.SESSION_TTL_SECONDS,
+                 max_sessions: int = settings.SESSION_MAX_COUNT,
+                 max_history_events: int = settings.SESSION_MAX_HISTORY_EVENTS,
+                 max_history_tokens: int = settings.SESSION_MAX_HISTORY_TOKENS,
+                 summary_max_chars: int = settings.SESSION_SUMMARY_MAX_CHARS,
+                 writer=None):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_history_events = max_history_events
+        self.max_history_tokens = max_history_tokens
+        self.summary_max_chars = summary_max_chars
+        self.writer = writer
+        # session_id -> last access time, ordered oldest first
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._approx_bytes: dict = {}
+        self._locks: dict = {}
+        # session_id -> version of the local copy in the shared store
+        self._versions: dict = {}
+        self.evictions = 0
+        self.restores = 0
+        self.compactions = 0
+
+    # --- Lifecycle ---
+    def open(self, session_id: Optional[str] = None, restore: bool = True, snapshot: Optional[tuple] = None) -> str:
+        """Return a usable session id, creating a cold session when it is new or expired.
+
+        An id this process does not hold is only continued when the shared store has it (`snapshot`,
+        or with `restore` a blocking load); otherwise it is treated as expired and a fresh id is
+        issued, so callers can never pick their own. With `restore`, a newer copy of a held session
+        in the shared store replaces the local one (`session()` does this on a worker thread instead).
+        """
+        now = time.monotonic()
+        self._purge_expired(now)
+
+        if session_id and session_id in self._last_used:
+            self._last_used.move_to_end(session_id)
+            self._last_used[session_id] = now
+            if restore:
+                self._restore(session_id, self.load(session_id))
+            return session_id
+
+        if snapshot is None and session_id and restore:
+            snapshot = self.load(session_id)
+        if snapshot is None:
+            session_id = uuid.uuid4().hex
+        while len(self._last_used) >= self.max_sessions and self._evict_lru():
+            self.evictions += 1
+
+        self.session_service.create_session(app_name=self.app_name, user_id=USER_ID, session_id=session_id)
+        self._last_used[session_id] = now
+        self._approx_bytes[session_id] = 0
+        self._restore(session_id, snapshot)
+        return session_id
+
+    def has(self, session_id: str) -> bool:
+        return session_id in self._last_used
+
+    def load(self, session_id: str) -> Optional[tuple]:
+        """(version, events, state) from the shared store when it is newer than the local copy."""
+        if self.writer is None:
+            return None
+        known = self._versions.get(session_id, 0)
+        key = self._key(session_id)
+        pending = self.writer.pending(key, _NOT_PENDING)
+        if pending is not _NOT_PENDING:
+            # This process wrote it last: the unflushed snapshot is newest (None = being deleted)
+            return pending if pending is not None and pending[0] > known else None
+        try:
+            found = self.writer.store.load(key, newer_than=known)
+        except Exception as e:
+            store_errors.inc(operation="load")
+            logger.warning("Session store load of '%s' failed: %s", session_id, e)
+            return None
+        if found is None:
+            store_loads.inc(outcome="fresh" if known else "miss")
+            return None
+        store_loads.inc(outcome="hit")
+        version, record = found
+        return (version, *decode_session(record))
+
+    def release(self, session_id: str) -> None:
+        """Trim the session's history to budget, refresh its memory accounting and queue it for the store."""
+        session = self._stored_session(session_id)
+        if session is None:
+            return
+        events = session.events
+        start = max(0, len(events) - self.max_history_events)
+        sizes = [_event_chars(event) for event in events]
+        while start < len(events) and sum(sizes[start:]) // CHARS_PER_TOKEN > self.max_history_tokens:
+            start += 1
+        # Never start mid-turn: a dangling tool response without its call confuses the model
+        while 0 < start < len(events) and getattr(events[start], "author", None) != "user":
+            start += 1
+        if start:
+            summary = self._summarize(events[:start])
+            del events[:start]
+            sizes = sizes[start:]
+            if summary is not None:
+                events.insert(0, summary)
+                sizes.insert(0, _event_chars(summary))
+            self.compactions += 1
+        self._approx_bytes[session_id] = sum(sizes)
+        if self.writer is not None and session_id in self._last_used:
+            version = self._versions.get(session_id, 0) + 1
+            self._versions[session_id] = version
+            self.writer.put(self._key(session_id), version, list(events), dict(session.state))
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str] = None):
+        """Open a session, serialize runs on it, and trim its history once the run is done."""
+        held = bool(session_id) and self.has(session_id)
+        snapshot = None
+        if session_id and not held and self.writer is not None:
+            # Possibly started on another worker: look it up in the shared store off the loop
+            snapshot = await asyncio.to_thread(self.load, session_id)
+        session_id = self.open(session_id, restore=False, snapshot=snapshot)
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            if held and self.writer is not None:
+                # Under the lock, so a run in progress here never has its history swapped out
+                self._restore(session_id, await asyncio.to_thread(self.load, session_id))
+            try:
+                yield session_id
+            finally:
+                self.release(session_id)
+                if session_id in self._last_used:
+                    self._last_used[session_id] = time.monotonic()
+                else:
+                    self._locks.pop(session_id, None)
+
+    def discard(self, session_id: str) -> None:
+        """Drop a session immediately (e.g. throwaway warm-up sessions)."""
+        if session_id in self._last_used:
+            self._drop(session_id)
+        if self.writer is not None:
+            self.writer.delete(self._key(session_id))
+
+    # --- Internals ---
+    def _key(self, session_id: str) -> str:
+        return f"{self.app_name}:{session_id}"
+
+    def _restore(self, session_id: str, snapshot: Optional[tuple]) -> None:
+        if snapshot is None or session_id not in self._last_used:
+            return
+        version, events, state = snapshot
+        if version <= self._versions.get(session_id, 0):
+            return
+        session = self._stored_session(session_id)
+        if session is None:
+            return
+        session.events[:] = events
+        session.state.clear()
+        session.state.update(state)
+        self._versions[session_id] = version
+        self._approx_bytes[session_id] = sum(_event_chars(event) for event in events)
+        self.restores += 1
+
+    def _summarize(self, dropped: list):
+        """One user event summarizing the dropped turns (and any earlier summary), or None."""
+        if not self.summary_max_chars:
+            return None
+        previous = ""
+        if dropped and (getattr(dropped[0], "custom_metadata", None) or {}).get(SUMMARY_MARKER):
+            previous = dropped[0].content.parts[0].text.removeprefix(SUMMARY_PREFIX).strip()
+            dropped = dropped[1:]
+        text = summarize_turns(dropped, previous, self.summary_max_chars)
+        if not text:
+            return None
+        from google.adk.events import Event
+        from google.genai import types
+
+        # Stamped with the last dropped event's time so the history stays in chronological order
+        last = dropped[-1] if dropped else None
+        return Event(author="user", invocation_id=getattr(last, "invocation_id", ""),
+                     timestamp=getattr(last, "timestamp", None) or time.time(),
+                     content=types.Content(role="user", parts=[types.Part(text=f"{SUMMARY_PREFIX}\n{text}")]),
+                     custom_metadata={SUMMARY_MARKER: True})
+
+    def _stored_session(self, session_id: str):
+        # InMemorySessionService hands out copies from get_session, so trim the stored object
+        sessions = getattr(self.session_service, "sessions", None)
+        if sessions is not None:
+            return sessions.get(self.app_name, {}).get(USER_ID, {}).get(session_id)
+        return self.session_service.get_session(app_name=self.app_name, user_id=USER_ID, session_id=session_id)
+
+    def _purge_expired(self, now: float) -> None:
+        while self._last_used:
+            oldest, last_used = next(iter(self._last_used.items()))
+            if now - last_used < self.ttl_seconds:
+                break
+            self._drop(oldest)
+
+    def _evict_lru(self) -> bool:
+        for candidate in self._last_used:
+            lock = self._locks.get(candidate)
+            if lock is None or not lock.locked():
+                self._drop(candidate)
+                return True
+        return False
+
+    def _drop(self, session_id: str) -> None:
+        self._last_used.pop(session_id, None)
+        self._approx_bytes.pop(session_id, None)
+        # The shared store keeps the history; only this process's copy goes away
+        self._versions.pop(session_id, None)
+        lock = self._locks.get(session_id)
+        if lock is None or not lock.locked():
+            self._locks.pop(session_id, None)
+        try:
+            self.session_service.delete_session(app_name=self.app_name, user_id=USER_ID, session_id=session_id)
+        except Exception as e:
+            logger.warning("Failed to delete session '%s': %s", session_id, e)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._last_used),
+            "max_sessions": self.max_sessions,
+            "approx_history_bytes": sum(self._approx_bytes.values()),
+            "evictions": self.evictions,
+            "restores": self.restores,
+            "compactions": self.compactions,
+            "store": self.writer.store.name if self.writer is not None else "memory",
+        }
+
+
+def _event_chars(event) -> int:
+    content = getattr(event, "content", None)
+    if not content or not getattr(content, "parts", None):
+        return 0
+    total = 0
+    for part in content.parts:
+        text = getattr(part, "text", None)
+        if text:
+            total += len(text)
+        elif getattr(part, "function_call", None) or getattr(part, "function_response", None):
+            total += len(str(part.function_call or part.function_response))
+    return total
@@ -0,0 +1,370 @@
+# backend/services/session_store.py – Shared, persistent session history for multi-worker deployments
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from backend.services import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# SQLite connections must not be shared with forked workers (backend.serve); each child opens its own
+_sqlite_stores: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _reopen_after_fork() -> None:
+    for store in list(_sqlite_stores):
+        store._local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+# Leading byte of every stored record: plain compact JSON or zlib-compressed compact JSON
+_PLAIN, _ZLIB = b"j", b"z"
+FORMAT_VERSION = 1
+
+store_writes = metrics.counter("session_store_writes_total", "Session snapshots written to the shared store")
+store_loads = metrics.counter("session_store_loads_total", "Session store lookups by outcome (hit, fresh, miss)")
+store_errors = metrics.counter("session_store_errors_total", "Failed session store operations by operation")
+flush_seconds = metrics.latency("session_store_flush_seconds", "Time to write one write-behind batch")
+
+
+# --- Serialization ---
+def encode_session(events: list, state: dict, compress_min_bytes: int = settings.SESSION_COMPRESS_MIN_BYTES) -> bytes:
+    """ADK events -> compact record: author, role and parts only, with short keys and no whitespace.
+
+    Grounding metadata, actions and per-event ids are runtime details the model never sees again,
+    so they are dropped; function call ids are kept because ADK pairs calls and responses by id.
+    """
+    rows = []
+    for event in events:
+        content = getattr(event, "content", None)
+        parts = []
+        for part in (content.parts or []) if content else []:
+            if part.text is not None:
+                parts.append(part.text)
+            elif part.function_call is not None:
+                call = part.function_call
+                parts.append({"c": [call.name, call.args or {}, call.id]})
+            elif part.function_response is not None:
+                response = part.function_response
+                parts.append({"r": [response.name, response.response or {}, response.id]})
+        row = [event.author, content.role if content else None, parts, event.invocation_id, round(event.timestamp, 3)]
+        if event.custom_metadata:
+            row.append(event.custom_metadata)
+        rows.append(row)
+    payload = json.dumps({"v": FORMAT_VERSION, "s": state or {}, "e": rows},
+                         separators=(",", ":"), ensure_ascii=False, default=str).encode()
+    if len(payload) >= compress_min_bytes:
+        return _ZLIB + zlib.compress(payload, 6)
+    return _PLAIN + payload
+
+
+def decode_session(record: bytes) -> Tuple[list, dict]:
+    """Inverse of encode_session; returns (ADK events, state)."""
+    from google.adk.events import Event
+    from google.genai import types
+
+    kind, body = record[:1], record[1:]
+    payload = json.loads(zlib.decompress(body) if kind == _ZLIB else body)
+    events = []
+    for row in payload["e"]:
+        author, role, raw_parts, invocation_id, timestamp = row[:5]
+        parts = []
+        for raw in raw_parts:
+            if isinstance(raw, str):
+                parts.append(types.Part(text=raw))
+            elif "c" in raw:
+                name, args, call_id = raw["c"]
+                parts.append(types.Part(function_call=types.FunctionCall(name=name, args=args, id=call_id)))
+            else:
+                name, response, call_id = raw["r"]
+                parts.append(types.Part(function_response=types.FunctionResponse(
+                    name=name, response=response, id=call_id)))
+        events.append(Event(author=author, invocation_id=invocation_id or "", timestamp=timestamp,
+                            content=types.Content(role=role, parts=parts) if role or parts else None,
+                            custom_metadata=row[5] if len(row) > 5 else None))
+    return events, payload.get("s", {})
+
+
+# --- Backends ---
+class SqliteSessionStore:
+    """Session records in one SQLite file (WAL), shared by every worker process on the host."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        _sqlite_stores.add(self)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "key TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: str, newer_than: int = 0) -> Optional[Tuple[int, bytes]]:
+        """(version, record) if the store holds a live version newer than `newer_than`."""
+        row = self._connect().execute(
+            "SELECT version, data FROM sessions WHERE key = ? AND version > ? AND expires_at > ?",
+            (key, newer_than, time.time())).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def save_many(self, records: Dict[str, Tuple[int, bytes]]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO sessions (key, version, data, expires_at) VALUES (?, ?, ?, ?)",
+                             [(key, version, data, expires_at) for key, (version, data) in records.items()])
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if keys:
+            self._connect().execute(f"DELETE FROM sessions WHERE key IN ({','.join('?' * len(keys))})", keys)
+
+    def prune(self) -> int:
+        return self._connect().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class RedisSessionStore:
+    """Session records in Redis or any server speaking its protocol (Valkey, KeyDB, Dragonfly).
+
+    `client` is a redis-py style client; each session is a hash with its version and record,
+    expiring `ttl_seconds` after the last write so the server does the pruning.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, ttl_seconds: float, prefix: str = "travel:session:"):
+        self.client = client
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: float) -> "RedisSessionStore":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE_BACKEND=redis needs the 'redis' package (pip install redis)") from e
+        return cls(redis.Redis.from_url(url, socket_timeout=2), ttl_seconds)
+
+    def load(self, key: str, newer_than: int = 0) -> Optional[Tuple[int, bytes]]:
+        version = self.client.hget(self.prefix + key, "v")
+        if version is None or int(version) <= newer_than:
+            return None
+        data = self.client.hget(self.prefix + key, "d")
+        return (int(version), bytes(data)) if data is not None else None
+
+    def save_many(self, records: Dict[str, Tuple[int, bytes]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, (version, data) in records.items():
+            pipe.hset(self.prefix + key, mapping={"v": version, "d": data})
+            pipe.expire(self.prefix + key, self.ttl_seconds)
+        pipe.execute()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def prune(self) -> int:
+        return 0
+
+
+def make_session_store(backend: Optional[str] = None):
+    """Build the store named in settings; "memory" keeps sessions in-process only and returns None."""
+    # Read at call time: backend.serve switches the default before the workers build their agents
+    backend = backend or settings.SESSION_STORE_BACKEND
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        return SqliteSessionStore(settings.SESSION_STORE_PATH, settings.SESSION_TTL_SECONDS)
+    if backend == "redis":
+        return RedisSessionStore.from_url(settings.SESSION_STORE_URL, settings.SESSION_TTL_SECONDS)
+    raise ValueError(f"Unknown session store backend: {backend}")
+
+
+# --- Write-behind ---
+class WriteBehind:
+    """Batches session snapshots and writes them from a background thread.
+
+    Requests only hand over a snapshot (a shallow copy of the event list); encoding and store I/O
+    happen here. Repeated writes of one session between flushes collapse into the latest, deletes
+    cancel pending writes, and `pending()` lets this process read its own unflushed writes.
+    """
+
+    def __init__(self, store, interval_seconds: float = settings.SESSION_FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = settings.SESSION_FLUSH_BATCH, prune_seconds: float = 300):
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.prune_seconds = prune_seconds
+        # key -> (version, events, state) to write, or None to delete
+        self._pending: Dict[str, Optional[tuple]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = time.monotonic()
+        self.flushes = 0
+
+    def put(self, key: str, version: int, events: list, state: dict) -> None:
+        with self._lock:
+            self._pending[key] = (version, events, state)
+            backlog = len(self._pending)
+        self._ensure_started()
+        if backlog >= self.batch_size:
+            self._wake.set()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pending[key] = None
+        self._ensure_started()
+
+    def pending(self, key: str, default=None):
+        """The unflushed (version, events, state) for `key`; None if its deletion is pending."""
+        with self._lock:
+            return self._pending.get(key, default)
+
+    def backlog(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        started = time.perf_counter()
+        writes = {}
+        for key, entry in batch.items():
+            if entry is not None:
+                version, events, state = entry
+                writes[key] = (version, encode_session(events, state))
+        deletes = [key for key, entry in batch.items() if entry is None]
+        try:
+            if writes:
+                self.store.save_many(writes)
+            if deletes:
+                self.store.delete_many(deletes)
+        except Exception as e:
+            store_errors.inc(operation="flush")
+            logger.warning("Session store flush of %d records failed: %s", len(batch), e)
+            with self._lock:
+                # Retry next round unless a newer write or delete superseded the entry
+                for key, entry in batch.items():
+                    self._pending.setdefault(key, entry)
+            return
+        store_writes.inc(len(writes))
+        flush_seconds.observe(time.perf_counter() - started)
+        self.flushes += 1
+
+    def stop(self) -> None:
+        """Write everything still pending; called on shutdown."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None and not self._stopping.is_set():
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="session-write-behind", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - self._last_prune >= self.prune_seconds:
+                self._last_prune = time.monotonic()
+                try:
+                    self.store.prune()
+                except Exception as e:
+                    store_errors.inc(operation="prune")
+                    logger.warning("Session store prune failed: %s", e)
+
+
+_shared_writer: Optional[WriteBehind] = None
+_shared_lock = threading.Lock()
+
+
+def shared_writer() -> Optional[WriteBehind]:
+    """The process-wide writer over the configured store (None for "memory"), built on first use.
+
+    Every agent backend shares it, so a failover within one process sees the other's unflushed writes.
+    """
+    global _shared_writer
+    if _shared_writer is None and settings.SESSION_STORE_BACKEND != "memory":
+        with _shared_lock:
+            if _shared_writer is None:
+                _shared_writer = WriteBehind(make_session_store())
+                logger.info("Session store: %s", _shared_writer.store.name)
+    return _shared_writer
+
+
+def close() -> None:
+    """Flush pending session writes; called from the app lifespan on shutdown."""
+    if _shared_writer is not None:
+        _shared_writer.stop()
+
+
+# --- Compaction ---
+def summarize_turns(events: list, previous: str = "", max_chars: int = settings.SESSION_SUMMARY_MAX_CHARS,
+                    user_chars: int = 160, reply_chars: int = 240) -> str:
+    """Extractive summary of whole turns: each user message and the final reply, both clipped.
+
+    Tool calls and their raw results are left out; the reply already states what mattered. The
+    result keeps the most recent lines that fit in `max_chars`.
+    """
+    lines: List[str] = previous.splitlines() if previous else []
+    question, answer = None, None
+    for event in events + [None]:
+        author = getattr(event, "author", None)
+        text = _event_text(event) if event is not None else ""
+        if event is None or (author == "user" and text):
+            if question:
+                lines.append(f"- User: {_clip(question, user_chars)}")
+                if answer:
+                    lines.append(f"  Assistant: {_clip(answer, reply_chars)}")
+            question, answer = text, None
+        elif text:
+            answer = text
+    kept, size = [], 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(reversed(kept))
+
+
+def _event_text(event) -> str:
+    content = getattr(event, "content", None)
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text).strip()
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
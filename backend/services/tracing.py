@@ -0,0 +1,201 @@
+# backend/services/tracing.py – Lightweight spans, sampled structured logs and logging setup
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+from backend.services import metrics
+from config import settings
+
+span_logger = logging.getLogger("backend.trace")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class Span:
+    """One timed unit of work. Durations always feed `span_seconds`; the log line is sampled per trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attrs", "started", "duration", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        # The sampling decision is made once at the root and inherited by every child
+        self.sampled = parent.sampled if parent else random.random() < settings.TRACE_SAMPLE_RATE
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def end(self, error: Optional[BaseException] = None) -> float:
+        if self.duration is not None:
+            return self.duration
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.error = type(error).__name__
+        metrics.latency("span_seconds", "Duration of traced spans").observe(self.duration, span=self.name)
+        if self.error:
+            metrics.counter("span_errors_total", "Spans that ended with an exception").inc(span=self.name)
+        # Slow spans are always logged so tail latency is visible even at low sample rates
+        if (self.sampled or self.duration >= settings.TRACE_SLOW_SECONDS) and span_logger.isEnabledFor(logging.INFO):
+            fields = " ".join(f"{k}={v}" for k, v in self.attrs.items())
+            span_logger.info("span %s %.1fms trace=%s %s%s", self.name, self.duration * 1000, self.trace_id, fields,
+                             f" error={self.error}" if self.error else "", extra={"span": self.to_dict()})
+        return self.duration
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, **attrs) -> Span:
+    """Start a child of the current span without making it current; call `end()` when done.
+
+    For work whose start and end happen in different callbacks (LLM turns, tool callbacks).
+    """
+    return Span(name, _current.get(), **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a child of the current span. Do not hold one open across an async-generator yield."""
+    s = Span(name, _current.get(), **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.end(e)
+        raise
+    else:
+        s.end()
+    finally:
+        _current.reset(token)
+
+
+# --- Logging ---
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "span"):
+            payload["span"] = record.span
+        elif (current := _current.get()) is not None:
+            payload["trace_id"] = current.trace_id
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging() -> None:
+    """Route application logs through a queue so request handlers never block on stdout.
+
+    LOG_LEVEL controls verbosity (DEBUG shows per-tool detail), LOG_FORMAT picks "text" or "json".
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    for name in ("backend", "config"):
+        logger = logging.getLogger(name)
+        logger.setLevel(settings.LOG_LEVEL)
+        logger.addHandler(_DroppingQueueHandler(log_queue))
+        logger.propagate = False
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread (for processes that leave with os._exit)."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_logging() -> None:
+    if _listener is not None and _listener._thread is None:
+        _listener.start()
+
+
+# backend.serve forks workers after logging is configured. The listener is stopped around the fork so
+# the child never inherits its queue mid-operation, and each process then runs its own listener thread.
+os.register_at_fork(before=stop_logging, after_in_parent=_restart_logging, after_in_child=_restart_logging)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drop records instead of blocking when the log queue is full."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.counter("log_records_dropped_total", "Log records dropped because the queue was full").inc()
+
+
+# --- HTTP ---
+class TracingMiddleware:
+    """ASGI middleware: one root span per request, covering the full (possibly streamed) body."""
+
+    def __init__(self, app):
+        self.app = app
+        self.requests = metrics.counter("http_requests_total", "HTTP requests by route and status")
+        self.latency = metrics.latency("http_request_seconds", "HTTP request latency, including streamed bodies")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        with span("http_request", method=scope["method"]) as s:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # Label by route template, not raw path, to keep cardinality bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                s.set(route=route, status=status["code"])
+                self.requests.inc(method=scope["method"], route=route, status=status["code"])
+                self.latency.observe(time.perf_counter() - s.started, route=route)
@@ -0,0 +1,455 @@
+# backend/services/upstream.py – Quota-aware scheduling of upstream LLM and SerpAPI calls
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from backend.services import metrics
+from backend.services.concurrency import AgentOverloadedError
+from backend.services.deadline import DeadlineExceeded, remaining
+from config import settings
+
+# Priority classes: lower runs first when callers queue for the same upstream
+INTERACTIVE, BATCH = 0, 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+_priority: contextvars.ContextVar = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+upstream_calls = metrics.counter("upstream_calls_total", "Scheduled upstream calls by outcome")
+upstream_wait = metrics.latency("upstream_wait_seconds", "Time calls waited for an upstream slot")
+
+
+class UpstreamRateLimited(AgentOverloadedError):
+    """An upstream is rate limited (429/quota) or its queue is too long; the caller should retry later."""
+
+    def __init__(self, upstream: str, message: str, retry_after: float):
+        super().__init__(message, retry_after=max(1, math.ceil(retry_after)))
+        self.upstream = upstream
+
+
+@contextmanager
+def priority(level: int):
+    """Upstream calls made inside this block (including its tasks and threads) queue at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def raise_priority(context: contextvars.Context, level: int) -> None:
+    """Later upstream calls made from `context` queue at `level`, if that is more urgent than its own.
+
+    Used for a task shared by several requests, which should queue like the most urgent of them.
+    """
+    if level < context.get(_priority, INTERACTIVE):
+        context.run(_priority.set, level)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Provider quota/429 errors from the genai (Gemini and Vertex), google-api-core and HTTP clients.
+
+    Only structured status codes count; message text is never matched, since a wrongly detected 429
+    halves the upstream's concurrency, pauses every caller and cools the backend down.
+    """
+    if isinstance(error, UpstreamRateLimited):
+        return True
+    from google.genai.errors import APIError
+
+    if isinstance(error, APIError):
+        return error.code == 429
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+    except ImportError:
+        ResourceExhausted = ()
+    if isinstance(error, ResourceExhausted):
+        return True
+    # requests.HTTPError and httpx.HTTPStatusError carry the response
+    return getattr(getattr(error, "response", None), "status_code", None) == 429
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait: a Retry-After header or a google.rpc.RetryInfo delay."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        seconds = parse_retry_after(headers.get("Retry-After"))
+        if seconds is not None:
+            return seconds
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details)
+        for item in details.get("details", []) if isinstance(details, dict) else []:
+            delay = item.get("retryDelay") if isinstance(item, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """A Retry-After value in seconds, from either its delta-seconds or HTTP-date form."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Building blocks ---
+class TokenBucket:
+    """Requests per second with bursts; `pause` holds every caller until a Retry-After passes."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait(self, now: float) -> float:
+        """Seconds until a call may start (0 when it may start now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        # Resume at the steady rate rather than with a full burst that would trip the limit again
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+
+class AimdLimit:
+    """Concurrency limit: +1 per window of successful calls, cut multiplicatively on overload.
+
+    Overload is a 429/quota error (halves the limit) or a call slower than `latency_tolerance`
+    times the recent best latency (trims it by 10%). Cuts are spaced at least a second apart, so
+    one burst of failures counts once.
+    """
+
+    def __init__(self, minimum: int, maximum: int, latency_tolerance: float):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.latency_tolerance = latency_tolerance
+        self.value = float(self.maximum)
+        self.baseline: Optional[float] = None
+        self._cut_at = 0.0
+
+    def on_success(self, seconds: float) -> None:
+        # Slowly forgetting minimum, so a lasting shift in latency becomes the new normal
+        self.baseline = seconds if self.baseline is None else min(seconds, 0.99 * self.baseline + 0.01 * seconds)
+        if self.latency_tolerance and seconds > self.baseline * self.latency_tolerance:
+            self.cut(0.9)
+        else:
+            self.value = min(self.maximum, self.value + 1 / self.value)
+
+    def cut(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._cut_at >= 1.0:
+            self._cut_at = now
+            self.value = max(self.minimum, self.value * factor)
+
+    @property
+    def current(self) -> int:
+        return int(self.value)
+
+
+class _Waiter:
+    """One queued caller; woken from any thread when it may be next."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop]):
+        self.loop = loop
+        self.event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # loop already closed (shutdown)
+
+
+class UpstreamCall:
+    """Handle for one admitted call; `throttled()` reports a 429 that did not raise."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.retry_after: Optional[float] = None
+        self.rate_limited = False
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        self.rate_limited = True
+        self.retry_after = retry_after
+
+
+# --- Limiter ---
+class UpstreamLimiter:
+    """Admission for one provider and key: a token bucket, an AIMD concurrency limit and a priority queue.
+
+    Callers queue by priority class, then arrival. The first in line starts once a token is
+    available and fewer than the current limit are in flight. A call that would wait longer than
+    its class allows (for example while a Retry-After pause runs) fails fast with
+    UpstreamRateLimited instead of queueing, which the API turns into a 429. Works from both
+    the event loop (`call_async`) and worker threads (`call`).
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrency: int,
+                 min_concurrency: int = settings.UPSTREAM_MIN_CONCURRENCY,
+                 latency_tolerance: float = settings.UPSTREAM_LATENCY_TOLERANCE,
+                 default_retry_after: float = settings.UPSTREAM_DEFAULT_RETRY_AFTER_SECONDS,
+                 max_wait: Optional[Dict[int, float]] = None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = AimdLimit(min_concurrency, max_concurrency, latency_tolerance)
+        self.default_retry_after = default_retry_after
+        self.max_wait = max_wait or {INTERACTIVE: settings.UPSTREAM_MAX_WAIT_SECONDS,
+                                     BATCH: settings.UPSTREAM_BATCH_MAX_WAIT_SECONDS}
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self._queue: list = []  # heap of (priority, sequence, waiter)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def paused_for(self) -> float:
+        return max(0.0, self.bucket.paused_until - time.monotonic())
+
+    @contextmanager
+    def call(self):
+        """Blocking admission for worker threads; yields an UpstreamCall."""
+        level = _priority.get()
+        waiter, deadline = self._enqueue(level, None)
+        waited = time.perf_counter()
+        try:
+            while True:
+                delay = self._poll(waiter)
+                if delay is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject(level, waiter)
+                waiter.event.wait(min(delay, remaining))
+                waiter.event.clear()
+        except BaseException:
+            self._leave(waiter)
+            raise
+        upstream_wait.observe(time.perf_counter() - waited, upstream=self.name, priority=_PRIORITY_NAMES[level])
+        with self._admitted() as call:
+            yield call
+
+    @asynccontextmanager
+    async def call_async(self):
+        """Admission on the event loop; yields an UpstreamCall."""
+        level = _priority.get()
+        waiter, deadline = self._enqueue(level, asyncio.get_running_loop())
+        waited = time.perf_counter()
+        try:
+            while True:
+                delay = self._poll(waiter)
+                if delay is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject(level, waiter)
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                waiter.event.clear()
+        except BaseException:
+            self._leave(waiter)
+            raise
+        upstream_wait.observe(time.perf_counter() - waited, upstream=self.name, priority=_PRIORITY_NAMES[level])
+        with self._admitted() as call:
+            yield call
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit.current,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "paused_for": round(self.paused_for(), 3),
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+        }
+
+    # --- Internals ---
+    def _enqueue(self, level: int, loop) -> tuple:
+        max_wait = self.max_wait.get(level, self.max_wait[INTERACTIVE])
+        paused = self.paused_for()
+        if paused > max_wait:
+            self.rejected += 1
+            upstream_calls.inc(upstream=self.name, outcome="rejected")
+            raise UpstreamRateLimited(self.name, f"Upstream '{self.name}' is rate limited; retry later.", paused)
+        waiter = _Waiter(loop)
+        with self._lock:
+            heapq.heappush(self._queue, (level, next(self._sequence), waiter))
+        # Never queue past the request's own deadline
+        left = remaining()
+        return waiter, time.monotonic() + (max_wait if left is None else min(max_wait, left))
+
+    def _poll(self, waiter: _Waiter) -> Optional[float]:
+        """Admit `waiter` if it is first in line and capacity allows (None); else seconds to wait."""
+        with self._lock:
+            if self._queue[0][2] is not waiter or self.in_flight >= self.limit.current:
+                return math.inf
+            delay = self.bucket.wait(time.monotonic())
+            if delay > 0:
+                return delay
+            self.bucket.take()
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            self._wake_next()
+        return None
+
+    def _leave(self, waiter: _Waiter) -> None:
+        with self._lock:
+            entries = [entry for entry in self._queue if entry[2] is not waiter]
+            if len(entries) != len(self._queue):
+                self._queue = entries
+                heapq.heapify(self._queue)
+                self._wake_next()
+
+    def _reject(self, level: int, waiter: _Waiter) -> None:
+        self._leave(waiter)
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"The request deadline passed while waiting for '{self.name}'.")
+        self.rejected += 1
+        upstream_calls.inc(upstream=self.name, outcome="rejected")
+        raise UpstreamRateLimited(self.name, f"Upstream '{self.name}' is saturated; retry later.",
+                                  max(self.paused_for(), 1.0))
+
+    def _wake_next(self) -> None:
+        if self._queue:
+            self._queue[0][2].wake()
+
+    @contextmanager
+    def _admitted(self):
+        call = UpstreamCall()
+        try:
+            yield call
+        except Exception as e:
+            if is_rate_limit_error(e) and not isinstance(e, UpstreamRateLimited):
+                call.throttled(retry_after_of(e))
+            self._release(call, ok=False)
+            if call.rate_limited:
+                raise UpstreamRateLimited(self.name, f"Upstream '{self.name}' is rate limited: {e}",
+                                          call.retry_after or self.default_retry_after) from e
+            raise
+        except BaseException:
+            # Cancelled or closed early: free the slot without judging the upstream
+            self._release(call, ok=None)
+            raise
+        else:
+            self._release(call, ok=not call.rate_limited)
+
+    def _release(self, call: UpstreamCall, ok: Optional[bool]) -> None:
+        seconds = time.perf_counter() - call.started
+        with self._lock:
+            self.in_flight -= 1
+            if call.rate_limited:
+                self.rate_limited += 1
+                self.limit.cut(0.5)
+                self.bucket.pause(time.monotonic() + (call.retry_after or self.default_retry_after))
+            elif ok:
+                self.limit.on_success(seconds)
+            self._wake_next()
+        outcome = "rate_limited" if call.rate_limited else {True: "ok", False: "error", None: "cancelled"}[ok]
+        upstream_calls.inc(upstream=self.name, outcome=outcome)
+
+
+# --- Scheduler ---
+class UpstreamScheduler:
+    """One limiter per (provider, key), created on first use from `limits[provider]`.
+
+    Each entry may set `rate` (calls/second, 0 = unlimited), `burst` and `max_concurrency`;
+    providers without an entry use `limits["default"]`. Keys are fingerprinted, never stored.
+    `share` is this process's fraction of each quota when several worker processes use one key.
+    """
+
+    def __init__(self, limits: Dict[str, dict], share: float = 1.0):
+        self.limits = limits
+        self.share = share
+        self._limiters: Dict[str, UpstreamLimiter] = {}
+        self._lock = threading.Lock()
+
+    def set_share(self, share: float) -> None:
+        """Pace this process to `share` of every quota; limiters already created are rebuilt on next use."""
+        with self._lock:
+            self.share = share
+            self._limiters = {}
+
+    def limiter(self, provider: str, key: Optional[str] = None) -> UpstreamLimiter:
+        name = f"{provider}:{hashlib.sha256(key.encode()).hexdigest()[:8]}" if key else provider
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(name)
+                if limiter is None:
+                    config = {**self.limits.get("default", {}), **self.limits.get(provider, {})}
+                    limiter = self._limiters[name] = UpstreamLimiter(
+                        name, rate=float(config.get("rate", 0)) * self.share,
+                        burst=max(1.0, float(config.get("burst", 1)) * self.share),
+                        max_concurrency=max(1, round(int(config.get("max_concurrency", 32)) * self.share)))
+        return limiter
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in list(self._limiters.items())}
+
+
+# Shared by every agent backend and tool in this worker
+upstream_scheduler = UpstreamScheduler(settings.UPSTREAM_LIMITS)
+
+
+# --- Model integration ---
+@functools.lru_cache(maxsize=None)
+def scheduled_model_class(base: type) -> type:
+    """Subclass of an ADK model class whose every request (streamed or not) is admitted by the scheduler."""
+
+    class ScheduledModel(base):
+        upstream: str = "gemini"
+        upstream_key: Optional[str] = None
+
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            async with upstream_scheduler.limiter(self.upstream, self.upstream_key).call_async():
+                async for response in super().generate_content_async(llm_request, stream):
+                    yield response
+
+    ScheduledModel.__name__ = ScheduledModel.__qualname__ = f"Scheduled{base.__name__}"
+    return ScheduledModel
+
+
+def scheduled_gemini(model: str, provider: str, key: Optional[str] = None):
+    """An ADK Gemini model for `model` that shares the (provider, key) quota with every other caller."""
+    from google.adk.models import Gemini
+
+    return scheduled_model_class(Gemini)(model=model, upstream=provider, upstream_key=key)
@@ -0,0 +1,65 @@
+# backend/tests/conftest.py – Local fakes and fixtures shared by the test modules
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from config import settings
+from backend.tools import expense_calculator
+from backend.tools.cache import MemoryCache, SingleFlight
+from backend.tools.cost_index import CostIndex
+
+
+class FakeSerpApi:
+    """Local stand-in for serpapi.com/search that counts calls and adds fixed latency."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.snippet = "budget travelers spend about $95 per day."
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.calls += 1
+                time.sleep(fake.latency)
+                query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+                body = json.dumps({"organic_results": [
+                    {"snippet": f"{query}: {fake.snippet}"},
+                ]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def cost_index(tmp_path, monkeypatch):
+    index = CostIndex(str(tmp_path / "cost_index.sqlite3"), max_age_seconds=3600, max_entries=100)
+    monkeypatch.setattr(expense_calculator, "cost_index", index)
+    return index
+
+
+@pytest.fixture
+def serpapi(monkeypatch, cost_index):
+    fake = FakeSerpApi()
+    monkeypatch.setattr(settings, "SERPAPI_URL", fake.url)
+    monkeypatch.setattr(expense_calculator, "expense_cache", MemoryCache(ttl_seconds=60, max_entries=100))
+    monkeypatch.setattr(expense_calculator, "_inflight", SingleFlight())
+    yield fake
+    fake.close()
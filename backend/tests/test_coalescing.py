@@ -0,0 +1,139 @@
+# backend/tests/test_coalescing.py – Shared runs of identical fresh prompts and their cancellation
+
+import asyncio
+
+import pytest
+
+from backend.services import coalescing
+from backend.services.coalescing import PromptCoalescer
+from backend.services.concurrency import AgentConcurrencyLimiter
+from backend.services.deadline import DeadlineExceeded, deadline, remaining, until_deadline, within_deadline
+from backend.services.upstream import BATCH, INTERACTIVE, current_priority, priority
+
+
+class SlowRouter:
+    """Agent router stand-in whose runs take `seconds` and record whether they were cancelled."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.cancelled = 0
+
+    async def run(self, prompt: str, **kwargs):
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"plan for {prompt}", "session-1", None
+
+    async def stream(self, prompt: str, **kwargs):
+        yield {"type": "session", "session_id": "session-1"}
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        yield {"type": "final", "text": f"plan for {prompt}"}
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = AgentConcurrencyLimiter(max_concurrent=2, max_queued=0, queue_timeout=1)
+    monkeypatch.setattr(coalescing, "agent_limiter", limiter)
+    return limiter
+
+
+def test_run_is_cancelled_and_its_slot_released_when_every_caller_times_out(monkeypatch, limiter):
+    router = SlowRouter(seconds=10)
+    monkeypatch.setattr(coalescing, "agent_router", router)
+
+    async def scenario():
+        coalescer = PromptCoalescer(window_seconds=30, max_followers=10)
+
+        async def ask():
+            with deadline(0.1):
+                return await within_deadline(coalescer.run("Lisbon in May?"))
+
+        outcomes = await asyncio.gather(ask(), ask(), return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return coalescer, outcomes
+
+    coalescer, outcomes = asyncio.run(scenario())
+    assert all(isinstance(outcome, DeadlineExceeded) for outcome in outcomes)
+    assert router.cancelled == 1
+    assert limiter.stats()["in_flight"] == 0
+    # A cancelled run is not joined by later callers
+    assert not coalescer.joinable("run", "Lisbon in May?")
+
+
+def test_run_keeps_going_while_any_caller_still_follows(monkeypatch, limiter):
+    router = SlowRouter(seconds=0.3)
+    monkeypatch.setattr(coalescing, "agent_router", router)
+
+    async def scenario():
+        coalescer = PromptCoalescer(window_seconds=30, max_followers=10)
+
+        async def impatient():
+            with deadline(0.05):
+                return await within_deadline(coalescer.run("Lisbon in May?"))
+
+        return await asyncio.gather(impatient(), coalescer.run("Lisbon in May?"), return_exceptions=True)
+
+    impatient, patient = asyncio.run(scenario())
+    assert isinstance(impatient, DeadlineExceeded)
+    assert patient[0] == "plan for Lisbon in May?"
+    assert router.cancelled == 0
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_stream_is_cancelled_when_its_only_reader_leaves(monkeypatch, limiter):
+    router = SlowRouter(seconds=10)
+    monkeypatch.setattr(coalescing, "agent_router", router)
+
+    async def scenario():
+        coalescer = PromptCoalescer(window_seconds=30, max_followers=10)
+        events = []
+        with pytest.raises(DeadlineExceeded):
+            async for event in until_deadline(coalescer.stream("Porto food tour"), 0.1):
+                events.append(event)
+        await asyncio.sleep(0.05)
+        return events
+
+    assert [event["type"] for event in asyncio.run(scenario())] == ["session"]
+    assert router.cancelled == 1
+    assert limiter.stats()["in_flight"] == 0
+
+
+class ObservingRouter(SlowRouter):
+    """Records the upstream priority and time left that a run would call the model with, once it has slept."""
+
+    async def run(self, prompt: str, **kwargs):
+        result = await super().run(prompt, **kwargs)
+        self.priority, self.remaining = current_priority(), remaining()
+        return result
+
+
+def test_run_takes_the_most_urgent_priority_and_latest_deadline_of_its_callers(monkeypatch, limiter):
+    router = ObservingRouter(seconds=0.3)
+    monkeypatch.setattr(coalescing, "agent_router", router)
+
+    async def scenario():
+        coalescer = PromptCoalescer(window_seconds=30, max_followers=10)
+
+        async def batch_leader():
+            with priority(BATCH), deadline(0.1):
+                return await within_deadline(coalescer.run("Lisbon in May?"))
+
+        async def interactive_follower():
+            await asyncio.sleep(0.01)
+            with deadline(5):
+                return await within_deadline(coalescer.run("Lisbon in May?"))
+
+        return await asyncio.gather(batch_leader(), interactive_follower(), return_exceptions=True)
+
+    leader, follower = asyncio.run(scenario())
+    # The leader still gave up at its own deadline; the run went on for the follower, on the follower's terms
+    assert isinstance(leader, DeadlineExceeded)
+    assert follower[0] == "plan for Lisbon in May?" and follower[2]
+    assert router.priority == INTERACTIVE and router.remaining > 4
+    assert router.cancelled == 0
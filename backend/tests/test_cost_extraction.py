@@ -0,0 +1,79 @@
+# backend/tests/test_cost_extraction.py – Daily cost extraction from search snippets
+
+import pytest
+
+from backend.tools.cost_extraction import estimate_daily_cost, extract_costs
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Ranges, with or without the currency repeated
+    ("$80-$120 per day", [(80, 120, "USD", "day")]),
+    ("€50 to 70 a day", [(50, 70, "EUR", "day")]),
+    ("100–150 dollars daily", [(100, 150, "USD", "daily")]),
+    ("$150-100 per day", [(100, 150, "USD", "day")]),
+    # Units: per night, per person, per week/month, shorthand
+    ("Hotels run $90 per night", [(90, 90, "USD", "night")]),
+    ("Tours cost $80 per person per night", [(80, 80, "USD", "night")]),
+    ("about £60 per person", [(60, 60, "GBP", None)]),
+    ("$120/day", [(120, 120, "USD", "day")]),
+    ("$1.2k per week", [(1200, 1200, "USD", "week")]),
+    ("$2,100 per month", [(2100, 2100, "USD", "month")]),
+    ("A week in Lisbon costs €700", [(700, 700, "EUR", "week")]),
+    # Other currencies
+    ("¥12,000 per day", [(12000, 12000, "JPY", "day")]),
+    ("Rp 500000 per day", [(500000, 500000, "IDR", "day")]),
+    # Several mentions, each with its own unit
+    ("Hostels $25 a night, meals $30 daily", [(25, 25, "USD", "night"), (30, 30, "USD", "daily")]),
+    # No figures at all
+    ("No prices listed here.", []),
+    ("Spend 3 days in the old town", []),
+])
+def test_extract_costs(text, expected):
+    assert [(m.low, m.high, m.currency, m.unit) for m in extract_costs(text)] == expected
+
+
+@pytest.mark.parametrize("snippets, daily_cost, samples", [
+    (["$100 per day", "$110 per day", "$90 a day"], 100, 3),
+    # Outliers beyond a plausible daily spend (trip totals, typos) are dropped
+    (["$100 per day", "$110 per day", "$90 a day", "$5000 per day", "$1 per day"], 100, 3),
+    (["€700 per week"], 108, 1),
+    # Stated units win over bare amounts, which may be a flight or a single ticket
+    (["$100 per day", "$30"], 100, 1),
+    (["$900 round trip", "Flights from $850", "Entry $25"], 25, 1),
+    # Bare amounts are used only when no snippet states a unit
+    (["Entry $25", "Dinner $40"], 32, 2),
+])
+def test_estimate_daily_cost(snippets, daily_cost, samples):
+    estimate = estimate_daily_cost(snippets)
+    assert (estimate.daily_cost, estimate.samples) == (daily_cost, samples)
+    assert estimate.low <= estimate.daily_cost <= estimate.high
+    assert 0 < estimate.confidence <= 1
+
+
+@pytest.mark.parametrize("snippets, low, high", [
+    # A stated range is kept, not collapsed to its midpoint
+    (["$80–120 per day"], 80, 120),
+    (["€50 to 70 a day"], 54, 76),
+    (["$700-$1,050 per week"], 100, 150),
+    # Point figures spread between their quartiles
+    (["$100 per day", "$110 per day", "$90 a day"], 95, 105),
+    # Ranges and points together: quartiles of the low ends and of the high ends
+    (["$80-120 per day", "$100 per day"], 85, 115),
+])
+def test_estimate_daily_cost_range(snippets, low, high):
+    estimate = estimate_daily_cost(snippets)
+    assert (estimate.low, estimate.high) == (low, high)
+
+
+@pytest.mark.parametrize("snippets", [[], ["Nothing to see"], ["Flights from $4,500"], ["$20,000 per day"]])
+def test_estimate_daily_cost_without_plausible_figures(snippets):
+    assert estimate_daily_cost(snippets) is None
+
+
+def test_confidence_grows_with_agreement_and_falls_with_spread():
+    agreeing = estimate_daily_cost(["$100 per day", "$102 per day", "$98 per day", "$101 per day"])
+    scattered = estimate_daily_cost(["$40 per day", "$100 per day", "$250 per day", "$400 per day"])
+    unitless = estimate_daily_cost(["$100", "$102", "$98", "$101"])
+    assert agreeing.confidence > scattered.confidence
+    # Bare amounts count for half
+    assert unitless.confidence == pytest.approx(agreeing.confidence / 2, abs=0.01)
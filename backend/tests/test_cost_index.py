@@ -0,0 +1,52 @@
+# backend/tests/test_cost_index.py – Destination cost index: seeding and refresh
+
+from types import SimpleNamespace
+
+from backend.tools import expense_calculator
+from backend.tools.cache import MemoryCache
+from backend.tools.cost_index import CostIndexRefresher
+
+
+def _refresher(index, **kwargs) -> CostIndexRefresher:
+    return CostIndexRefresher(index, lookup=expense_calculator._refresh_lookup, interval_seconds=60,
+                              refresh_after_seconds=3600, batch_size=1, pause_seconds=0, **kwargs)
+
+
+def test_refresher_fills_in_seed_destinations_missing_from_the_index(serpapi, cost_index):
+    cost_index.add_alias("NYC", "New York")
+    cost_index.upsert("New York", 180)
+    refresher = _refresher(cost_index, seed_destinations=["Paris", "nyc", "Rome"])
+    assert cost_index.missing(refresher.seed_destinations) == ["Paris", "Rome"]
+
+    # One paced batch at a time, back to back until every seed is in, then the regular interval
+    assert refresher.refresh_once() == 1
+    assert refresher._next_delay(1) == refresher.pause_seconds
+    assert refresher.refresh_once() == 1
+    assert refresher._next_delay(1) == refresher.interval_seconds
+    assert cost_index.missing(refresher.seed_destinations) == []
+    assert cost_index.get("Rome")["source"] == "serpapi"
+    assert serpapi.calls == 2
+
+    # Once seeded, a request is answered from the index without going upstream
+    assert expense_calculator.get_estimated_expense("Paris")["status"] == "success"
+    assert serpapi.calls == 2
+
+
+def test_seed_fetches_every_missing_destination_at_once(serpapi, cost_index):
+    cost_index.upsert("Lisbon", 110)
+    refresher = _refresher(cost_index)
+
+    assert refresher.seed(["Lisbon", "Porto", "Seville"]) == 2
+    assert serpapi.calls == 2
+    assert refresher.seed(["Porto"]) == 0
+
+
+def test_refreshed_llm_estimates_are_not_labelled_as_search_data(serpapi, cost_index, monkeypatch):
+    serpapi.snippet = "Plan ahead and book your hotel early."
+    model = SimpleNamespace(generate_content=lambda prompt, **kwargs: SimpleNamespace(text="About $140 per day."))
+    monkeypatch.setattr(expense_calculator, "_fallback_model", model)
+    monkeypatch.setattr(expense_calculator, "llm_estimate_cache", MemoryCache(ttl_seconds=60, max_entries=10))
+
+    assert _refresher(cost_index).seed(["Reykjavik"]) == 1
+    entry = cost_index.get("Reykjavik")
+    assert (entry["daily_cost"], entry["source"]) == (140, "llm")
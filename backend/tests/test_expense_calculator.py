@@ -0,0 +1,46 @@
+# backend/tests/test_expense_calculator.py – Expense lookups: the LLM fallback for snippets without figures
+
+from types import SimpleNamespace
+
+from backend.tools import expense_calculator
+from backend.tools.cache import MemoryCache
+
+
+class FakeModel:
+    """GenerativeModel stand-in recording prompts and the request options they were sent with."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = []
+
+    def generate_content(self, prompt, request_options=None):
+        self.calls.append((prompt, request_options))
+        return SimpleNamespace(text=self.text)
+
+
+def test_snippets_without_figures_fall_back_to_a_memoized_llm_estimate(serpapi, monkeypatch):
+    serpapi.snippet = "Plan ahead and book your hotel early."
+    model = FakeModel("Expect to spend about $140 per day.")
+    # The fallback used to call generate_content on the model name, a plain string, and always failed
+    monkeypatch.setattr(expense_calculator, "_fallback_model", model)
+    monkeypatch.setattr(expense_calculator, "llm_estimate_cache", MemoryCache(ttl_seconds=60, max_entries=10))
+
+    result = expense_calculator.get_estimated_expense("Reykjavik")
+    assert result["status"] == "success" and result["daily_cost"] == 140
+    assert "cost_range" not in result
+    assert expense_calculator.cost_index.get("Reykjavik")["source"] == "llm"
+    prompt, options = model.calls[0]
+    assert "Reykjavik" in prompt and options["timeout"] > 0
+
+    # A later miss for the same destination reuses the answer instead of asking again
+    expense_calculator._lookup_expense("reykjavik ")
+    assert len(model.calls) == 1 and serpapi.calls == 2
+
+
+def test_no_figure_anywhere_is_reported_as_an_error(serpapi, monkeypatch):
+    serpapi.snippet = "Plan ahead and book your hotel early."
+    monkeypatch.setattr(expense_calculator, "_fallback_model", FakeModel("It depends on your travel style."))
+    monkeypatch.setattr(expense_calculator, "llm_estimate_cache", MemoryCache(ttl_seconds=60, max_entries=10))
+
+    result = expense_calculator.get_estimated_expense("Reykjavik")
+    assert result == {"status": "error", "message": "Could not determine travel cost for Reykjavik."}
@@ -0,0 +1,58 @@
+# backend/tests/test_response_cache.py – Exact and near-duplicate answers for fresh prompts
+
+import time
+
+import pytest
+
+from backend.services.response_cache import ResponseCache
+
+PROMPT = "What is the best time to visit Japan?"
+
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache(ttl_seconds=60, max_entries=3, semantic=True, threshold=0.3)
+    cache.set(PROMPT, "Spring or autumn.")
+    return cache
+
+
+@pytest.mark.parametrize("prompt, hit", [
+    # Case, punctuation and spacing are normalized away
+    ("what is the best time to visit   JAPAN", "exact"),
+    # Rephrasings that name the same key terms
+    ("When should I visit Japan?", "semantic"),
+    ("Best time to go to Japan", "semantic"),
+    # Similar wording but another destination, month or budget: the key terms differ
+    ("What is the best time to visit Kyoto?", None),
+    ("Best time to visit Japan in winter", None),
+    ("Japan budget", None),
+])
+def test_hits_only_prompts_with_the_same_key_terms(cache, prompt, hit):
+    answer = cache.get(prompt)
+    assert answer == ("Spring or autumn." if hit else None)
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (
+        int(hit == "exact"), int(hit == "semantic"), int(hit is None))
+
+
+def test_near_duplicates_need_semantic_matching_turned_on():
+    cache = ResponseCache(ttl_seconds=60, max_entries=3, semantic=False, threshold=0.3)
+    cache.set(PROMPT, "Spring or autumn.")
+    assert cache.get("When should I visit Japan?") is None
+    assert cache.get(PROMPT.upper()) == "Spring or autumn."
+
+
+def test_entries_expire_and_the_least_recently_used_is_evicted(cache):
+    for city in ("Rome", "Oslo"):
+        cache.set(f"Best time to visit {city}?", city)
+    cache.get(PROMPT)
+    cache.set("Best time to visit Lima?", "Lima")
+    # Rome was the least recently used of the three
+    assert cache.get("Best time to visit Rome?") is None
+    assert cache.get(PROMPT) == "Spring or autumn." and cache.stats()["entries"] == 3
+
+    short = ResponseCache(ttl_seconds=0.05, max_entries=3, semantic=True, threshold=0.3)
+    short.set(PROMPT, "Spring or autumn.")
+    time.sleep(0.1)
+    assert short.get(PROMPT) is None and short.get("When should I visit Japan?") is None
+    assert short.stats()["entries"] == 0
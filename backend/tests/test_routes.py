@@ -0,0 +1,226 @@
+# backend/tests/test_routes.py – HTTP behaviour of the travel routes, against a stand-in agent router
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config import settings
+from backend.main import app
+from backend.routes import travel
+from backend.services import batch, coalescing, metrics
+from backend.services.coalescing import PromptCoalescer
+from backend.services.concurrency import AgentConcurrencyLimiter
+from backend.services.response_cache import ResponseCache
+
+
+class FakeRouter:
+    """Answers every prompt at once and counts runs; `fail` makes streams break after their first text."""
+
+    def __init__(self):
+        self.runs = 0
+        self.fail = None
+        # Prompts whose runs never finish in time
+        self.slow = set()
+
+    async def run(self, prompt: str, session_id: str = None):
+        self.runs += 1
+        if prompt in self.slow:
+            await asyncio.sleep(30)
+        return f"plan for {prompt}", session_id or f"session-{self.runs}", {"turns": 1}
+
+    async def stream(self, prompt: str, session_id: str = None):
+        self.runs += 1
+        yield {"type": "session", "session_id": session_id or f"session-{self.runs}", "backend": "fake"}
+        yield {"type": "text", "text": "Spring "}
+        if self.fail is not None:
+            raise self.fail
+        yield {"type": "tool_call", "name": "get_estimated_expense", "args": {"destination": prompt}}
+        yield {"type": "tool_result", "name": "get_estimated_expense", "result": {"daily_cost": 95}}
+        yield {"type": "final", "text": "Spring is best."}
+
+    def retry_after(self) -> float:
+        return 0.0
+
+
+def _use_limiter(monkeypatch, limiter: AgentConcurrencyLimiter) -> AgentConcurrencyLimiter:
+    for module in (travel, coalescing, batch):
+        monkeypatch.setattr(module, "agent_limiter", limiter)
+    return limiter
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    router = FakeRouter()
+    coalescer = PromptCoalescer(window_seconds=5, max_followers=100)
+    for module in (travel, coalescing, batch):
+        monkeypatch.setattr(module, "agent_router", router)
+    for module in (travel, batch):
+        monkeypatch.setattr(module, "prompt_coalescer", coalescer)
+    _use_limiter(monkeypatch, AgentConcurrencyLimiter(max_concurrent=4, max_queued=4, queue_timeout=1))
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    return router
+
+
+@pytest.fixture
+def client():
+    # No lifespan: the agent is never built, and the cost index refresher never starts
+    return TestClient(app)
+
+
+def test_requests_beyond_agent_capacity_get_429_with_retry_after(agent, client, monkeypatch):
+    assert client.post("/travel-plan", json={"prompt": "Rome in May?"}).status_code == 200
+
+    limiter = _use_limiter(monkeypatch, AgentConcurrencyLimiter(max_concurrent=0, max_queued=0, queue_timeout=1))
+    for path in ("/travel-plan", "/travel-plan/stream"):
+        response = client.post(path, json={"prompt": "Oslo in June?"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+    # The stream is refused before it starts, so only the plain request reached the limiter
+    assert limiter.stats()["rejected"] == 1
+    assert agent.runs == 1
+
+
+def _frames(body: str) -> list:
+    """(event, data) for each Server-Sent Event in a response body."""
+    frames = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        frames.append((fields["event"], json.loads(fields["data"])))
+    return frames
+
+
+def test_stream_sends_session_first_and_final_last(agent, client):
+    response = client.post("/travel-plan/stream", json={"prompt": "Lisbon in May?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    frames = _frames(response.text)
+    assert [event for event, _ in frames] == ["session", "text", "tool_call", "tool_result", "final"]
+    assert all(data["type"] == event for event, data in frames)
+    assert frames[0][1]["session_id"] == "session-1"
+    assert frames[-1][1]["text"] == "Spring is best."
+
+
+def test_stream_failure_mid_run_ends_with_an_error_frame(agent, client):
+    agent.fail = RuntimeError("tool exploded")
+    frames = _frames(client.post("/travel-plan/stream", json={"prompt": "Lisbon in May?"}).text)
+
+    assert [event for event, _ in frames] == ["session", "text", "error"]
+    assert frames[-1][1] == {"type": "error", "message": "Error during agent execution: tool exploded"}
+
+
+def test_batch_over_the_item_limit_is_rejected_with_413(agent, client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/travel-plan/batch", json={"prompts": [{"prompt": f"City {i}?"} for i in range(3)]})
+
+    assert response.status_code == 413
+    assert agent.runs == 0
+
+
+def test_batch_streams_ndjson_and_runs_duplicates_once(agent, client):
+    prompts = [{"prompt": "Rome in May?"}, {"prompt": "Oslo in June?"}, {"prompt": "  rome in MAY? "}]
+    response = client.post("/travel-plan/batch?stream=true", json={"prompts": prompts})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    items = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+    assert [item["index"] for item in items] == [0, 1, 2]
+    assert agent.runs == 2
+    # The duplicate shares the answer; only the first of the pair owns the session
+    assert items[2]["response"] == items[0]["response"] == "plan for Rome in May?"
+    assert items[0]["session_id"] and items[2]["session_id"] is None
+    assert not any(item["error"] for item in items)
+
+    # Without ?stream the same results come back as one JSON body, in input order
+    results = client.post("/travel-plan/batch", json={"prompts": prompts}).json()["results"]
+    assert [item["index"] for item in results] == [0, 1, 2]
+
+
+def test_batch_fetches_each_destination_its_prompts_name_once(agent, client, serpapi, cost_index, monkeypatch):
+    monkeypatch.setattr(settings, "COST_INDEX_SEED_DESTINATIONS", ["Rome", "Paris", "Oslo"])
+    cost_index.add_alias("NYC", "New York")
+    cost_index.upsert("New York", 180)
+    cost_index.max_age_seconds = 0
+    prompts = ["Rome in May?", "Best food in rome", "Paris with kids", "NYC on a budget", "Somewhere warm"]
+    response = client.post("/travel-plan/batch", json={"prompts": [{"prompt": p} for p in prompts]})
+
+    assert response.status_code == 200 and agent.runs == 5
+    # Rome once for both prompts, Paris, and the stale index entry behind the NYC alias
+    assert serpapi.calls == 3
+    assert cost_index.missing(["Rome", "Paris", "Oslo"]) == ["Oslo"]
+
+
+class QuickFallback:
+    def __init__(self, text):
+        self.text = text
+
+    async def answer(self, prompt, fresh=True):
+        return self.text
+
+
+def test_slow_batch_prompt_gets_the_fallback_without_holding_up_the_others(agent, client, monkeypatch):
+    monkeypatch.setattr(settings, "AGENT_DEADLINE_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "FALLBACK_MODEL", None)
+    agent.slow.add("Oslo in June?")
+    prompts = [{"prompt": "Oslo in June?"}, {"prompt": "Rome in May?"}]
+
+    monkeypatch.setattr(batch, "fallback_planner", QuickFallback(None))
+    lines = client.post("/travel-plan/batch?stream=true", json={"prompts": prompts}).text.splitlines()
+    items = [json.loads(line) for line in lines]
+    # The quick prompt streams first; the slow one reports a timeout instead of stalling the batch
+    assert [item["index"] for item in items] == [1, 0]
+    assert items[1]["error"] == "No travel plan could be made in time, please retry."
+
+    monkeypatch.setattr(batch, "fallback_planner", QuickFallback("Go in summer."))
+    results = client.post("/travel-plan/batch", json={"prompts": prompts}).json()["results"]
+    assert results[0]["response"] == "Go in summer." and results[0]["degraded"] is True
+    assert results[1]["response"] == "plan for Rome in May?" and not results[1]["degraded"]
+
+
+def test_repeated_fresh_prompts_are_answered_from_the_response_cache(agent, client, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    # Otherwise bypassing callers would join the first run, still within its coalescing window
+    monkeypatch.setattr(settings, "PROMPT_COALESCE_ENABLED", False)
+    monkeypatch.setattr(travel, "response_cache", ResponseCache(ttl_seconds=60, max_entries=10, semantic=True,
+                                                                threshold=0.3))
+    first = client.post("/travel-plan", json={"prompt": "Best time to visit Japan?"}).json()
+    again = client.post("/travel-plan", json={"prompt": "When should I visit Japan?"}).json()
+    assert not first["cached"] and again["cached"] and again["response"] == first["response"]
+    assert again["session_id"] is None
+    frames = _frames(client.post("/travel-plan/stream", json={"prompt": "best time to visit JAPAN"}).text)
+    assert frames == [("final", {"type": "final", "text": first["response"], "cached": True})]
+    assert agent.runs == 1
+
+    # Another destination, a bypass header or a follow-up in a session goes to the agent
+    client.post("/travel-plan", json={"prompt": "Best time to visit Kyoto?"})
+    client.post("/travel-plan", json={"prompt": "Best time to visit Japan?"}, headers={"X-Cache-Bypass": "1"})
+    client.post("/travel-plan", json={"prompt": "Best time to visit Japan?"}, headers={"Cache-Control": "no-cache"})
+    client.post("/travel-plan", json={"prompt": "Best time to visit Japan?", "session_id": first["session_id"]})
+    assert agent.runs == 5
+
+
+def test_metrics_exposition_groups_families_and_escapes_label_values(client, monkeypatch):
+    parser = pytest.importorskip("prometheus_client.parser")
+    odd = 'say "hi"\\ \nbye'
+    monkeypatch.setattr(metrics, "registry", dict(metrics.registry))
+    metrics.counter("test_odd_labels_total", "Label values\nneeding escapes").inc(name=odd)
+
+    def interleaved():
+        for cache in ("a", "b"):
+            yield "test_cache_hits_total", "counter", {"cache": cache}, 1
+            yield "test_cache_entries", "gauge", {"cache": cache}, 2
+
+    monkeypatch.setattr(metrics, "collectors", metrics.collectors + [interleaved])
+    response = client.get("/metrics")
+    assert response.status_code == 200
+
+    families = list(parser.text_string_to_metric_families(response.text))
+    names = [family.name for family in families]
+    # A family split into several groups comes back from the parser as several families
+    assert len(names) == len(set(names))
+    by_name = {family.name: family for family in families}
+    assert [s.labels["cache"] for s in by_name["test_cache_hits"].samples] == ["a", "b"]
+    assert [s.labels["cache"] for s in by_name["test_cache_entries"].samples] == ["a", "b"]
+    assert by_name["test_odd_labels"].samples[0].labels == {"name": odd}
@@ -0,0 +1,554 @@
+# backend/tests/test_services.py – Service and tool tests against local fakes
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from google.genai.errors import ClientError
+
+from config import settings
+from backend.services import coalescing
+from backend.services.coalescing import PromptCoalescer
+from backend.services.agent_core import BackendStats
+from backend.services.backend_router import BackendRouter
+from backend.services.context_budget import ContextBudget, InstructionCache, shrink_result
+from backend.services.deadline import DeadlineExceeded, deadline, until_deadline, within_deadline
+from backend.services.fallback import FallbackPlanner
+from backend.services.session_manager import SUMMARY_MARKER, USER_ID, SessionManager
+from backend.services.session_store import RedisSessionStore, SqliteSessionStore, WriteBehind, make_session_store
+from backend.services.upstream import (BATCH, INTERACTIVE, UpstreamLimiter, UpstreamRateLimited, UpstreamScheduler,
+                                       is_rate_limit_error, priority, raise_priority)
+from backend.tools import expense_calculator
+from backend.tools.cache import MemoryCache
+from backend.tools.cost_index import CostIndex
+from backend.tools.parallel import ParallelToolExecutor
+from backend.tools.trip_cost import LegSpec, TripCostTable, TripLeg, get_trip_cost
+
+
+class FakeRedis:
+    """In-process stand-in for the subset of the redis-py client the session store uses."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: v if isinstance(v, bytes) else str(v).encode()
+                                                 for k, v in mapping.items()})
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+
+def _turn(session, text: str) -> None:
+    from google.adk.events import Event
+    from google.genai import types
+
+    session.events.append(Event(author="user", content=types.Content(role="user", parts=[types.Part(text=text)])))
+    session.events.append(Event(author="TravelPlanner", content=types.Content(
+        role="model", parts=[types.Part(text=f"Answer about {text}. " + "details " * 80)])))
+
+
+def test_expense_lookup_is_cached_per_destination(serpapi):
+    started = time.perf_counter()
+    first = expense_calculator.get_estimated_expense("Paris")
+    cold = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(20):
+        assert expense_calculator.get_estimated_expense(" paris ")["daily_cost"] == first["daily_cost"]
+    warm = (time.perf_counter() - started) / 20
+
+    assert first["status"] == "success"
+    assert serpapi.calls == 1
+    assert expense_calculator.cost_index.hits == 20
+    assert warm < cold / 10
+
+
+def test_concurrent_expense_lookups_are_coalesced(serpapi):
+    serpapi.latency = 0.3
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(expense_calculator.get_estimated_expense, ["Tokyo"] * 10))
+
+    assert all(r["status"] == "success" for r in results)
+    assert serpapi.calls == 1
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_multi_city_tool_calls_run_concurrently(serpapi):
+    serpapi.latency = 0.3
+    cities = ["Paris", "Rome", "Lisbon", "Prague"]
+    calls = [SimpleNamespace(name="get_estimated_expense", args={"destination": c}) for c in cities]
+
+    async def turn():
+        executor = ParallelToolExecutor({"get_estimated_expense": expense_calculator.get_estimated_expense}, timeout=5)
+        executor.start("turn-1", calls)
+        return [await executor.result("turn-1", call.name, call.args) for call in calls]
+
+    started = time.perf_counter()
+    results = asyncio.run(turn())
+    elapsed = time.perf_counter() - started
+
+    assert [r["destination"] for r in results] == cities
+    assert serpapi.calls == 4
+    assert elapsed < 0.3 * 2
+
+
+def test_turn_deadline_returns_partial_results():
+    async def slow(destination):
+        await asyncio.sleep(5)
+
+    async def fast():
+        return {"current_time": "now"}
+
+    async def turn():
+        executor = ParallelToolExecutor({"slow": slow, "fast": fast}, timeout=0.2)
+        executor.start("turn-1", [SimpleNamespace(name="slow", args={"destination": "Oslo"}),
+                                  SimpleNamespace(name="fast", args={})])
+        return (await executor.result("turn-1", "slow", {"destination": "Oslo"}),
+                await executor.result("turn-1", "fast", {}),
+                await executor.result("turn-1", "unknown", {}))
+
+    slow_result, fast_result, not_started = asyncio.run(turn())
+    assert slow_result["status"] == "timeout"
+    assert fast_result == {"current_time": "now"}
+    assert not_started is None
+
+
+def test_trip_cost_breakdown_and_what_if(serpapi):
+    legs = [{"destination": "Paris", "days": 3, "travelers": 2},
+            {"destination": "Rome", "days": 2, "tier": "budget"}]
+    result = asyncio.run(get_trip_cost(legs, day_options=[-1, 0, 1], tier_options=["budget", "mid"]))
+
+    paris, rome = result["legs"]
+    assert result["status"] == "success"
+    assert paris["cost"] == round(95 * 3 * 1.75)
+    assert rome["cost"] == round(95 * 0.6 * 2)
+    assert result["total_cost"] == paris["cost"] + rome["cost"]
+    assert result["what_if"]["variants"] == 6 ** 2
+    cheapest = result["what_if"]["cheapest"][0]
+    assert [leg["tier"] for leg in cheapest["legs"]] == ["budget", "budget"]
+    assert [leg["days"] for leg in cheapest["legs"]] == [2, 1]
+    assert serpapi.calls == 2
+
+
+def test_trip_cost_tool_declares_every_leg_field(serpapi):
+    from google.adk.tools import FunctionTool
+
+    legs = FunctionTool(func=get_trip_cost)._get_declaration().parameters.properties["legs"]
+    # Gemini rejects OBJECT schemas without properties, which would fail every api_key-mode request
+    assert legs.type == "ARRAY" and legs.items.type == "OBJECT"
+    assert set(legs.items.properties) == {"destination", "days", "travelers", "tier"}
+
+    # ADK may hand the legs over as validated models as well as plain dicts
+    result = asyncio.run(get_trip_cost([LegSpec(destination="Paris", days=2), {"destination": "Rome", "days": 1}]))
+    assert [leg["days"] for leg in result["legs"]] == [2, 1]
+
+
+def test_trip_cost_table_prices_variant_grid_in_bulk():
+    legs = [TripLeg("A", 5), TripLeg("B", 4), TripLeg("C", 3, travelers=3), TripLeg("D", 2, tier="luxury")]
+    table = TripCostTable(legs, {"a": 100, "b": 80, "c": 60, "d": 200})
+    days, tiers = table.variant_grid([-1, 0, 1, 2], ["budget", "mid", "luxury"])
+    totals = table.leg_costs(days, tiers).sum(axis=1)
+
+    assert totals.shape == (12 ** 4,)
+    base = (days == table.days).all(axis=1) & (tiers == table.tiers).all(axis=1)
+    assert totals[base][0] == table.total()
+
+
+def test_cost_index_answers_aliases_and_refreshes_stale_entries(serpapi, cost_index, tmp_path, monkeypatch):
+    cost_index.add_alias("NYC", "New York")
+    first = expense_calculator.get_estimated_expense("New York")
+    assert expense_calculator.get_estimated_expense("nyc")["daily_cost"] == first["daily_cost"]
+    assert serpapi.calls == 1
+
+    exported = cost_index.export()
+    shipped = CostIndex(str(tmp_path / "shipped.sqlite3"), max_age_seconds=3600, max_entries=100)
+    assert shipped.import_(exported) == 1
+    assert shipped.get("NYC")["daily_cost"] == first["daily_cost"]
+
+    # Past max age the entry is refreshed upstream instead of being served
+    cost_index.max_age_seconds = 0
+    monkeypatch.setattr(expense_calculator, "expense_cache", MemoryCache(ttl_seconds=60, max_entries=100))
+    expense_calculator.get_estimated_expense("New York")
+    assert serpapi.calls == 2
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "redis"])
+def test_session_history_is_shared_between_workers(backend, tmp_path):
+    from google.adk.sessions import InMemorySessionService
+
+    if backend == "sqlite":
+        store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl_seconds=60)
+    else:
+        store = RedisSessionStore(FakeRedis(), ttl_seconds=60)
+    workers = []
+    for _ in range(2):
+        service = InMemorySessionService()
+        workers.append((service, SessionManager(service, app_name="TravelPlanner", writer=WriteBehind(store))))
+
+    (service_a, worker_a), (service_b, worker_b) = workers
+    session_id = worker_a.open()
+    _turn(service_a.sessions["TravelPlanner"][USER_ID][session_id], "Lisbon in May")
+    worker_a.release(session_id)
+    # Nothing is written on the request path; the write-behind batch carries it
+    assert store.load(f"TravelPlanner:{session_id}") is None
+    worker_a.writer.flush()
+
+    worker_b.open(session_id)
+    events = service_b.sessions["TravelPlanner"][USER_ID][session_id].events
+    assert [e.content.parts[0].text for e in events][0] == "Lisbon in May"
+    assert worker_b.stats()["restores"] == 1
+
+    # A follow-up on worker B is picked up when the caller lands on worker A again
+    _turn(service_b.sessions["TravelPlanner"][USER_ID][session_id], "and Porto?")
+    worker_b.release(session_id)
+    worker_b.writer.flush()
+    worker_a.open(session_id)
+    assert len(service_a.sessions["TravelPlanner"][USER_ID][session_id].events) == 4
+
+
+def test_trimmed_history_is_compacted_into_a_summary():
+    from google.adk.sessions import InMemorySessionService
+
+    service = InMemorySessionService()
+    manager = SessionManager(service, app_name="TravelPlanner", max_history_events=4, summary_max_chars=1000)
+    session_id = manager.open()
+    session = service.sessions["TravelPlanner"][USER_ID][session_id]
+    for city in ("Rome", "Oslo", "Kyoto", "Lima"):
+        _turn(session, city)
+        manager.release(session_id)
+
+    summary, *recent = session.events
+    assert summary.custom_metadata == {SUMMARY_MARKER: True}
+    text = summary.content.parts[0].text
+    assert "User: Rome" in text and "User: Oslo" in text and len(text) < 1100
+    assert [e.content.parts[0].text for e in recent if e.author == "user"] == ["Kyoto", "Lima"]
+    assert manager.stats()["compactions"] == 2
+
+
+class CountingRouter:
+    """Agent router stand-in: one slow run per call, streamed as a few text chunks."""
+
+    def __init__(self):
+        self.runs = 0
+
+    async def run(self, prompt, session_id=None):
+        self.runs += 1
+        await asyncio.sleep(0.05)
+        return f"plan for {prompt}", f"session-{self.runs}", {"turns": 1}
+
+    async def stream(self, prompt, session_id=None):
+        self.runs += 1
+        yield {"type": "session", "session_id": f"session-{self.runs}", "backend": "fake"}
+        for word in ("best", "time", "is", "spring"):
+            await asyncio.sleep(0.01)
+            yield {"type": "text", "text": word}
+        yield {"type": "final", "text": "best time is spring"}
+
+
+def test_identical_fresh_prompts_share_one_agent_run(monkeypatch):
+    router = CountingRouter()
+    monkeypatch.setattr(coalescing, "agent_router", router)
+
+    async def scenario():
+        coalescer = PromptCoalescer(window_seconds=5, max_followers=100)
+        answers = await asyncio.gather(*(coalescer.run("Best time to visit Japan?") for _ in range(20)),
+                                       coalescer.run("best time to visit  JAPAN"))
+
+        async def collect():
+            return [event async for event in coalescer.stream("Best time to visit Japan?")]
+
+        streams = await asyncio.gather(*(collect() for _ in range(5)))
+        return coalescer, answers, streams
+
+    coalescer, answers, streams = asyncio.run(scenario())
+    assert router.runs == 2 and coalescer.runs_saved == 24
+    assert {text for text, *_ in answers} == {"plan for Best time to visit Japan?"}
+    # Only the caller that started the run owns its session and the usage it incurred
+    assert [(session_id, usage) for _, session_id, _, usage in answers if session_id] == [("session-1", {"turns": 1})]
+    leader, *followers = streams
+    assert [e["type"] for e in leader] == ["session", "text", "text", "text", "text", "final"]
+    for events in followers:
+        assert [e["type"] for e in events] == ["text", "text", "text", "text", "final"]
+        assert events[-1]["coalesced"] is True
+
+
+def test_context_budget_trims_old_turns_clips_tools_and_caches_instruction():
+    from google.adk.models.llm_request import LlmRequest
+    from google.genai import types
+
+    def user(text):
+        return types.Content(role="user", parts=[types.Part(text=text)])
+
+    def model(text):
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    call = types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+        name="get_estimated_expense", args={"destination": "Oslo"}))])
+    response = types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+        name="get_estimated_expense", response={"daily_cost": 180, "notes": "x" * 2000}))])
+    contents = [user("Rome? " * 200), model("Spring. " * 200), user("Oslo?"), call, response, model("Summer.")]
+    request = LlmRequest(model="gemini-2.0-flash", contents=list(contents),
+                         config=types.GenerateContentConfig(system_instruction="Plan trips. " * 1500))
+
+    created = []
+    client = SimpleNamespace(caches=SimpleNamespace(
+        create=lambda model, config: created.append(config) or SimpleNamespace(name="cachedContents/abc")))
+    cache = InstructionCache(lambda: client, min_tokens=1000, ttl_seconds=600)
+    budget = ContextBudget(max_prompt_tokens=5200, max_output_tokens=512, max_tool_result_chars=500,
+                           instruction_cache=cache)
+
+    fitted = budget.fit_request(request)
+    # The Rome turn is dropped; the Oslo turn is kept whole, tool call and response included
+    assert request.contents == contents[2:] and fitted["trimmed"] == 2
+    assert request.config.max_output_tokens == 512
+    # The first request goes out uncached while the cache is created in the background
+    assert fitted["cached_tokens"] == 0 and request.config.system_instruction
+    for _ in range(100):
+        retry = LlmRequest(model="gemini-2.0-flash", contents=[user("Oslo?")],
+                           config=types.GenerateContentConfig(system_instruction="Plan trips. " * 1500))
+        if budget.fit_request(retry)["cached_tokens"]:
+            break
+        time.sleep(0.01)
+    assert retry.config.cached_content == "cachedContents/abc" and retry.config.system_instruction is None
+    assert len(created) == 1
+
+    clipped = shrink_result({"status": "success", "legs": [{"note": "y" * 900}] * 40}, 500)
+    assert clipped["truncated"] and clipped["status"] == "success" and len(json.dumps(clipped)) <= 500
+
+
+def test_upstream_limiter_prioritizes_interactive_calls_and_backs_off_on_429():
+    limiter = UpstreamLimiter("test", rate=0, burst=1, max_concurrency=4, min_concurrency=1, latency_tolerance=0,
+                              default_retry_after=0.3, max_wait={INTERACTIVE: 2, BATCH: 2})
+    limiter.limit.value = 1
+    order = []
+
+    def call(level, name):
+        with priority(level), limiter.call():
+            order.append(name)
+
+    with limiter.call():
+        batch = threading.Thread(target=call, args=(BATCH, "batch"))
+        batch.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=call, args=(INTERACTIVE, "interactive"))
+        interactive.start()
+        time.sleep(0.05)
+        assert limiter.stats()["queued"] == 2
+    batch.join()
+    interactive.join()
+    # The batch call queued first, but the interactive one was admitted ahead of it
+    assert order == ["interactive", "batch"]
+
+    # Only structured 429s count, never an error that merely mentions one
+    assert not is_rate_limit_error(ClientError(400, {"error": {"code": 400, "message": "quota_project 4291 invalid"}}))
+    assert not is_rate_limit_error(RuntimeError("429 RESOURCE_EXHAUSTED"))
+
+    limiter.limit.value = 4
+    with pytest.raises(UpstreamRateLimited):
+        with limiter.call():
+            raise ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded"}})
+    # One 429 halves the concurrency limit and holds every caller for the Retry-After
+    assert limiter.stats()["limit"] == 2 and limiter.stats()["rate_limited"] == 1
+    started = time.monotonic()
+    with limiter.call():
+        pass
+    assert time.monotonic() - started >= 0.25
+
+    with limiter.call() as upstream_call:
+        upstream_call.throttled(retry_after=30)
+    # A pause longer than the caller may queue is refused at once, with the provider's delay
+    started = time.monotonic()
+    with pytest.raises(UpstreamRateLimited) as refused:
+        with limiter.call():
+            pass
+    assert time.monotonic() - started < 0.1 and refused.value.retry_after >= 29
+
+
+class SleepyBackend:
+    """Agent backend stand-in whose runs take `seconds`; records opened and discarded sessions."""
+
+    def __init__(self, name, seconds):
+        self.name = name
+        self.seconds = seconds
+        self.stats = BackendStats(name)
+        self.discarded = []
+
+    def owns_session(self, session_id):
+        return False
+
+    def discard_session(self, session_id):
+        self.discarded.append(session_id)
+
+    @asynccontextmanager
+    async def session(self, session_id=None):
+        yield session_id or f"{self.name}-session"
+
+    async def run(self, prompt, session_id):
+        await asyncio.sleep(self.seconds)
+        return f"{self.name} plan", None
+
+    async def stream(self, prompt, session_id):
+        await asyncio.sleep(self.seconds)
+        yield {"type": "final", "text": f"{self.name} plan"}
+
+
+def test_slow_fresh_runs_are_hedged_on_the_next_backend(monkeypatch):
+    monkeypatch.setattr(settings, "AGENT_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(settings, "AGENT_HEDGE_MAX_RATIO", 1.0)
+    slow, fast = SleepyBackend("hedge-slow", 5), SleepyBackend("hedge-fast", 0.01)
+    for _ in range(5):
+        slow.stats.latency.observe(0.05)
+    router = BackendRouter([slow, fast], weights={}, mode="failover")
+
+    started = time.monotonic()
+    text, session_id, _ = asyncio.run(router.run("Best time to visit Lisbon?"))
+    # The primary passed its p95 (0.05s), so the hedge ran and answered first; the slow run was abandoned
+    assert text == "hedge-fast plan" and session_id == "hedge-fast-session"
+    assert time.monotonic() - started < 1
+    assert router.stats()["hedges"] == 1 and router.stats()["hedge_wins"] == 1
+    assert slow.discarded == ["hedge-slow-session"]
+
+    # Follow-ups and batch-priority runs are never hedged
+    slow.seconds = 0.2
+    with priority(BATCH):
+        assert asyncio.run(router.run("Best time to visit Porto?"))[0] == "hedge-slow plan"
+    assert router.hedges == 1
+
+    # ...unless an interactive caller joined the batch run before its hedge was due
+    async def joined():
+        context = contextvars.copy_context()
+        run = asyncio.create_task(router.run("Best time to visit Porto?"), context=context)
+        await asyncio.sleep(0.01)
+        raise_priority(context, INTERACTIVE)
+        return await run
+
+    slow.seconds = 5
+    # (hedge budget earned by earlier interactive runs)
+    router._hedge_budget = 1.0
+    with priority(BATCH):
+        assert asyncio.run(joined())[0] == "hedge-fast plan"
+    assert router.hedges == 2
+    slow.seconds = 0.2
+
+    # Nor are runs with nowhere faster to go: a single backend, or one whose alternative is cooling down
+    alone = BackendRouter([slow], weights={}, mode="failover")
+    assert asyncio.run(alone.run("Best time to visit Faro?"))[0] == "hedge-slow plan" and alone.hedges == 0
+    # (both cooling down, so both stay candidates rather than the healthy one alone)
+    fast.stats.cooldown_until = slow.stats.cooldown_until = time.monotonic() + 60
+    both = BackendRouter([slow, fast], weights={}, mode="failover")
+    assert asyncio.run(both.run("Best time to visit Braga?"))[0] == "hedge-slow plan" and both.hedges == 0
+
+
+def test_cancelled_fresh_stream_discards_its_session():
+    slow, follow_up = SleepyBackend("stream-slow", 5), SleepyBackend("stream-follow-up", 5)
+    router = BackendRouter([slow], weights={}, mode="failover")
+
+    async def consume(session_id=None):
+        async for _ in until_deadline(router.stream("Best time to visit Lisbon?", session_id), 0.05):
+            pass
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume())
+    # Cancelled before it produced anything, so it is not failed over either
+    assert slow.discarded == ["stream-slow-session"] and router.failovers == 0
+
+    # A follow-up keeps the session it continues
+    router = BackendRouter([follow_up], weights={}, mode="failover")
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume("kept-session"))
+    assert follow_up.discarded == []
+
+
+def test_missed_deadline_falls_back_to_cost_index_figures(cost_index):
+    async def slow_events():
+        yield {"type": "session", "session_id": "s"}
+        await asyncio.sleep(5)
+        yield {"type": "final", "text": "too late"}
+
+    async def scenario():
+        seen = []
+        with pytest.raises(DeadlineExceeded):
+            async for event in until_deadline(slow_events(), 0.1):
+                seen.append(event["type"])
+        with deadline(0.1), pytest.raises(DeadlineExceeded):
+            await within_deadline(asyncio.sleep(5))
+        return seen
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == ["session"]
+    assert time.monotonic() - started < 1
+
+    cost_index.upsert("New York", 240, 180, 300, 0.8)
+    cost_index.add_alias("NYC", "New York")
+    planner = FallbackPlanner(model=None, timeout_seconds=1, max_output_tokens=64)
+    answer = asyncio.run(planner.answer("Cheapest month for NYC and Mars?", fresh=False))
+    assert "New York: about $240 per day (typically $180–$300)." in answer
+    assert asyncio.run(planner.answer("Weekend on Mars?", fresh=False)) is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-fork serving needs fork()")
+def test_forked_workers_split_quotas_and_reopen_the_cost_index(cost_index):
+    scheduler = UpstreamScheduler({"gemini": {"rate": 8, "burst": 4, "max_concurrency": 16}})
+    scheduler.limiter("gemini", "key")
+    scheduler.set_share(1 / 4)
+    assert scheduler.limiter("gemini", "key").stats()["limit"] == 4
+    assert scheduler.limiter("gemini", "key").bucket.rate == 2
+
+    cost_index.upsert("Lisbon", 110)
+    parent_conn = cost_index._connect()
+    pid = os.fork()
+    if pid == 0:
+        # The worker reads the same file through its own connection
+        ok = cost_index._connect() is not parent_conn and cost_index.get("Lisbon")["daily_cost"] == 110
+        os._exit(0 if ok else 1)
+    assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+
+
+def test_multi_worker_launch_shares_sessions_through_sqlite(monkeypatch, tmp_path):
+    from backend.serve import share_sessions
+
+    monkeypatch.setattr(settings, "SESSION_STORE_BACKEND", "memory")
+    monkeypatch.setattr(settings, "SESSION_STORE_PATH", str(tmp_path / "sessions.sqlite3"))
+    share_sessions(1)
+    assert make_session_store() is None
+    share_sessions(4)
+    assert isinstance(make_session_store(), SqliteSessionStore)
@@ -0,0 +1,79 @@
+# backend/tests/test_sessions.py – Per-caller session pool: ids, expiry and eviction
+
+import asyncio
+import time
+
+from backend.services.session_manager import USER_ID, SessionManager
+from backend.services.session_store import SqliteSessionStore, WriteBehind
+
+
+def _manager(writer=None, **kwargs) -> SessionManager:
+    from google.adk.sessions import InMemorySessionService
+
+    return SessionManager(InMemorySessionService(), app_name="TravelPlanner", writer=writer, **kwargs)
+
+
+def _stored(manager: SessionManager) -> set:
+    return set(manager.session_service.sessions.get("TravelPlanner", {}).get(USER_ID, {}))
+
+
+def test_unknown_session_ids_are_never_adopted():
+    manager = _manager()
+    issued = manager.open("attacker-chosen")
+    assert issued != "attacker-chosen" and manager.has(issued)
+    assert _stored(manager) == {issued}
+
+    async def follow_up():
+        async with manager.session("made-up") as opened:
+            return opened
+
+    opened = asyncio.run(follow_up())
+    assert opened not in {"made-up", issued} and not manager.has("made-up")
+    # An id this manager issued is continued as is
+    assert manager.open(issued) == issued
+
+
+def test_session_started_on_another_worker_is_continued_under_its_id(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl_seconds=60)
+    worker_a, worker_b = _manager(WriteBehind(store)), _manager(WriteBehind(store))
+    session_id = worker_a.open()
+    worker_a.release(session_id)
+    worker_a.writer.flush()
+
+    async def follow_up():
+        async with worker_b.session(session_id) as opened:
+            return opened
+
+    assert asyncio.run(follow_up()) == session_id
+    assert worker_b.stats()["restores"] == 1
+
+
+def test_idle_sessions_expire_after_the_ttl():
+    manager = _manager(ttl_seconds=0.05)
+    stale = manager.open()
+    time.sleep(0.1)
+    fresh = manager.open()
+
+    assert not manager.has(stale) and _stored(manager) == {fresh}
+    # Coming back with the expired id starts over under a new one
+    assert manager.open(stale) not in {stale, fresh}
+
+
+def test_least_recently_used_session_is_evicted_unless_a_run_holds_it():
+    manager = _manager(max_sessions=2)
+    first, second = manager.open(), manager.open()
+    manager.open(first)
+    third = manager.open()
+
+    assert _stored(manager) == {first, third}
+    assert manager.stats()["evictions"] == 1
+
+    async def busy():
+        async with manager.session(first):
+            manager.open()
+            # `first` is the oldest now, but the run in progress on it keeps it
+            return manager.open()
+
+    latest = asyncio.run(busy())
+    assert _stored(manager) == {first, latest}
+    assert manager.stats()["evictions"] == 3
@@ -0,0 +1,156 @@
+# backend/tools/cost_extraction.py – Daily cost extraction from search snippets
+
+import re
+import statistics
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+# Approximate conversion rates to USD; precision here matters far less than the spread of snippets
+USD_RATES = {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "JPY": 0.0067, "INR": 0.012,
+    "AUD": 0.66, "CAD": 0.73, "CHF": 1.12, "THB": 0.028, "IDR": 0.000063,
+}
+SYMBOL_CURRENCIES = {
+    "US$": "USD", "$": "USD", "A$": "AUD", "AU$": "AUD", "C$": "CAD", "CA$": "CAD",
+    "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "฿": "THB", "Rp": "IDR",
+}
+WORD_CURRENCIES = {
+    "usd": "USD", "dollars": "USD", "eur": "EUR", "euros": "EUR", "gbp": "GBP", "pounds": "GBP",
+    "jpy": "JPY", "yen": "JPY", "inr": "INR", "rupees": "INR", "aud": "AUD", "cad": "CAD",
+    "chf": "CHF", "thb": "THB", "baht": "THB", "idr": "IDR",
+}
+UNIT_DAYS = {"day": 1, "daily": 1, "night": 1, "nightly": 1, "week": 7, "weekly": 7, "month": 30, "monthly": 30}
+
+# Plausible per-day spend in USD; anything outside is a trip total, a flight price or noise
+MIN_DAILY_USD = 5
+MAX_DAILY_USD = 3000
+# Amounts with no time unit at all are usually hotel rates or flights once they get large
+MAX_UNITLESS_DAILY_USD = 600
+
+_SYMBOL = "|".join(re.escape(s) for s in sorted(SYMBOL_CURRENCIES, key=len, reverse=True))
+_WORD = "|".join(sorted(WORD_CURRENCIES, key=len, reverse=True))
+_AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+_UNIT = "|".join(UNIT_DAYS)
+
+COST_PATTERN = re.compile(
+    rf"(?P<symbol>{_SYMBOL})\s?(?P<low>{_AMOUNT})(?P<k>k)?"
+    rf"(?:\s?(?:-|–|—|to)\s?(?:{_SYMBOL})?\s?(?P<high>{_AMOUNT})(?P<k2>k)?)?"
+    rf"(?:\s?(?P<word>{_WORD})\b)?"
+    rf"|(?P<low_w>{_AMOUNT})(?:\s?(?:-|–|—|to)\s?(?P<high_w>{_AMOUNT}))?\s?(?P<word_w>{_WORD})\b",
+    re.IGNORECASE,
+)
+UNIT_PATTERN = re.compile(
+    rf"[^.;\n$€£¥₹\d]{{0,40}}?(?:\b(?:per|a|an|each|every)\s+|/\s?)(?P<unit>{_UNIT})\b"
+    rf"|\s*(?P<adverb>daily|nightly|weekly|monthly)\b",
+    re.IGNORECASE,
+)
+# "A week in Lisbon costs €700": the unit precedes the amount within the same clause. \Z, not $, which
+# would also match before the newline joining two snippets and lend one snippet's unit to the next
+LEADING_UNIT_PATTERN = re.compile(
+    rf"\b(?:a|one|per|each)\s+(?P<unit>{_UNIT})\b[^.;:\d\n]*\Z",
+    re.IGNORECASE,
+)
+LEADING_WINDOW = 40
+
+
+@dataclass
+class CostMention:
+    low: float
+    high: float
+    currency: str
+    unit: Optional[str]
+
+    @property
+    def daily_usd(self) -> float:
+        return sum(self.daily_usd_range) / 2
+
+    @property
+    def daily_usd_range(self) -> Tuple[float, float]:
+        days = UNIT_DAYS[self.unit] if self.unit else 1
+        rate = USD_RATES[self.currency] / days
+        return self.low * rate, self.high * rate
+
+
+@dataclass
+class CostEstimate:
+    daily_cost: int
+    low: int
+    high: int
+    confidence: float
+    samples: int
+
+
+def _number(text: str, thousands: Optional[str]) -> float:
+    value = float(text.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def extract_costs(text: str) -> List[CostMention]:
+    """Find every currency amount in `text`, with ranges, currency and time unit resolved."""
+    mentions = []
+    for match in COST_PATTERN.finditer(text):
+        if match.group("symbol"):
+            currency = SYMBOL_CURRENCIES.get(match.group("symbol"), "USD")
+            if match.group("word"):
+                currency = WORD_CURRENCIES[match.group("word").lower()]
+            low = _number(match.group("low"), match.group("k"))
+            high = _number(match.group("high"), match.group("k2") or match.group("k")) if match.group("high") else low
+        else:
+            currency = WORD_CURRENCIES[match.group("word_w").lower()]
+            low = _number(match.group("low_w"), None)
+            high = _number(match.group("high_w"), None) if match.group("high_w") else low
+
+        unit_match = UNIT_PATTERN.match(text, match.end()) or LEADING_UNIT_PATTERN.search(
+            text, max(0, match.start() - LEADING_WINDOW), match.start()
+        )
+        unit = None
+        if unit_match:
+            unit = (unit_match.group("unit") or unit_match.groupdict().get("adverb")).lower()
+        if high < low:
+            low, high = high, low
+        mentions.append(CostMention(low=low, high=high, currency=currency, unit=unit))
+    return mentions
+
+
+def estimate_daily_cost(snippets: Iterable[str]) -> Optional[CostEstimate]:
+    """Score every cost mention across all snippets and return their median daily cost.
+
+    Mentions with an explicit per-day/week/month unit are preferred; unitless amounts are only
+    used when no snippet states a unit (the query already asks for a daily figure). `low`/`high`
+    are the lower quartile of the mentions' low ends and the upper quartile of their high ends,
+    so a stated range ("$80–120 per day") survives. Confidence grows with the number of mentions
+    and shrinks with the spread of their midpoints.
+    """
+    with_unit, unitless = [], []
+    for mention in extract_costs("\n".join(snippets)):
+        daily = mention.daily_usd
+        if mention.unit and MIN_DAILY_USD <= daily <= MAX_DAILY_USD:
+            with_unit.append(mention.daily_usd_range)
+        elif not mention.unit and MIN_DAILY_USD <= daily <= MAX_UNITLESS_DAILY_USD:
+            unitless.append(mention.daily_usd_range)
+    ranges = with_unit or unitless
+    if not ranges:
+        return None
+
+    values = [(low + high) / 2 for low, high in ranges]
+    median = statistics.median(values)
+    q1, q3 = _quartiles(values)
+    spread = (q3 - q1) / median
+    confidence = min(1.0, len(values) / 4) * max(0.1, 1.0 - min(spread, 0.9))
+    if not with_unit:
+        confidence /= 2
+
+    return CostEstimate(
+        daily_cost=int(round(median)),
+        low=int(round(_quartiles([low for low, _ in ranges])[0])),
+        high=int(round(_quartiles([high for _, high in ranges])[1])),
+        confidence=round(confidence, 2),
+        samples=len(values),
+    )
+
+
+def _quartiles(values: List[float]) -> Tuple[float, float]:
+    if len(values) == 1:
+        return values[0], values[0]
+    q1, _, q3 = statistics.quantiles(values, n=4, method="inclusive")
+    return q1, q3
@@ -0,0 +1,396 @@
+# backend/tools/cost_index.py – On-disk destination cost index with aliases and a background refresher
+#
+# Usage: python -m backend.tools.cost_index export config/cost_index.json
+#        python -m backend.tools.cost_index import config/cost_index.json
+#        python -m backend.tools.cost_index seed [DESTINATION ...]
+#        python -m backend.tools.cost_index stats
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_VERSION = 1
+FIELDS = ("key", "name", "daily_cost", "low", "high", "confidence", "source", "updated_at", "hits")
+
+
+# SQLite connections must not be shared with forked workers (backend.serve); each child opens its own
+_open_indexes: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _reopen_after_fork() -> None:
+    for index in list(_open_indexes):
+        index._local = threading.local()
+        index._lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def destination_key(destination: str) -> str:
+    return " ".join(destination.lower().split())
+
+
+class CostIndex:
+    """Precomputed daily costs per destination, stored in SQLite and served from memory.
+
+    The file is the shared, durable copy (every worker and the Docker image can point at it);
+    lookups read an in-process snapshot, so a hit is a dict lookup rather than a query. The
+    snapshot reloads when another process has written to the file, checked at most every
+    `reload_seconds`. Aliases ("nyc" -> "new york") resolve to one canonical key.
+    """
+
+    def __init__(self, path: str, max_age_seconds: float, max_entries: int, reload_seconds: float = 60.0,
+                 seed_path: Optional[str] = None, mmap_bytes: int = 0):
+        self.path = path
+        self.seed_path = seed_path
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.reload_seconds = reload_seconds
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, dict]] = None
+        self._aliases: Dict[str, str] = {}
+        self._data_version = None
+        self._checked_at = 0.0
+        # Hit counts accumulate in memory and are flushed by the refresher, keeping lookups write-free
+        self._pending_hits: Dict[str, int] = {}
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        _open_indexes.add(self)
+
+    # --- Storage ---
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.mmap_bytes:
+                # Reads go through the OS page cache, so every worker on the host shares one copy
+                conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS destinations ("
+                "key TEXT PRIMARY KEY, name TEXT NOT NULL, daily_cost REAL NOT NULL, low REAL, high REAL, "
+                "confidence REAL, source TEXT, updated_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, key TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+            self._local.conn = conn
+        return conn
+
+    def _load(self) -> None:
+        conn = self._connect()
+        rows = conn.execute(f"SELECT {', '.join(FIELDS)} FROM destinations").fetchall()
+        self._entries = {row[0]: dict(zip(FIELDS, row)) for row in rows}
+        self._aliases = dict(conn.execute("SELECT alias, key FROM aliases").fetchall())
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        self._checked_at = time.monotonic()
+
+    def _snapshot(self) -> Dict[str, dict]:
+        if self._entries is None or time.monotonic() - self._checked_at > self.reload_seconds:
+            with self._lock:
+                if self._entries is None:
+                    self._load()
+                    if not self._entries and not self._aliases and self.seed_path and os.path.exists(self.seed_path):
+                        with open(self.seed_path) as f:
+                            logger.info("Seeded cost index with %d destination(s) from %s",
+                                        self.import_(json.load(f)), self.seed_path)
+                elif time.monotonic() - self._checked_at > self.reload_seconds:
+                    # data_version only changes when another connection has committed a write
+                    version = self._connect().execute("PRAGMA data_version").fetchone()[0]
+                    if version != self._data_version:
+                        self._load()
+                    self._checked_at = time.monotonic()
+        return self._entries
+
+    # --- Lookups ---
+    def resolve(self, destination: str) -> str:
+        key = destination_key(destination)
+        self._snapshot()
+        return self._aliases.get(key, key)
+
+    def get(self, destination: str, allow_stale: bool = False) -> Optional[dict]:
+        """Index entry for a destination (or alias); None if missing, or stale unless `allow_stale`."""
+        entries = self._snapshot()
+        key = self.resolve(destination)
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.time() - entry["updated_at"] > self.max_age_seconds and not allow_stale:
+            self.stale += 1
+            return None
+        self.hits += 1
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        return entry
+
+    def find_in_text(self, text: str, limit: int = 5, max_words: int = 4) -> List[dict]:
+        """Entries (stale ones included) for destinations or aliases named in free text, in order of mention.
+
+        Matches whole phrases of up to `max_words` words, longest first, so "New York" wins over "York".
+        """
+        entries = self._snapshot()
+        words = re.findall(r"[\w'-]+", text.lower())
+        found, seen, i = [], set(), 0
+        while i < len(words) and len(found) < limit:
+            for size in range(min(max_words, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + size])
+                key = self._aliases.get(phrase, phrase)
+                if key in entries:
+                    if key not in seen:
+                        seen.add(key)
+                        found.append(entries[key])
+                    i += size
+                    break
+            else:
+                i += 1
+        return found
+
+    def missing(self, destinations: List[str]) -> List[str]:
+        """Those of `destinations` (or their aliases) the index has no entry for, stale or not."""
+        entries = self._snapshot()
+        return [destination for destination in destinations if self.resolve(destination) not in entries]
+
+    # --- Writes ---
+    def upsert(self, destination: str, daily_cost: float, low: float = None, high: float = None,
+               confidence: float = None, source: str = "serpapi") -> None:
+        key = self.resolve(destination)
+        entry = {"key": key, "name": destination.strip(), "daily_cost": daily_cost, "low": low, "high": high,
+                 "confidence": confidence, "source": source, "updated_at": time.time()}
+        self._connect().execute(
+            "INSERT INTO destinations (key, name, daily_cost, low, high, confidence, source, updated_at) "
+            "VALUES (:key, :name, :daily_cost, :low, :high, :confidence, :source, :updated_at) "
+            "ON CONFLICT(key) DO UPDATE SET daily_cost = excluded.daily_cost, "
+            "low = excluded.low, high = excluded.high, confidence = excluded.confidence, "
+            "source = excluded.source, updated_at = excluded.updated_at",
+            entry,
+        )
+        with self._lock:
+            if self._entries is not None:
+                previous = self._entries.get(key, {})
+                self._entries[key] = {**entry, "name": previous.get("name", entry["name"]),
+                                      "hits": previous.get("hits", 0)}
+
+    def add_alias(self, alias: str, destination: str) -> None:
+        alias_key, key = destination_key(alias), destination_key(destination)
+        if alias_key == key:
+            return
+        self._connect().execute("INSERT OR REPLACE INTO aliases (alias, key) VALUES (?, ?)", (alias_key, key))
+        with self._lock:
+            self._aliases[alias_key] = key
+
+    def flush_hits(self) -> None:
+        pending, self._pending_hits = self._pending_hits, {}
+        if pending:
+            self._connect().executemany("UPDATE destinations SET hits = hits + ? WHERE key = ?",
+                                        [(count, key) for key, count in pending.items()])
+
+    def prune(self) -> int:
+        """Drop the least-requested entries beyond `max_entries`."""
+        cursor = self._connect().execute(
+            "DELETE FROM destinations WHERE key IN "
+            "(SELECT key FROM destinations ORDER BY hits DESC, updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        return cursor.rowcount
+
+    def due_for_refresh(self, older_than: float, limit: int) -> List[dict]:
+        """Most-requested entries last updated more than `older_than` seconds ago."""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(FIELDS)} FROM destinations WHERE updated_at < ? ORDER BY hits DESC LIMIT ?",
+            (time.time() - older_than, limit),
+        ).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        """Cross-process lease so only one worker runs the bulk refresh at a time."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, NULL, 0)", (name,))
+        cursor = conn.execute(
+            "UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND (expires_at < ? OR owner = ?)",
+            (owner, now + seconds, name, now, owner),
+        )
+        return cursor.rowcount == 1
+
+    # --- Import / export ---
+    def export(self) -> dict:
+        self.flush_hits()
+        conn = self._connect()
+        aliases: Dict[str, List[str]] = {}
+        for alias, key in conn.execute("SELECT alias, key FROM aliases ORDER BY alias"):
+            aliases.setdefault(key, []).append(alias)
+        destinations = [dict(zip(FIELDS, row)) for row in
+                        conn.execute(f"SELECT {', '.join(FIELDS)} FROM destinations ORDER BY hits DESC, key")]
+        return {"version": EXPORT_VERSION, "destinations": destinations, "aliases": aliases}
+
+    def import_(self, data: dict) -> int:
+        """Load an export; newer rows win over older ones already in the index."""
+        if data.get("version") != EXPORT_VERSION:
+            raise ValueError(f"Unsupported cost index export version: {data.get('version')}")
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            for row in data.get("destinations", []):
+                row = {field: row.get(field) for field in FIELDS}
+                row["key"] = destination_key(row["key"] or row["name"])
+                row["hits"] = row["hits"] or 0
+                conn.execute(
+                    "INSERT INTO destinations (key, name, daily_cost, low, high, confidence, source, updated_at, hits) "
+                    "VALUES (:key, :name, :daily_cost, :low, :high, :confidence, :source, :updated_at, :hits) "
+                    "ON CONFLICT(key) DO UPDATE SET name = excluded.name, daily_cost = excluded.daily_cost, "
+                    "low = excluded.low, high = excluded.high, confidence = excluded.confidence, "
+                    "source = excluded.source, updated_at = excluded.updated_at "
+                    "WHERE excluded.updated_at > destinations.updated_at",
+                    row,
+                )
+            for key, aliases in data.get("aliases", {}).items():
+                conn.executemany("INSERT OR REPLACE INTO aliases (alias, key) VALUES (?, ?)",
+                                 [(destination_key(alias), destination_key(key)) for alias in aliases])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._load()
+        return len(data.get("destinations", []))
+
+    def stats(self) -> dict:
+        entries = self._snapshot()
+        return {"entries": len(entries), "aliases": len(self._aliases), "hits": self.hits,
+                "stale": self.stale, "misses": self.misses}
+
+
+class CostIndexRefresher:
+    """Daemon thread that re-fetches the most-requested stale entries in small, paced batches.
+
+    `seed_destinations` missing from the index are fetched first, batch after batch until they are
+    all in, so popular places are precomputed before anyone asks. Runs at reduced OS priority where
+    supported and sleeps between lookups so it never competes with user traffic for upstream quota;
+    a lease in the index file keeps it to one worker.
+    """
+
+    def __init__(self, index: CostIndex, lookup: Callable[[str], dict], interval_seconds: float,
+                 refresh_after_seconds: float, batch_size: int, pause_seconds: float,
+                 seed_destinations: Optional[List[str]] = None):
+        self.index = index
+        self.lookup = lookup
+        self.seed_destinations = list(seed_destinations or [])
+        self.interval_seconds = interval_seconds
+        self.refresh_after_seconds = refresh_after_seconds
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self.refreshed = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cost-index-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        delay = self._next_delay(seeded=1)
+        while not self._stop.wait(delay):
+            updated = 0
+            try:
+                updated = self.refresh_once()
+            except Exception:
+                logger.exception("Cost index refresh failed")
+            delay = self._next_delay(updated)
+
+    def _next_delay(self, seeded: int) -> float:
+        # Keep seeding while it makes progress; destinations that fail wait for the next interval
+        if seeded and self.index.missing(self.seed_destinations):
+            return self.pause_seconds
+        return self.interval_seconds
+
+    def refresh_once(self) -> int:
+        """Refresh one batch if this process holds the lease; returns how many entries were updated."""
+        self.index.flush_hits()
+        if not self.index.acquire_lease("refresh", self.owner, self.interval_seconds * 2):
+            return 0
+        names = self.index.missing(self.seed_destinations)[:self.batch_size]
+        if len(names) < self.batch_size:
+            names += [entry["name"] for entry in
+                      self.index.due_for_refresh(self.refresh_after_seconds, self.batch_size - len(names))]
+        updated = self._fetch(names)
+        self.index.prune()
+        self.refreshed += updated
+        if updated:
+            logger.info("Cost index refreshed %d destination(s)", updated)
+        return updated
+
+    def seed(self, destinations: Optional[List[str]] = None) -> int:
+        """Fetch every one of `destinations` (default `seed_destinations`) the index is missing, now."""
+        updated = self._fetch(self.index.missing(self.seed_destinations if destinations is None else destinations))
+        self.refreshed += updated
+        return updated
+
+    def _fetch(self, names: List[str]) -> int:
+        updated = 0
+        for name in names:
+            if self._stop.is_set():
+                break
+            result = self.lookup(name)
+            if result.get("status") == "success":
+                low, high = result.get("cost_range") or (None, None)
+                # Only search figures come with a range; the rest are LLM estimates and must say so in export()
+                self.index.upsert(name, result["daily_cost"], low, high, result.get("confidence"),
+                                  source="serpapi" if "cost_range" in result else "llm")
+                updated += 1
+            else:
+                self.failed += 1
+            self._stop.wait(self.pause_seconds)
+        return updated
+
+
+def main(argv: List[str]) -> None:
+    from config import settings
+    from backend.tools.expense_calculator import cost_index, make_refresher
+
+    if len(argv) == 2 and argv[0] == "export":
+        with open(argv[1], "w") as f:
+            json.dump(cost_index.export(), f, indent=1)
+    elif len(argv) == 2 and argv[0] == "import":
+        with open(argv[1]) as f:
+            print(f"Imported {cost_index.import_(json.load(f))} destination(s) into {cost_index.path}")
+    elif argv[:1] == ["seed"]:
+        if not settings.SERPAPI_API_KEY:
+            # e.g. an image built without secrets: ship what the JSON export has and let the refresher fill in
+            print("SERPAPI_API_KEY is not set; nothing seeded")
+            return
+        refresher = make_refresher(force=True)
+        seeded = refresher.seed(argv[1:] or None)
+        print(f"Seeded {seeded} destination(s) into {cost_index.path}; {refresher.failed} failed")
+    elif argv == ["stats"]:
+        print(json.dumps(cost_index.stats()))
+    else:
+        sys.exit("usage: python -m backend.tools.cost_index export|import PATH | seed [DESTINATION ...] | stats")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,16 @@
 
 
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 def get_current_time() -> dict:
     """
     Get the current time in the format YYYY-MM-DD HH:MM:SS
     """
-    print(f"[DEBUG] Starting 'get_current_time'")
+    logger.debug("Starting 'get_current_time'")
     return {
         "current_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
\ No newline at end of file
@@ -1,23 +1,132 @@
-import os
+import logging
+import threading
 from typing import Optional
-import requests
-from google.generativeai import GenerativeModel
 from config import settings
+from backend.tools.cost_extraction import estimate_daily_cost
+from backend.tools.cache import make_cache, MemoryCache, SingleFlight
+from backend.tools.cost_index import CostIndex, CostIndexRefresher, destination_key
+from backend.tools.http_client import get_json, redact
+from backend.services.deadline import DeadlineExceeded, bound
+from backend.services.tracing import span
+from backend.services.upstream import BATCH, UpstreamRateLimited, priority, upstream_scheduler
 
 SERP_API_KEY = settings.SERPAPI_API_KEY #os.getenv("SERPAPI_API_KEY")
-model = settings.DEFAULT_MODEL #GenerativeModel(model_name="gemini-2.0-flash-lite")
+
+# Never log request params: they carry the SerpAPI key
+logger = logging.getLogger(__name__)
+
+# Destination-keyed results; only successful estimates are cached
+expense_cache = make_cache(
+    settings.EXPENSE_CACHE_BACKEND,
+    ttl_seconds=settings.EXPENSE_CACHE_TTL_SECONDS,
+    max_entries=settings.EXPENSE_CACHE_MAX_ENTRIES,
+    path=settings.EXPENSE_CACHE_PATH,
+)
+# Concurrent lookups for the same destination share one upstream call
+_inflight = SingleFlight()
+
+# Precomputed costs for known destinations, consulted before the cache and any upstream call
+cost_index = CostIndex(
+    settings.COST_INDEX_PATH,
+    max_age_seconds=settings.COST_INDEX_MAX_AGE_SECONDS,
+    max_entries=settings.COST_INDEX_MAX_ENTRIES,
+    seed_path=settings.COST_INDEX_SEED_PATH,
+    mmap_bytes=settings.COST_INDEX_MMAP_BYTES,
+) if settings.COST_INDEX_ENABLED else None
+
+# LLM fallback: one shared client built on first use, answers memoized per destination
+_fallback_model = None
+_fallback_model_lock = threading.Lock()
+llm_estimate_cache = MemoryCache(
+    ttl_seconds=settings.EXPENSE_LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.EXPENSE_CACHE_MAX_ENTRIES,
+)
+
+
+def stats() -> dict:
+    return {
+        "cache": expense_cache.stats(),
+        "llm_cache": llm_estimate_cache.stats(),
+        "index": cost_index.stats() if cost_index else None,
+        "coalesced": _inflight.coalesced,
+    }
+
 
 def get_estimated_expense(destination: str) -> dict:
     """Estimates travel expenses using SerpAPI. Returns daily or total cost based on number of days."""
-    
-    print(f"[DEBUG] Starting 'get_estimated_expense'")
-    print(f"[DEBUG] Destination received: {destination}")
+
+    if cost_index is not None:
+        entry = cost_index.get(destination)
+        if entry is not None:
+            return _index_result(destination, entry)
+        key = cost_index.resolve(destination)
+    else:
+        key = destination_key(destination)
+
+    cached = expense_cache.get(key)
+    if cached is not None:
+        logger.debug("Expense cache hit for '%s'", key)
+        return {**cached, "destination": destination}
+
+    result = _inflight.do(key, lambda: _lookup_expense(destination))
+    if result.get("status") == "success":
+        expense_cache.set(key, result)
+        if cost_index is not None:
+            low, high = result.get("cost_range") or (None, None)
+            cost_index.upsert(destination, result["daily_cost"], low, high, result.get("confidence"),
+                              source="serpapi" if "cost_range" in result else "llm")
+    elif cost_index is not None:
+        # Upstream failed: an outdated figure is still better than none
+        entry = cost_index.get(destination, allow_stale=True)
+        if entry is not None:
+            return _index_result(destination, entry)
+    return result
+
+
+def _index_result(destination: str, entry: dict) -> dict:
+    daily_cost = round(entry["daily_cost"])
+    result = {
+        "status": "success",
+        "destination": destination,
+        "daily_cost": daily_cost,
+        "message": f"The average daily cost in {destination} is approximately ${daily_cost}.",
+    }
+    if entry["low"] is not None:
+        result["cost_range"] = [round(entry["low"]), round(entry["high"])]
+        result["confidence"] = entry["confidence"]
+    return result
+
+
+def make_refresher(force: bool = False) -> Optional[CostIndexRefresher]:
+    """Background bulk refresh of the cost index; started and stopped by the app lifespan.
+
+    `force` builds one even with COST_INDEX_REFRESH_ENABLED off, for the `seed` command.
+    """
+    if cost_index is None or not (settings.COST_INDEX_REFRESH_ENABLED or force):
+        return None
+    return CostIndexRefresher(
+        cost_index,
+        lookup=_refresh_lookup,
+        interval_seconds=settings.COST_INDEX_REFRESH_INTERVAL_SECONDS,
+        refresh_after_seconds=settings.COST_INDEX_REFRESH_AFTER_SECONDS,
+        batch_size=settings.COST_INDEX_REFRESH_BATCH,
+        pause_seconds=settings.COST_INDEX_REFRESH_PAUSE_SECONDS,
+        seed_destinations=settings.COST_INDEX_SEED_DESTINATIONS,
+    )
+
+
+def _refresh_lookup(destination: str) -> dict:
+    # Background refreshes yield to user requests for the shared SerpAPI quota
+    with priority(BATCH):
+        return _lookup_expense(destination)
+
+
+def _lookup_expense(destination: str) -> dict:
+    logger.debug("Looking up expenses for '%s'", destination)
 
     try:
         query = f"Average travel cost in {destination} per day"
-        print(f"[DEBUG] Formulated SerpAPI query: {query}")
 
-        serp_api_url = "https://serpapi.com/search"
         params = {
             "q": query,
             "api_key": SERP_API_KEY,
@@ -25,71 +134,85 @@ def get_estimated_expense(destination: str) -> dict:
             "num": 5
         }
 
-        print(f"[DEBUG] Sending request to SerpAPI with params: {params}")
-        response = requests.get(serp_api_url, params=params)
-        data = response.json()
+        logger.debug("Sending request to SerpAPI for query: %s", query)
+        data = get_json(settings.SERPAPI_URL, params=params, timeout=settings.SERPAPI_TIMEOUT_SECONDS,
+                        upstream="serpapi", key=SERP_API_KEY)
 
         snippets = [
             r["snippet"] for r in data.get("organic_results", []) if "snippet" in r
         ]
 
-        print(f"[DEBUG] Extracted snippets from SerpAPI response:")
-        for s in snippets:
-            print(f"   - {s}")
-
-        # Try extracting cost
-        daily_cost = None
-        for snippet in snippets:
-            if "$" in snippet or "USD" in snippet:
-                try:
-                    tokens = snippet.replace(",", "").split()
-                    for i, token in enumerate(tokens):
-                        if "$" in token or "USD" in token:
-                            num = ''.join([c for c in token if c.isdigit()])
-                            if num:
-                                daily_cost = int(num)
-                                print(f"[DEBUG] Extracted daily cost from snippet: ${daily_cost}")
-                                break
-                    if daily_cost:
-                        break
-                except Exception as parse_err:
-                    print(f"[WARNING] Failed to parse snippet: {parse_err}")
-                    continue
+        logger.debug("Extracted %d snippet(s) from SerpAPI response", len(snippets))
+
+        # Score every cost mention across all snippets at once
+        estimate = estimate_daily_cost(snippets)
+        daily_cost = estimate.daily_cost if estimate else None
+        if estimate:
+            logger.debug("Extracted daily cost from %d snippet mention(s): $%s (confidence %s)",
+                         estimate.samples, daily_cost, estimate.confidence)
 
         # Fallback to LLM if cost not found
         if not daily_cost:
-            print("[DEBUG] Could not extract cost from snippets. Falling back to LLM.")
-            prompt = f"What is the average daily cost in {destination} in USD for a tourist?"
-            print(f"[DEBUG] LLM prompt: {prompt}")
-            llm_response = model.generate_content(prompt)
-            print(f"[DEBUG] LLM response: {llm_response.text}")
-            daily_cost = _extract_cost_from_text(llm_response.text)
-            print(f"[DEBUG] Cost extracted from LLM: ${daily_cost if daily_cost else 'None'}")
+            logger.debug("Could not extract cost from snippets. Falling back to LLM.")
+            daily_cost = _estimate_with_llm(destination)
+            logger.debug("Cost extracted from LLM: $%s", daily_cost)
 
         if not daily_cost:
-            print("[ERROR] Unable to determine daily cost from both SerpAPI and LLM.")
+            logger.warning("Unable to determine daily cost for '%s' from both SerpAPI and LLM.", destination)
             return {"status": "error", "message": f"Could not determine travel cost for {destination}."}
 
-        
-        print(f"[DEBUG] Returning daily cost: ${daily_cost}")
-        return {
+        result = {
             "status": "success",
             "destination": destination,
             "daily_cost": daily_cost,
             "message": f"The average daily cost in {destination} is approximately ${daily_cost}."
         }
+        if estimate:
+            result["cost_range"] = [estimate.low, estimate.high]
+            result["confidence"] = estimate.confidence
+        return result
 
+    except DeadlineExceeded:
+        return {"status": "timeout", "message": f"No time left to look up costs for {destination}."}
+    except UpstreamRateLimited as e:
+        # Not retried here: the caller falls back to a stale index entry, the model to its own estimate
+        logger.warning("Expense lookup for '%s' deferred: %s", destination, redact(str(e)))
+        return {"status": "error", "message": f"Cost lookup is rate limited; retry in {e.retry_after}s.",
+                "retry_after": e.retry_after}
     except Exception as e:
-        print(f"[EXCEPTION] {str(e)}")
-        return {"status": "error", "message": str(e)}
-
-
-def _extract_cost_from_text(text: str) -> int:
-    """Helper function to extract cost from LLM response text."""
-    import re
-    matches = re.findall(r"\$?(\d{2,5})", text.replace(",", ""))
-    if matches:
-        print(f"[DEBUG] Regex matched numbers in LLM response: {matches}")
-        return int(matches[0])
-    print("[DEBUG] No matches found in LLM response.")
-    return None
+        # Exception text from requests can include the full URL, key included
+        message = redact(str(e))
+        logger.warning("Expense lookup for '%s' failed: %s", destination, message)
+        return {"status": "error", "message": message}
+
+
+def _get_fallback_model():
+    global _fallback_model
+    if _fallback_model is None:
+        with _fallback_model_lock:
+            if _fallback_model is None:
+                from google.generativeai import GenerativeModel
+                _fallback_model = GenerativeModel(model_name=settings.EXPENSE_LLM_MODEL)
+    return _fallback_model
+
+
+def _estimate_with_llm(destination: str) -> Optional[int]:
+    """Ask the LLM for a daily cost when search snippets had none; memoized per destination."""
+    key = destination_key(destination)
+    cached = llm_estimate_cache.get(key)
+    if cached is not None:
+        return cached
+
+    prompt = (f"What is the average daily cost in {destination} in USD for a tourist? "
+              "Answer with one amount per day, like $120 per day.")
+    # Same quota as the agent's own model calls (API key mode)
+    with span("llm_fallback", destination=key), upstream_scheduler.limiter("gemini", settings.GOOGLE_API_KEY).call():
+        llm_response = _get_fallback_model().generate_content(
+            prompt, request_options={"timeout": bound(settings.EXPENSE_LLM_TIMEOUT_SECONDS)}
+        )
+    logger.debug("LLM fallback response for '%s': %s", key, llm_response.text)
+    estimate = estimate_daily_cost([llm_response.text])
+    daily_cost = estimate.daily_cost if estimate else None
+    if daily_cost:
+        llm_estimate_cache.set(key, daily_cost)
+    return daily_cost
@@ -0,0 +1,82 @@
+# backend/tools/http_client.py – Pooled HTTP client for tool upstreams
+
+import random
+import re
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from backend.services import metrics
+from backend.services.deadline import bound
+from backend.services.tracing import span
+from backend.services.upstream import parse_retry_after, upstream_scheduler
+from config import settings
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Credentials passed as query params end up in URLs and therefore in exception messages
+SECRET_PARAM_PATTERN = re.compile(r"((?:api_key|key|token)=)[^&\s'\"]+", re.IGNORECASE)
+
+upstream_requests = metrics.counter("upstream_requests_total", "Outbound HTTP attempts by host and outcome")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session, created on first use and reused by every tool call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=settings.HTTP_POOL_SIZE, pool_maxsize=settings.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_json(url: str, params: dict, timeout: float = None, max_retries: int = None,
+             upstream: Optional[str] = None, key: Optional[str] = None) -> dict:
+    """GET `url` and decode JSON, retrying transient failures with exponential backoff and full jitter.
+
+    With `upstream`, every attempt is admitted by that provider's limiter (shared per `key`), and a
+    429 pauses all of its callers for the Retry-After the provider sent instead of each retrying
+    on its own; if that pause outlasts the caller's queue budget, UpstreamRateLimited is raised.
+    """
+    timeout = settings.HTTP_TIMEOUT_SECONDS if timeout is None else timeout
+    max_retries = settings.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    host = urlsplit(url).netloc
+    limiter = upstream_scheduler.limiter(upstream, key) if upstream else None
+
+    with span("http_upstream", host=host) as s:
+        for attempt in range(max_retries + 1):
+            s.set(attempts=attempt + 1)
+            call = None
+            try:
+                with (limiter.call() if limiter else nullcontext()) as call:
+                    # requests' timeout bounds connect and each read; the deadline bounds both further
+                    response = get_session().get(url, params=params, timeout=bound(timeout))
+                    upstream_requests.inc(host=host, status=response.status_code)
+                    if response.status_code == 429 and call is not None:
+                        call.throttled(parse_retry_after(response.headers.get("Retry-After")))
+                if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                    s.set(status=response.status_code)
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                upstream_requests.inc(host=host, status=type(e).__name__)
+                if attempt == max_retries:
+                    raise
+            if call is not None and call.rate_limited:
+                continue  # the limiter holds the next attempt until the pause is over
+            time.sleep(bound(random.uniform(0, settings.HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt))))
+
+
+def redact(text: str) -> str:
+    """Mask credential query params (e.g. the SerpAPI key) in URLs and error messages."""
+    return SECRET_PARAM_PATTERN.sub(r"\1***", text)
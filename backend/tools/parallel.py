@@ -0,0 +1,117 @@
+# backend/tools/parallel.py – Async tool wrappers and concurrent execution of one turn's function calls
+
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+from backend.services import metrics
+from backend.services.deadline import remaining
+
+logger = logging.getLogger(__name__)
+
+# Turns whose calls were never collected (e.g. the run failed) are dropped past this many
+MAX_PENDING_TURNS = 1024
+
+
+def offload(func: Callable) -> Callable:
+    """Async version of a blocking tool that runs it on a worker thread.
+
+    Keeps the tool's name, docstring and signature, so ADK declares it to the model exactly
+    like the original while the event loop keeps serving other requests during the I/O.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
+
+def _call_key(name: str, args: dict) -> tuple:
+    return name, json.dumps(args or {}, sort_keys=True, default=str)
+
+
+class _Turn:
+    __slots__ = ("deadline", "tasks")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.tasks: Dict[tuple, deque] = {}
+
+
+class ParallelToolExecutor:
+    """Starts every function call from one model response at once instead of one after another.
+
+    ADK runs a turn's function calls sequentially; `start()` is called from the agent's
+    after-model callback with all the calls in the response and schedules them as tasks, and
+    `result()` is awaited from the before-tool callback so each call picks up its already-running
+    task. A turn shares one deadline: calls still running when it passes are reported back to
+    the model as timed out, while the calls that did finish keep their results.
+    """
+
+    def __init__(self, tools: Dict[str, Callable], timeout: float):
+        self.tools = tools
+        self.timeout = timeout
+        self._turns: "OrderedDict[str, _Turn]" = OrderedDict()
+        self.timeouts = metrics.counter("tool_timeouts_total", "Tool calls cut off by the per-turn deadline")
+        self.parallel_turns = metrics.counter("tool_parallel_turns_total",
+                                              "Model turns whose tool calls ran concurrently")
+
+    def start(self, turn_id: str, function_calls) -> None:
+        calls = [call for call in function_calls if call.name in self.tools]
+        if not calls:
+            return
+        self._discard(turn_id)
+        # The request's own deadline, when sooner, cuts the turn short too
+        left = remaining()
+        turn = _Turn(time.monotonic() + (self.timeout if left is None else max(0.0, min(self.timeout, left))))
+        for call in calls:
+            args = dict(call.args or {})
+            task = asyncio.ensure_future(self._invoke(self.tools[call.name], args))
+            turn.tasks.setdefault(_call_key(call.name, args), deque()).append(task)
+        self._turns[turn_id] = turn
+        if len(calls) > 1:
+            self.parallel_turns.inc()
+        while len(self._turns) > MAX_PENDING_TURNS:
+            self._discard(next(iter(self._turns)))
+
+    async def result(self, turn_id: str, name: str, args: dict) -> Optional[dict]:
+        """The response for one call started by `start()`, or None if it was not started here."""
+        turn = self._turns.get(turn_id)
+        pending = turn.tasks.get(_call_key(name, args)) if turn else None
+        if not pending:
+            return None
+        task = pending.popleft()
+        if not pending:
+            del turn.tasks[_call_key(name, args)]
+        if not turn.tasks:
+            self._turns.pop(turn_id, None)
+
+        remaining = turn.deadline - time.monotonic()
+        try:
+            result = await asyncio.wait_for(task, timeout=max(remaining, 0.0))
+        except asyncio.TimeoutError:
+            self.timeouts.inc(tool=name)
+            logger.warning("Tool '%s' did not finish before the turn deadline", name)
+            return {"status": "timeout",
+                    "message": f"{name} did not finish in time; answer with the information that is available."}
+        except Exception as e:
+            logger.warning("Tool '%s' failed: %s", name, e)
+            return {"status": "error", "message": str(e)}
+        # ADK treats an empty response as "not handled" and would call the tool again
+        return result if result else {"status": "success", "result": result}
+
+    @staticmethod
+    async def _invoke(func: Callable, args: dict):
+        if inspect.iscoroutinefunction(func):
+            return await func(**args)
+        return await asyncio.to_thread(func, **args)
+
+    def _discard(self, turn_id: str) -> None:
+        turn = self._turns.pop(turn_id, None)
+        if turn:
+            for pending in turn.tasks.values():
+                for task in pending:
+                    task.cancel()
@@ -0,0 +1,169 @@
+# backend/tools/trip_cost.py – Multi-leg trip costing over per-destination daily rates
+
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from pydantic import BaseModel
+from config import settings
+from backend.tools.expense_calculator import destination_key, get_estimated_expense
+
+# Daily spend relative to the "average" figure search results report, which is roughly mid-range
+TIER_MULTIPLIERS = {"budget": 0.6, "mid": 1.0, "luxury": 2.2}
+TIERS = tuple(TIER_MULTIPLIERS)
+_TIER_FACTORS = np.array([TIER_MULTIPLIERS[tier] for tier in TIERS])
+# Travelers after the first share rooms and transport, so each adds less than a full day's spend
+EXTRA_TRAVELER_SHARE = 0.75
+# Cheapest what-if variants returned to the model
+TOP_VARIANTS = 5
+
+
+class LegSpec(BaseModel):
+    """One leg as the model passes it to get_trip_cost; typed so the tool declaration lists every field."""
+    destination: str
+    days: int
+    travelers: int = 1
+    tier: str = "mid"
+
+
+@dataclass
+class TripLeg:
+    destination: str
+    days: int
+    travelers: int = 1
+    tier: str = "mid"
+
+    @classmethod
+    def from_dict(cls, data) -> "TripLeg":
+        if isinstance(data, BaseModel):
+            data = data.model_dump()
+        leg = cls(destination=str(data.get("destination", "")).strip(), days=int(data.get("days", 0)),
+                  travelers=int(data.get("travelers", 1)), tier=str(data.get("tier", "mid")).lower())
+        if not leg.destination:
+            raise ValueError("Every leg needs a destination.")
+        if leg.days < 1 or leg.travelers < 1:
+            raise ValueError(f"Leg '{leg.destination}' needs at least 1 day and 1 traveler.")
+        if leg.tier not in TIER_MULTIPLIERS:
+            raise ValueError(f"Unknown tier '{leg.tier}'; use one of {', '.join(TIERS)}.")
+        return leg
+
+
+class TripCostTable:
+    """Columnar view of an itinerary: one NumPy array per field, one element per leg.
+
+    Pricing is a single broadcast expression, so the same code prices the base trip (shape L)
+    or a whole grid of what-if variants (shape V x L) without Python-level loops.
+    """
+
+    def __init__(self, legs: List[TripLeg], rates: Dict[str, Optional[float]]):
+        self.legs = legs
+        self.rates = np.array([rates.get(destination_key(leg.destination)) or np.nan for leg in legs],
+                              dtype=np.float64)
+        self.days = np.array([leg.days for leg in legs], dtype=np.int32)
+        self.travelers = np.array([leg.travelers for leg in legs], dtype=np.int32)
+        self.tiers = np.array([TIERS.index(leg.tier) for leg in legs], dtype=np.int8)
+
+    @property
+    def missing(self) -> List[str]:
+        return [leg.destination for leg, rate in zip(self.legs, self.rates) if np.isnan(rate)]
+
+    def leg_costs(self, days=None, tiers=None, travelers=None) -> np.ndarray:
+        days = self.days if days is None else days
+        tiers = self.tiers if tiers is None else tiers
+        travelers = self.travelers if travelers is None else travelers
+        traveler_factor = 1 + (travelers - 1) * EXTRA_TRAVELER_SHARE
+        return self.rates * _TIER_FACTORS[tiers] * days * traveler_factor
+
+    def total(self) -> float:
+        return float(np.nansum(self.leg_costs()))
+
+    def variant_grid(self, day_options: List[int], tier_options: List[str]):
+        """Every combination of (days + delta, tier) per leg, as V x L day and tier matrices."""
+        deltas = np.array(day_options or [0], dtype=np.int32)
+        tiers = np.array([TIERS.index(t) for t in tier_options], dtype=np.int8) if tier_options else None
+        per_leg = len(deltas) * (len(tiers) if tiers is not None else 1)
+        count = per_leg ** len(self.legs)
+        if count > settings.TRIP_MAX_VARIANTS:
+            raise ValueError(f"{count} what-if variants requested; the limit is {settings.TRIP_MAX_VARIANTS}.")
+
+        # Row v, column l: which of the per-leg options leg l takes in variant v
+        choice = np.indices((per_leg,) * len(self.legs)).reshape(len(self.legs), -1).T
+        if tiers is None:
+            return np.maximum(self.days + deltas[choice], 1), np.broadcast_to(self.tiers, choice.shape)
+        days = np.maximum(self.days + deltas[choice // len(tiers)], 1)
+        return days, tiers[choice % len(tiers)]
+
+    def what_if(self, day_options: List[int], tier_options: List[str], top: int = TOP_VARIANTS) -> dict:
+        days, tiers = self.variant_grid(day_options, tier_options)
+        totals = np.nansum(self.leg_costs(days, tiers), axis=1)
+        # Only the top few need ordering; partition first instead of sorting every variant
+        if totals.size > top:
+            head = np.argpartition(totals, top - 1)[:top]
+        else:
+            head = np.arange(totals.size)
+        cheapest = head[np.argsort(totals[head], kind="stable")]
+        return {
+            "variants": int(totals.size),
+            "min_total": round(float(totals.min())),
+            "median_total": round(float(np.median(totals))),
+            "max_total": round(float(totals.max())),
+            "cheapest": [
+                {
+                    "total_cost": round(float(totals[v])),
+                    "legs": [{"destination": leg.destination, "days": int(days[v, i]), "tier": TIERS[tiers[v, i]]}
+                             for i, leg in enumerate(self.legs)],
+                }
+                for v in cheapest
+            ],
+        }
+
+
+async def fetch_daily_rates(destinations: List[str]) -> Dict[str, Optional[float]]:
+    """Daily cost per distinct destination, looked up concurrently (cached lookups return at once)."""
+    keys = {destination_key(d): d for d in destinations}
+    results = await asyncio.gather(*(asyncio.to_thread(get_estimated_expense, d) for d in keys.values()))
+    return {key: result.get("daily_cost") for key, result in zip(keys, results)}
+
+
+async def get_trip_cost(legs: list[LegSpec], day_options: Optional[list[int]] = None,
+                        tier_options: Optional[list[str]] = None) -> dict:
+    """Estimates the total cost in USD of a trip with one or more legs.
+
+    Each leg is {"destination": city, "days": number of days, "travelers": people (default 1),
+    "tier": "budget", "mid" or "luxury" (default "mid")}. Returns the cost of every leg and the
+    trip total. To compare alternatives, pass day_options (days to add or remove per leg, e.g.
+    [-1, 0, 1]) and/or tier_options (e.g. ["budget", "mid"]); every combination is priced and the
+    cheapest ones are returned.
+    """
+    try:
+        trip = [TripLeg.from_dict(leg) for leg in legs]
+        if not trip:
+            raise ValueError("At least one leg is required.")
+        for tier in tier_options or []:
+            if tier not in TIER_MULTIPLIERS:
+                raise ValueError(f"Unknown tier '{tier}'; use one of {', '.join(TIERS)}.")
+    except (AttributeError, TypeError, ValueError) as e:
+        return {"status": "error", "message": str(e)}
+
+    table = TripCostTable(trip, await fetch_daily_rates([leg.destination for leg in trip]))
+    costs = table.leg_costs()
+    result = {
+        "status": "partial" if table.missing else "success",
+        "currency": "USD",
+        "legs": [
+            {"destination": leg.destination, "days": leg.days, "travelers": leg.travelers, "tier": leg.tier,
+             "daily_rate": None if np.isnan(rate) else round(float(rate)),
+             "cost": None if np.isnan(cost) else round(float(cost))}
+            for leg, rate, cost in zip(trip, table.rates, costs)
+        ],
+        "total_cost": round(table.total()),
+    }
+    if table.missing:
+        result["missing"] = table.missing
+        result["message"] = f"No cost data for {', '.join(table.missing)}; the total excludes those legs."
+    if day_options or tier_options:
+        try:
+            result["what_if"] = table.what_if(day_options or [0], tier_options or [])
+        except ValueError as e:
+            result["what_if"] = {"status": "error", "message": str(e)}
+    return result
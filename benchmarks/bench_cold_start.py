@@ -0,0 +1,65 @@
+# benchmarks/bench_cold_start.py – Import and agent start-up time in fresh interpreters
+#
+# Usage: python -m benchmarks.bench_cold_start [--runs 5] [--top 15]
+# Each run starts a new Python process so nothing is shared with a warm module cache.
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import backend.main
+imported = time.perf_counter()
+backend.main.agent_router.backends[0].provider.get()
+built = time.perf_counter()
+print(json.dumps({"import_seconds": imported - started, "build_seconds": built - imported}))
+"""
+
+
+def run_probe() -> dict:
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", PROBE], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list:
+    """Cumulative import time per third-party/stdlib package, from `python -X importtime`."""
+    stderr = subprocess.run([sys.executable, "-W", "ignore", "-X", "importtime", "-c", "import backend.main"],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[12:]:
+            continue
+        _, cumulative, name = line[12:].split("|")
+        # The outermost import of a package has the largest cumulative time of any of its modules
+        root = name.strip().split(".")[0]
+        if cumulative.strip().isdigit() and root not in ("backend", "config"):
+            totals[root] = max(totals.get(root, 0), int(cumulative))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_seconds_median": round(statistics.median(s["import_seconds"] for s in samples), 3),
+        "build_seconds_median": round(statistics.median(s["build_seconds"] for s in samples), 3),
+        "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest_imports(args.top)},
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_cost_extraction.py – Throughput and accuracy of snippet cost extraction
+#
+# Usage: python -m benchmarks.bench_cost_extraction [--rounds 2000]
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from backend.tools.cost_extraction import estimate_daily_cost
+
+FIXTURES = Path(__file__).parent / "fixtures" / "serpapi_snippets.json"
+# An estimate counts as accurate when it lands within this fraction of the expected value
+TOLERANCE = 0.25
+
+
+def legacy_first_dollar_token(snippets):
+    """The original tokenizer from get_estimated_expense: first `$`/USD token wins."""
+    for snippet in snippets:
+        if "$" in snippet or "USD" in snippet:
+            tokens = snippet.replace(",", "").split()
+            for token in tokens:
+                if "$" in token or "USD" in token:
+                    num = "".join([c for c in token if c.isdigit()])
+                    if num:
+                        return int(num)
+    return None
+
+
+def engine(snippets):
+    estimate = estimate_daily_cost(snippets)
+    return estimate.daily_cost if estimate else None
+
+
+def run(name, extract, corpus, rounds):
+    correct = 0
+    for case in corpus:
+        value = extract(case["snippets"])
+        if value and abs(value - case["expected_daily_usd"]) <= TOLERANCE * case["expected_daily_usd"]:
+            correct += 1
+
+    snippet_count = sum(len(case["snippets"]) for case in corpus)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for case in corpus:
+            extract(case["snippets"])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "name": name,
+        "accuracy": round(correct / len(corpus), 3),
+        "snippets_per_sec": round(snippet_count * rounds / elapsed),
+        "us_per_destination": round(elapsed / (rounds * len(corpus)) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = json.loads(FIXTURES.read_text(encoding="utf-8"))
+    for result in (run("legacy", legacy_first_dollar_token, corpus, args.rounds),
+                   run("engine", engine, corpus, args.rounds)):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# benchmarks/bench_load.py – Offline load test of backend.main:app against fake Gemini and SerpAPI
+#
+# Usage: python -m benchmarks.bench_load [--endpoint plan|stream|batch] [--concurrency 32] [--requests 500]
+#                                        [--llm-latency 0.3] [--tokens-per-second 200] [--serp-latency 0.2]
+#                                        [--output results.json] [--baseline previous.json]
+#
+# The app runs under uvicorn on a background thread with its own event loop, exactly as in production;
+# the model behind every agent backend is replaced with FakeLlm and SERPAPI_URL points at FakeSerpApi,
+# so no credentials or network access are needed and runs are repeatable. Keep the fake settings fixed
+# and pass the previous run as --baseline to compare commits.
+
+import argparse
+import asyncio
+import json
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from config import settings
+
+ROOT = Path(__file__).resolve().parent.parent
+DESTINATIONS = [item["destination"] for item in json.loads(
+    (Path(__file__).parent / "fixtures" / "serpapi_snippets.json").read_text())]
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_summary(seconds) -> dict:
+    return {
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(seconds, 0.99) * 1000, 1),
+        "max_ms": round(max(seconds, default=0.0) * 1000, 1),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# --- Server under test ---
+class ServerThread:
+    """uvicorn serving backend.main:app on an ephemeral port in a separate thread and event loop."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve(sockets=[self.sock]))
+
+    def start(self, timeout: float = 60.0):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def _measure_loop_lag(interval: float, samples: list, stop: threading.Event):
+    """Runs on the server loop: how late a periodic timer fires is time the loop spent blocked."""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+# --- Load generation ---
+def make_request(endpoint: str, index: int, unique: bool, batch_size: int, cities: int = 1) -> tuple:
+    stops = [DESTINATIONS[(index + n) % len(DESTINATIONS)] for n in range(cities)]
+    destination = stops[0]
+    prompt = f"What is the best time to visit {' and '.join(stops)} and what will it cost?"
+    if unique:
+        prompt += f" (trip {index})"
+    if endpoint == "batch":
+        prompts = [{"prompt": f"{prompt} [{n}]"} for n in range(batch_size)]
+        return "/travel-plan/batch", {"prompts": prompts, "destinations": [destination]}
+    return ("/travel-plan/stream" if endpoint == "stream" else "/travel-plan"), {"prompt": prompt}
+
+
+async def drive(base_url: str, args) -> dict:
+    latencies, ttfb, statuses = [], [], {}
+    errors = 0
+    next_index = iter(range(args.warmup + args.requests))
+    headers = {} if args.cache else {"X-Cache-Bypass": "1"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for index in next_index:
+                path, body = make_request(args.endpoint, index, args.unique, args.batch_size, args.cities)
+                started = time.perf_counter()
+                first = None
+                try:
+                    async with client.stream("POST", path, json=body, headers=headers) as response:
+                        async for _ in response.aiter_bytes():
+                            if first is None:
+                                first = time.perf_counter() - started
+                        status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - started
+                if index < args.warmup:
+                    continue
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    ttfb.append(first or elapsed)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return {"latencies": latencies, "ttfb": ttfb, "statuses": statuses, "errors": errors, "wall": wall}
+
+
+def use_fakes(serpapi_url: str, concurrency: int, coalesce: bool = False) -> None:
+    """Settings for a benchmark server; must run before backend.main builds the router and limiter."""
+    settings.SERPAPI_URL = serpapi_url
+    settings.AGENT_BACKENDS = ["api_key"]
+    settings.AGENT_WARMUP = True
+    settings.AGENT_WARMUP_PRIME = False
+    settings.TRACE_SAMPLE_RATE = 0.0
+    settings.LOG_LEVEL = "WARNING"
+    settings.MAX_CONCURRENT_AGENT_RUNS = max(settings.MAX_CONCURRENT_AGENT_RUNS, concurrency)
+    settings.MAX_QUEUED_AGENT_RUNS = max(settings.MAX_QUEUED_AGENT_RUNS, concurrency * 4)
+    settings.EXPENSE_CACHE_BACKEND = "memory"
+    # Off by default so identical prompts measure the agent path, not the shared-run fan-out
+    settings.PROMPT_COALESCE_ENABLED = coalesce
+    # A throwaway cost index so runs never read or grow the real one
+    settings.COST_INDEX_PATH = str(Path(tempfile.mkdtemp()) / "cost_index.sqlite3")
+    settings.COST_INDEX_REFRESH_ENABLED = False
+
+
+def run(args) -> dict:
+    from benchmarks.fakes import FakeLlm, FakeSerpApi
+
+    serpapi = FakeSerpApi(latency=args.serp_latency)
+    use_fakes(serpapi.url, args.concurrency, coalesce=args.coalesce)
+    if args.cold_tools:
+        settings.EXPENSE_CACHE_TTL_SECONDS = 0
+        settings.COST_INDEX_ENABLED = False
+
+    import backend.main
+
+    model_class = FakeLlm
+    if args.scheduled:
+        from backend.services.upstream import scheduled_model_class, upstream_scheduler
+        # Pace against the fake's quota exactly as against Gemini's
+        model_class = scheduled_model_class(FakeLlm)
+        if args.quota_rps:
+            upstream_scheduler.limits["gemini"] = {**upstream_scheduler.limits.get("gemini", {}),
+                                                   "rate": args.quota_rps, "burst": 1}
+    fake_llm = model_class(first_token_seconds=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                           output_tokens=args.output_tokens, use_tools=not args.no_tools, quota_rps=args.quota_rps)
+    server = ServerThread(backend.main.app)
+    server.start()
+    for agent_backend in backend.main.agent_router.backends:
+        agent_backend.provider.get().agent.model = fake_llm
+
+    lag, stop = [], threading.Event()
+    asyncio.run_coroutine_threadsafe(_measure_loop_lag(args.lag_interval, lag, stop), server.loop)
+    rss_start = rss_mb()
+    try:
+        outcome = asyncio.run(drive(server.url, args))
+    finally:
+        stop.set()
+        rss_end = rss_mb()
+        server.stop()
+        serpapi.close()
+
+    completed = len(outcome["latencies"])
+    result = {
+        "commit": git_commit(),
+        "config": {key: getattr(args, key) for key in (
+            "endpoint", "concurrency", "requests", "warmup", "unique", "cache", "batch_size", "cities",
+            "cold_tools", "coalesce", "quota_rps", "scheduled", "llm_latency", "tokens_per_second", "output_tokens", "serp_latency", "no_tools")},
+        "completed": completed,
+        "errors": outcome["errors"],
+        "statuses": outcome["statuses"],
+        "requests_per_second": round(completed / outcome["wall"], 2) if outcome["wall"] else 0.0,
+        "latency": latency_summary(outcome["latencies"]),
+        "event_loop_lag": {**latency_summary(lag),
+                           "mean_ms": round(statistics.fmean(lag) * 1000, 2) if lag else 0.0},
+        "memory": {"rss_start_mb": round(rss_start, 1), "rss_end_mb": round(rss_end, 1),
+                   "growth_mb": round(rss_end - rss_start, 1)},
+        "serpapi_calls": serpapi.calls,
+        "agent_runs_coalesced": backend.main.prompt_coalescer.runs_saved,
+        "model_calls_refused": fake_llm.refused,
+    }
+    if args.endpoint == "stream":
+        result["time_to_first_byte"] = latency_summary(outcome["ttfb"])
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions beyond `tolerance` (fractional) against a previous run with the same config."""
+    regressions = []
+    if baseline.get("config") != result["config"]:
+        regressions.append("config differs from baseline; numbers are not comparable")
+    checks = [
+        ("latency.p95_ms", result["latency"]["p95_ms"], baseline["latency"]["p95_ms"], True),
+        ("latency.p99_ms", result["latency"]["p99_ms"], baseline["latency"]["p99_ms"], True),
+        ("requests_per_second", result["requests_per_second"], baseline["requests_per_second"], False),
+    ]
+    for name, current, previous, lower_is_better in checks:
+        if not previous:
+            continue
+        change = (current - previous) / previous
+        if (change > tolerance) if lower_is_better else (change < -tolerance):
+            regressions.append(f"{name}: {previous} -> {current} ({change:+.0%}) vs {baseline.get('commit')}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with fake LLM and SerpAPI")
+    parser.add_argument("--endpoint", choices=("plan", "stream", "batch"), default="plan")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--unique", action="store_true", help="make every prompt distinct")
+    parser.add_argument("--cache", action="store_true", help="allow response-cache hits (bypassed by default)")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--cities", type=int, default=1, help="destinations per prompt (multi-city trips)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before each model turn starts")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--no-tools", action="store_true", help="answer without calling the expense tool")
+    parser.add_argument("--serp-latency", type=float, default=0.2)
+    parser.add_argument("--coalesce", action="store_true", help="let identical in-flight prompts share one run")
+    parser.add_argument("--quota-rps", type=float, default=0.0,
+                        help="the fake model refuses calls beyond this many per second with a 429")
+    parser.add_argument("--scheduled", action="store_true",
+                        help="route model calls through the upstream scheduler (paced at --quota-rps)")
+    parser.add_argument("--cold-tools", action="store_true", help="disable the expense cache so every call hits SerpAPI")
+    parser.add_argument("--lag-interval", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write the result JSON here")
+    parser.add_argument("--baseline", help="previous result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
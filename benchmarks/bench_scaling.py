@@ -0,0 +1,147 @@
+# benchmarks/bench_scaling.py – Throughput of the pre-fork launcher (backend.serve) by worker count
+#
+# Usage: python -m benchmarks.bench_scaling [--workers 1,2,4] [--concurrency 64] [--requests 600]
+#                                           [--llm-latency 0.0] [--tokens-per-second 5000] [--output scaling.json]
+#
+# For each worker count a fresh launcher is started in a subprocess with FakeLlm preloaded into the
+# agent before it forks, and driven over HTTP exactly like bench_load. The fake model answers at once
+# by default, so each request's cost is the server's own CPU work (ADK run loop, tool call, sessions)
+# and throughput should grow with workers until cores run out. The load generator and fake SerpAPI
+# run in this process and need CPU too: leave a core free for them, or read the efficiency column as
+# a lower bound.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_load import ROOT, drive, git_commit, latency_summary, use_fakes
+from config import settings
+
+
+def serve(args) -> int:
+    """Subprocess side: configure fakes, preload, then fork the workers."""
+    use_fakes(args.serpapi_url, args.concurrency)
+    # What backend.serve.main does for several workers, in a throwaway file
+    settings.SESSION_STORE_BACKEND = "sqlite"
+    settings.SESSION_STORE_PATH = str(Path(tempfile.mkdtemp()) / "sessions.sqlite3")
+    settings.SERVE_PRELOAD_AGENT = True
+
+    from backend.serve import Launcher, preload
+    from benchmarks.fakes import FakeLlm
+
+    app = preload()
+    from backend.services.backend_router import agent_router
+
+    fake_llm = FakeLlm(first_token_seconds=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                       output_tokens=args.output_tokens)
+    for backend in agent_router.backends:
+        backend.provider.get().agent.model = fake_llm
+    return Launcher(app, "127.0.0.1", args.port, args.workers_count, graceful_seconds=10).run()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, workers: int, timeout: float = 120.0) -> None:
+    """Until enough consecutive /ready probes succeed that every worker has most likely started."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < workers * 4:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Launcher with {workers} worker(s) did not become ready")
+        try:
+            streak = streak + 1 if httpx.get(f"{url}/ready", timeout=5).status_code == 200 else 0
+        except httpx.HTTPError:
+            streak = 0
+            time.sleep(0.2)
+
+
+def measure(workers: int, serpapi_url: str, args) -> dict:
+    port = free_port()
+    command = [sys.executable, "-W", "ignore", "-m", "benchmarks.bench_scaling", "--serve",
+               "--workers-count", str(workers), "--port", str(port), "--serpapi-url", serpapi_url,
+               "--concurrency", str(args.concurrency), "--llm-latency", str(args.llm_latency),
+               "--tokens-per-second", str(args.tokens_per_second), "--output-tokens", str(args.output_tokens)]
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(url, workers)
+        load = argparse.Namespace(endpoint="plan", concurrency=args.concurrency, requests=args.requests,
+                                  warmup=args.warmup, unique=True, cache=False, batch_size=1, cities=1,
+                                  timeout=120.0)
+        outcome = asyncio.run(drive(url, load))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    completed = len(outcome["latencies"])
+    return {
+        "workers": workers,
+        "completed": completed,
+        "errors": outcome["errors"],
+        "requests_per_second": round(completed / outcome["wall"], 2) if outcome["wall"] else 0.0,
+        "latency": latency_summary(outcome["latencies"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of backend.serve by worker count")
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default 1,2,4,.. up to cores)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=5000.0)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--serp-latency", type=float, default=0.0)
+    parser.add_argument("--output", help="write the result JSON here")
+    # Internal: the launcher subprocess
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workers-count", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--serpapi-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        sys.exit(serve(args))
+
+    from benchmarks.fakes import FakeSerpApi
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    counts = [int(n) for n in args.workers.split(",")] if args.workers else sorted(
+        {1, *(2 ** i for i in range(1, 8) if 2 ** i <= cores), cores})
+    serpapi = FakeSerpApi(latency=args.serp_latency)
+    try:
+        runs = [measure(workers, serpapi.url, args) for workers in counts]
+    finally:
+        serpapi.close()
+
+    base = runs[0]["requests_per_second"] / runs[0]["workers"] if runs and runs[0]["requests_per_second"] else 0.0
+    for run in runs:
+        # Speed-up over one worker's throughput, and how close that is to linear
+        run["speedup"] = round(run["requests_per_second"] / base, 2) if base else 0.0
+        run["efficiency"] = round(run["speedup"] / run["workers"], 2)
+    result = {
+        "commit": git_commit(),
+        "cores": cores,
+        "config": {key: getattr(args, key) for key in (
+            "concurrency", "requests", "warmup", "llm_latency", "tokens_per_second", "output_tokens", "serp_latency")},
+        "runs": runs,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
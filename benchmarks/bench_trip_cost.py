@@ -0,0 +1,59 @@
+# benchmarks/bench_trip_cost.py – Cost of pricing what-if variants for multi-leg trips
+#
+# Usage: python -m benchmarks.bench_trip_cost [--legs 4] [--rounds 50]
+# Compares the columnar NumPy table against pricing each variant with a plain Python loop.
+
+import argparse
+import itertools
+import json
+import time
+
+from backend.tools.trip_cost import EXTRA_TRAVELER_SHARE, TIER_MULTIPLIERS, TIERS, TripCostTable, TripLeg
+
+DAY_OPTIONS = [-1, 0, 1, 2]
+TIER_OPTIONS = ["budget", "mid", "luxury"]
+
+
+def python_loop(legs, rates):
+    """Per-variant arithmetic in pure Python, as the agent (or a naive tool) would do it."""
+    totals = []
+    per_leg = [(delta, tier) for delta in DAY_OPTIONS for tier in TIER_OPTIONS]
+    for combo in itertools.product(per_leg, repeat=len(legs)):
+        total = 0.0
+        for leg, (delta, tier) in zip(legs, combo):
+            days = max(leg.days + delta, 1)
+            total += rates[leg.destination.lower()] * TIER_MULTIPLIERS[tier] * days * (
+                1 + (leg.travelers - 1) * EXTRA_TRAVELER_SHARE)
+        totals.append(total)
+    return min(totals)
+
+
+def columnar(legs, rates):
+    table = TripCostTable(legs, rates)
+    return table.what_if(DAY_OPTIONS, TIER_OPTIONS)["min_total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--legs", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    legs = [TripLeg(f"City{i}", days=3 + i % 3, travelers=1 + i % 2, tier=TIERS[i % 3]) for i in range(args.legs)]
+    rates = {f"city{i}": 80.0 + 15 * i for i in range(args.legs)}
+    variants = (len(DAY_OPTIONS) * len(TIER_OPTIONS)) ** args.legs
+
+    result = {"legs": args.legs, "variants": variants}
+    for name, fn in (("numpy", columnar), ("python", python_loop)):
+        fn(legs, rates)
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            cheapest = fn(legs, rates)
+        elapsed = (time.perf_counter() - started) / args.rounds
+        result[name] = {"ms_per_call": round(elapsed * 1000, 2),
+                        "variants_per_second": round(variants / elapsed), "cheapest": round(cheapest)}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/fakes.py – Deterministic local stand-ins for Gemini and SerpAPI used by the load harness
+
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import AsyncGenerator
+from urllib.parse import parse_qs, urlparse
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+from google.genai import types
+from google.genai.errors import ClientError
+
+FIXTURES = Path(__file__).parent / "fixtures" / "serpapi_snippets.json"
+DESTINATION_PATTERN = re.compile(r"\b(?:to|in|visit)\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)")
+KNOWN_DESTINATIONS = [item["destination"] for item in json.loads(FIXTURES.read_text())]
+
+
+class FakeLlm(BaseLlm):
+    """Model that answers every prompt the same way at a fixed pace.
+
+    The first turn calls `get_estimated_expense` once for every destination named in the prompt,
+    all in one response as Gemini does for multi-city trips (when the agent has that tool); the
+    second writes `output_tokens` words at `tokens_per_second` after `first_token_seconds`.
+    Streaming requests receive one partial chunk per `chunk_tokens`. With `quota_rps`, calls
+    beyond that many per second are refused with a 429 carrying `Retry-After: 1`, like a
+    provider quota.
+    """
+
+    model: str = "fake-llm"
+    first_token_seconds: float = 0.3
+    tokens_per_second: float = 200.0
+    output_tokens: int = 120
+    chunk_tokens: int = 10
+    use_tools: bool = True
+    quota_rps: float = 0.0
+    _window: list = PrivateAttr(default_factory=list)
+    _refused: int = PrivateAttr(default=0)
+
+    @property
+    def refused(self) -> int:
+        return self._refused
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        if self.quota_rps:
+            now = time.monotonic()
+            self._window[:] = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.quota_rps:
+                self._refused += 1
+                raise QuotaExceeded()
+            self._window.append(now)
+        await asyncio.sleep(self.first_token_seconds)
+        last = llm_request.contents[-1] if llm_request.contents else None
+        answered_tool = last is not None and any(part.function_response for part in last.parts or [])
+        if self.use_tools and not answered_tool and "get_estimated_expense" in llm_request.tools_dict:
+            text = _text(llm_request.contents[-1:])
+            destinations = [d for d in KNOWN_DESTINATIONS if d in text]
+            if not destinations:
+                match = DESTINATION_PATTERN.search(text)
+                destinations = [match.group(1) if match else "Paris"]
+            calls = [types.Part(function_call=types.FunctionCall(name="get_estimated_expense",
+                                                                 args={"destination": d})) for d in destinations]
+            yield LlmResponse(content=types.Content(role="model", parts=calls))
+            return
+
+        words = [f"word{i}" for i in range(self.output_tokens)]
+        if not stream:
+            await asyncio.sleep(self.output_tokens / self.tokens_per_second)
+            yield LlmResponse(content=_model_text(" ".join(words)))
+            return
+        for start in range(0, len(words), self.chunk_tokens):
+            chunk = words[start:start + self.chunk_tokens]
+            await asyncio.sleep(len(chunk) / self.tokens_per_second)
+            yield LlmResponse(content=_model_text(" ".join(chunk) + " "), partial=True)
+        yield LlmResponse(content=_model_text(" ".join(words)), partial=False)
+
+
+class QuotaExceeded(ClientError):
+    """The genai client's 429: RESOURCE_EXHAUSTED with a google.rpc.RetryInfo delay of one second."""
+
+    def __init__(self):
+        super().__init__(429, {"error": {
+            "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded for requests per second.",
+            "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}],
+        }})
+
+
+def _model_text(text: str) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+def _text(contents) -> str:
+    return " ".join(part.text for content in contents for part in content.parts or [] if part.text)
+
+
+class FakeSerpApi:
+    """Threaded local HTTP server shaped like serpapi.com/search, with fixed latency.
+
+    Destinations from `fixtures/serpapi_snippets.json` return their recorded snippets; anything
+    else gets one generic per-day price.
+    """
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.calls = 0
+        snippets = {item["destination"].lower(): item["snippets"] for item in json.loads(FIXTURES.read_text())}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake.calls += 1
+                time.sleep(fake.latency)
+                query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+                destination = query.removeprefix("Average travel cost in ").removesuffix(" per day").lower()
+                results = snippets.get(destination, [f"Travelers to {destination} spend about $110 per day."])
+                body = json.dumps({"organic_results": [{"snippet": s} for s in results]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
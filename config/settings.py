@@ -1,13 +1,19 @@
 # config/settings.py – Centralized App Configuration
 
 import json
+import logging
 from pathlib import Path
 
 # Load secrets from secrets.json
 SECRETS_PATH = Path(__file__).parent / "secrets.json"
 
-with open(SECRETS_PATH, "r") as f:
-    secrets = json.load(f)
+# A missing file only leaves credentials unset; it must not break imports (tests, tooling)
+try:
+    with open(SECRETS_PATH, "r") as f:
+        secrets = json.load(f)
+except FileNotFoundError:
+    logging.getLogger(__name__).warning("%s not found; using defaults", SECRETS_PATH)
+    secrets = {}
 
 # Access values
 GOOGLE_APPLICATION_CREDENTIALS = secrets.get("GOOGLE_APPLICATION_CREDENTIALS")
@@ -17,8 +23,165 @@ LOCATION = secrets.get("LOCATION")
 SERPAPI_API_KEY = secrets.get("SERPAPI_API_KEY")
 GOOGLE_API_KEY = secrets.get("GOOGLE_API_KEY")
 
-# Set ADC env var for Gemini
-import os
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(GOOGLE_APPLICATION_CREDENTIALS)
-os.environ["GOOGLE_CLOUD_PROJECT"] = str(PROJECT_ID)
-os.environ["GOOGLE_CLOUD_LOCATION"] = str(LOCATION)
+# Startup: build the agent during the FastAPI lifespan, optionally priming it with one tiny prompt
+AGENT_WARMUP = bool(secrets.get("AGENT_WARMUP", True))
+AGENT_WARMUP_PRIME = bool(secrets.get("AGENT_WARMUP_PRIME", False))
+
+# Agent backends: "api_key" (Gemini API + custom tools) and/or "adc" (Vertex AI + google_search).
+# With several, AGENT_ROUTING "weighted" balances by weight x observed speed/health, "failover" uses list order.
+AGENT_BACKENDS = list(secrets.get("AGENT_BACKENDS", ["api_key"]))
+AGENT_BACKEND_WEIGHTS = dict(secrets.get("AGENT_BACKEND_WEIGHTS", {}))
+AGENT_ROUTING = secrets.get("AGENT_ROUTING", "weighted")
+# A backend that returns a rate-limit error is skipped for this long
+AGENT_BACKEND_COOLDOWN_SECONDS = float(secrets.get("AGENT_BACKEND_COOLDOWN_SECONDS", 30))
+
+# Per-request deadline for /travel-plan and its stream, carried into tool calls, HTTP timeouts and upstream queues.
+# A run still going at the deadline is abandoned for a fallback answer (504 when there is none to give).
+AGENT_DEADLINE_SECONDS = float(secrets.get("AGENT_DEADLINE_SECONDS", 45))
+# Hedging: a fresh run still going after the backend's recent p95 latency is duplicated on the next healthy
+# backend (never with a single backend); the first answer wins and the other run is cancelled
+AGENT_HEDGE_ENABLED = bool(secrets.get("AGENT_HEDGE_ENABLED", True))
+AGENT_HEDGE_PERCENTILE = float(secrets.get("AGENT_HEDGE_PERCENTILE", 0.95))
+AGENT_HEDGE_MIN_SAMPLES = int(secrets.get("AGENT_HEDGE_MIN_SAMPLES", 20))
+# Hedges allowed per fresh run (a budget that refills as runs complete), so a slow provider is not sent double load
+AGENT_HEDGE_MAX_RATIO = float(secrets.get("AGENT_HEDGE_MAX_RATIO", 0.1))
+# Fallback answers: a smaller, faster model given the cost index's figures and no tools (unset = the figures
+# alone). When set, the agent gets AGENT_DEADLINE_SECONDS minus this budget so the answer still lands in time.
+FALLBACK_MODEL = secrets.get("FALLBACK_MODEL")  # e.g., "gemini-1.5-flash-8b"
+FALLBACK_TIMEOUT_SECONDS = float(secrets.get("FALLBACK_TIMEOUT_SECONDS", 5))
+FALLBACK_MAX_OUTPUT_TOKENS = int(secrets.get("FALLBACK_MAX_OUTPUT_TOKENS", 512))
+
+# Production serving (python -m backend.serve): workers forked from one parent that preloaded the app.
+# 0 = one worker per CPU core. Each worker paces itself to 1/N of every UPSTREAM_LIMITS quota.
+SERVE_WORKERS = int(secrets.get("SERVE_WORKERS", 0))
+# Build the agent in the parent so workers start warm (network connections are still opened per worker)
+SERVE_PRELOAD_AGENT = bool(secrets.get("SERVE_PRELOAD_AGENT", True))
+# On SIGTERM a worker stops accepting and finishes in-flight requests for up to this long, then is killed
+SERVE_GRACEFUL_SHUTDOWN_SECONDS = float(secrets.get("SERVE_GRACEFUL_SHUTDOWN_SECONDS", AGENT_DEADLINE_SECONDS + 15))
+
+# Agent run admission control (per uvicorn worker)
+MAX_CONCURRENT_AGENT_RUNS = int(secrets.get("MAX_CONCURRENT_AGENT_RUNS", 64))
+MAX_QUEUED_AGENT_RUNS = int(secrets.get("MAX_QUEUED_AGENT_RUNS", 256))
+AGENT_QUEUE_TIMEOUT_SECONDS = float(secrets.get("AGENT_QUEUE_TIMEOUT_SECONDS", 30))
+
+# Batch endpoint: concurrent agent runs per batch and maximum prompts per request
+BATCH_MAX_CONCURRENCY = int(secrets.get("BATCH_MAX_CONCURRENCY", 16))
+BATCH_MAX_ITEMS = int(secrets.get("BATCH_MAX_ITEMS", 500))
+
+# Per-caller session pool
+SESSION_TTL_SECONDS = float(secrets.get("SESSION_TTL_SECONDS", 1800))
+SESSION_MAX_COUNT = int(secrets.get("SESSION_MAX_COUNT", 1000))
+SESSION_MAX_HISTORY_EVENTS = int(secrets.get("SESSION_MAX_HISTORY_EVENTS", 40))
+SESSION_MAX_HISTORY_TOKENS = int(secrets.get("SESSION_MAX_HISTORY_TOKENS", 8000))
+# Turns trimmed from history are folded into a summary of at most this many characters (0 drops them)
+SESSION_SUMMARY_MAX_CHARS = int(secrets.get("SESSION_SUMMARY_MAX_CHARS", 2000))
+
+# Shared session store so any worker or replica can continue a conversation
+# ("memory" = this process only, "sqlite" = one file per host, "redis" = any Redis-compatible server)
+SESSION_STORE_BACKEND = secrets.get("SESSION_STORE_BACKEND", "memory")
+SESSION_STORE_PATH = secrets.get("SESSION_STORE_PATH", "config/sessions.sqlite3")
+SESSION_STORE_URL = secrets.get("SESSION_STORE_URL", "redis://localhost:6379/0")
+# Write-behind: snapshots are written in batches off the request path
+SESSION_FLUSH_INTERVAL_SECONDS = float(secrets.get("SESSION_FLUSH_INTERVAL_SECONDS", 0.2))
+SESSION_FLUSH_BATCH = int(secrets.get("SESSION_FLUSH_BATCH", 100))
+# Stored records at least this large are zlib-compressed
+SESSION_COMPRESS_MIN_BYTES = int(secrets.get("SESSION_COMPRESS_MIN_BYTES", 1024))
+
+# Identical prompts without session context share one in-flight agent run; callers arriving
+# within the window of its start join it (or reuse its answer if it already finished)
+PROMPT_COALESCE_ENABLED = bool(secrets.get("PROMPT_COALESCE_ENABLED", True))
+PROMPT_COALESCE_WINDOW_SECONDS = float(secrets.get("PROMPT_COALESCE_WINDOW_SECONDS", 10))
+PROMPT_COALESCE_MAX_FOLLOWERS = int(secrets.get("PROMPT_COALESCE_MAX_FOLLOWERS", 1000))
+
+# Upstream scheduler: per provider and key, a token bucket (`rate` calls/s, 0 = unlimited, with `burst`) and an
+# adaptive concurrency limit that shrinks on 429s/slow calls and grows back up to `max_concurrency`.
+# Quotas depend on the plan, so rates are off until set; entries in secrets override these per provider
+# ("gemini" = API key, "vertex" = ADC project, "serpapi"); "default" applies to any other provider.
+UPSTREAM_LIMITS = {
+    "default": {"rate": 0, "burst": 1, "max_concurrency": 32},
+    "gemini": {"rate": 0, "burst": 1, "max_concurrency": 32},
+    "vertex": {"rate": 0, "burst": 1, "max_concurrency": 32},
+    "serpapi": {"rate": 0, "burst": 1, "max_concurrency": 16},
+    **secrets.get("UPSTREAM_LIMITS", {}),
+}
+UPSTREAM_MIN_CONCURRENCY = int(secrets.get("UPSTREAM_MIN_CONCURRENCY", 1))
+# A call slower than this multiple of the recent best latency counts as overload (0 disables)
+UPSTREAM_LATENCY_TOLERANCE = float(secrets.get("UPSTREAM_LATENCY_TOLERANCE", 4.0))
+# Pause after a 429 that carries no Retry-After
+UPSTREAM_DEFAULT_RETRY_AFTER_SECONDS = float(secrets.get("UPSTREAM_DEFAULT_RETRY_AFTER_SECONDS", 5))
+# Longest queue wait per priority class before a call is refused (the API then answers 429)
+UPSTREAM_MAX_WAIT_SECONDS = float(secrets.get("UPSTREAM_MAX_WAIT_SECONDS", 10))
+UPSTREAM_BATCH_MAX_WAIT_SECONDS = float(secrets.get("UPSTREAM_BATCH_MAX_WAIT_SECONDS", 120))
+
+# Response cache for prompts without session context
+RESPONSE_CACHE_ENABLED = bool(secrets.get("RESPONSE_CACHE_ENABLED", True))
+RESPONSE_CACHE_TTL_SECONDS = float(secrets.get("RESPONSE_CACHE_TTL_SECONDS", 6 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(secrets.get("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+# Near-duplicate matching; similarity is cosine over hashed word/trigram vectors (0-1)
+RESPONSE_CACHE_SEMANTIC = bool(secrets.get("RESPONSE_CACHE_SEMANTIC", False))
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(secrets.get("RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.3))
+
+# Outbound HTTP for tools
+HTTP_POOL_SIZE = int(secrets.get("HTTP_POOL_SIZE", 32))
+HTTP_TIMEOUT_SECONDS = float(secrets.get("HTTP_TIMEOUT_SECONDS", 10))
+HTTP_MAX_RETRIES = int(secrets.get("HTTP_MAX_RETRIES", 2))
+HTTP_RETRY_BACKOFF_SECONDS = float(secrets.get("HTTP_RETRY_BACKOFF_SECONDS", 0.25))
+SERPAPI_URL = secrets.get("SERPAPI_URL", "https://serpapi.com/search")
+SERPAPI_TIMEOUT_SECONDS = float(secrets.get("SERPAPI_TIMEOUT_SECONDS", 8))
+
+# Expense lookup cache ("memory" per process, or "disk" shared through a SQLite file)
+EXPENSE_CACHE_BACKEND = secrets.get("EXPENSE_CACHE_BACKEND", "memory")
+EXPENSE_CACHE_TTL_SECONDS = float(secrets.get("EXPENSE_CACHE_TTL_SECONDS", 3 * 24 * 3600))
+EXPENSE_CACHE_MAX_ENTRIES = int(secrets.get("EXPENSE_CACHE_MAX_ENTRIES", 5000))
+EXPENSE_LLM_MODEL = secrets.get("EXPENSE_LLM_MODEL", DEFAULT_MODEL)
+EXPENSE_LLM_TIMEOUT_SECONDS = float(secrets.get("EXPENSE_LLM_TIMEOUT_SECONDS", 10))
+EXPENSE_LLM_CACHE_TTL_SECONDS = float(secrets.get("EXPENSE_LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+EXPENSE_CACHE_PATH = secrets.get("EXPENSE_CACHE_PATH", str(Path(__file__).parent / "expense_cache.sqlite3"))
+
+# Destination cost index: answers known destinations locally; misses and stale entries go upstream.
+# The seed file (an export, see backend/tools/cost_index.py) is imported when the index file is empty.
+COST_INDEX_ENABLED = bool(secrets.get("COST_INDEX_ENABLED", True))
+COST_INDEX_PATH = secrets.get("COST_INDEX_PATH", str(Path(__file__).parent / "cost_index.sqlite3"))
+COST_INDEX_SEED_PATH = secrets.get("COST_INDEX_SEED_PATH", str(Path(__file__).parent / "cost_index.json"))
+COST_INDEX_MAX_AGE_SECONDS = float(secrets.get("COST_INDEX_MAX_AGE_SECONDS", 30 * 24 * 3600))
+COST_INDEX_MAX_ENTRIES = int(secrets.get("COST_INDEX_MAX_ENTRIES", 2000))
+# Memory-map the index file so every worker process on the host reads one shared copy of its pages
+COST_INDEX_MMAP_BYTES = int(secrets.get("COST_INDEX_MMAP_BYTES", 64 * 1024 * 1024))
+# Background refresh: most-requested entries older than REFRESH_AFTER, a paced batch per interval
+COST_INDEX_REFRESH_ENABLED = bool(secrets.get("COST_INDEX_REFRESH_ENABLED", True))
+COST_INDEX_REFRESH_AFTER_SECONDS = float(secrets.get("COST_INDEX_REFRESH_AFTER_SECONDS", 7 * 24 * 3600))
+COST_INDEX_REFRESH_INTERVAL_SECONDS = float(secrets.get("COST_INDEX_REFRESH_INTERVAL_SECONDS", 3600))
+COST_INDEX_REFRESH_BATCH = int(secrets.get("COST_INDEX_REFRESH_BATCH", 25))
+COST_INDEX_REFRESH_PAUSE_SECONDS = float(secrets.get("COST_INDEX_REFRESH_PAUSE_SECONDS", 2))
+# Fetched by the refresher (and `python -m backend.tools.cost_index seed`) whenever missing from the index
+COST_INDEX_SEED_DESTINATIONS = list(secrets.get("COST_INDEX_SEED_DESTINATIONS", [
+    "New York", "Los Angeles", "San Francisco", "Washington", "Las Vegas", "London", "Paris", "Rome",
+    "Barcelona", "Amsterdam", "Berlin", "Tokyo", "Bangkok", "Singapore", "Dubai", "Sydney", "Bali",
+    "Lisbon", "Prague", "Vienna", "Istanbul", "Mexico City", "Rio de Janeiro", "Cancun",
+]))
+
+# Tool calls from one model turn run concurrently and share one deadline; late calls return a timeout result
+TOOL_PARALLEL = bool(secrets.get("TOOL_PARALLEL", True))
+TOOL_TURN_TIMEOUT_SECONDS = float(secrets.get("TOOL_TURN_TIMEOUT_SECONDS", 12))
+
+# Context budget per model call (tokens are estimated at ~4 characters each when the model reports none).
+# Over budget, the oldest whole turns are left out of that request; larger tool results are clipped.
+CONTEXT_MAX_PROMPT_TOKENS = int(secrets.get("CONTEXT_MAX_PROMPT_TOKENS", 16000))
+CONTEXT_MAX_OUTPUT_TOKENS = int(secrets.get("CONTEXT_MAX_OUTPUT_TOKENS", 2048))
+CONTEXT_MAX_TOOL_RESULT_CHARS = int(secrets.get("CONTEXT_MAX_TOOL_RESULT_CHARS", 4000))
+# Provider-side caching of the static instruction + tool declarations, used once they reach the
+# model's minimum cacheable size (Gemini: 1024-4096 tokens depending on model, 32768 for 1.5)
+CONTEXT_CACHE_ENABLED = bool(secrets.get("CONTEXT_CACHE_ENABLED", True))
+CONTEXT_CACHE_MIN_TOKENS = int(secrets.get("CONTEXT_CACHE_MIN_TOKENS", 4096))
+CONTEXT_CACHE_TTL_SECONDS = float(secrets.get("CONTEXT_CACHE_TTL_SECONDS", 3600))
+
+# Trip costing tool: cap on what-if combinations priced per call
+TRIP_MAX_VARIANTS = int(secrets.get("TRIP_MAX_VARIANTS", 50000))
+
+# Logging and tracing: span durations always feed /metrics; span log lines are sampled per request
+LOG_LEVEL = str(secrets.get("LOG_LEVEL", "INFO")).upper()
+LOG_FORMAT = secrets.get("LOG_FORMAT", "text")  # "text" or "json"
+LOG_QUEUE_SIZE = int(secrets.get("LOG_QUEUE_SIZE", 10000))
+TRACE_SAMPLE_RATE = float(secrets.get("TRACE_SAMPLE_RATE", 0.1))
+# Spans slower than this are logged regardless of sampling
+TRACE_SLOW_SECONDS = float(secrets.get("TRACE_SLOW_SECONDS", 5.0))
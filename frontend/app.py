@@ -1,25 +1,62 @@
 # frontend/app.py – Streamlit Frontend for Travel Planner
 
+import httpx
 import streamlit as st
-import requests
+
+import travel_api
+from components.input_form import render_input_form
+from components.output_display import render_plan
+from travel_api import PlanDegraded, PlanStream, PlannerBusy, PlannerError
 
 st.set_page_config(page_title="AI Travel Planner", layout="centered")
 st.title("✈️ AI Travel Planner")
 st.caption("Ask anything about your next trip!")
 
-prompt = st.text_area("What do you want to know?", placeholder="e.g., What's the best time to visit Italy and what should I pack?")
-
-if st.button("Get Travel Plan") and prompt:
-    with st.spinner("Thinking like a travel expert..."):
-        try:
-            response = requests.post(
-                url="http://localhost:8000/travel-plan",
-                json={"prompt": prompt}
-            )
-            if response.status_code == 200:
-                st.success("Here's your travel guide!")
-                st.markdown(response.json()["response"])
-            else:
-                st.error("Failed to fetch travel plan. Try again.")
-        except Exception as e:
-            st.error(f"Error: {e}")
+
+# --- Shared across reruns and users of this process ---
+@st.cache_resource(show_spinner=False)
+def get_client() -> httpx.Client:
+    return travel_api.make_client()
+
+
+def _remember_session(session_id: str) -> None:
+    st.session_state["session_id"] = session_id
+
+
+@st.cache_data(ttl=travel_api.ANSWER_CACHE_TTL_SECONDS, max_entries=travel_api.ANSWER_CACHE_MAX_ENTRIES,
+               show_spinner=False)
+def fresh_plan(prompt_key: str, _prompt: str) -> str:
+    """Answer to a prompt without conversation context, keyed by its normalized text.
+
+    On a hit Streamlit replays the finished output and the session callback does not run, so a
+    shared answer never hands one user's session to another (they start a new conversation).
+    """
+    with PlanStream(get_client(), _prompt) as stream:
+        return render_plan(stream, on_session=_remember_session)
+
+
+# --- Page ---
+prompt, submitted = render_input_form()
+
+if submitted and prompt:
+    # Pressing Cancel reruns the script, which stops this one at its next page update
+    cancel = st.empty()
+    cancel.button("Cancel", key="cancel")
+    try:
+        session_id = st.session_state.get("session_id")
+        if session_id:
+            with PlanStream(get_client(), prompt, session_id) as stream:
+                render_plan(stream)
+        else:
+            fresh_plan(travel_api.normalize_prompt(prompt), prompt)
+    except PlanDegraded:
+        # Already shown, with a note; raising kept it out of the answer cache
+        pass
+    except PlannerBusy as e:
+        st.warning(f"{e} (retry in about {e.retry_after}s)")
+    except PlannerError as e:
+        st.error(str(e))
+    finally:
+        cancel.empty()
+elif st.session_state.get("cancel"):
+    st.info("Request cancelled.")
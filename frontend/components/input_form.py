@@ -0,0 +1,16 @@
+# frontend/components/input_form.py – Prompt entry and conversation controls
+
+from typing import Tuple
+
+import streamlit as st
+
+
+def render_input_form() -> Tuple[str, bool]:
+    """Prompt box, submit button and a reset for the follow-up conversation; returns (prompt, submitted)."""
+    prompt = st.text_area("What do you want to know?",
+                          placeholder="e.g., What's the best time to visit Italy and what should I pack?")
+    submit, reset = st.columns([3, 1])
+    submitted = submit.button("Get Travel Plan", type="primary")
+    if st.session_state.get("session_id") and reset.button("New conversation"):
+        st.session_state.pop("session_id", None)
+    return prompt.strip(), submitted
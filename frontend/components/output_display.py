@@ -0,0 +1,52 @@
+# frontend/components/output_display.py – Live rendering of a streamed travel plan
+
+import time
+from typing import Callable, Optional
+
+import streamlit as st
+
+# Partial text is redrawn at most this often; each redraw resends the whole answer so far
+REDRAW_SECONDS = 0.1
+
+
+def render_plan(stream, on_session: Optional[Callable[[str], None]] = None) -> str:
+    """Draw status and partial text while `stream` (a PlanStream) runs; returns the final answer.
+
+    The placeholders are created here rather than passed in, so a cached caller can replay the
+    finished output. Raises PlannerError for API errors and PlanDegraded after drawing a fallback answer.
+    """
+    from travel_api import PlanDegraded, PlannerBusy, PlannerError
+
+    status = st.empty()
+    output = st.empty()
+    status.info("Thinking like a travel expert...")
+    text, drawn_at = "", 0.0
+    for event_type, data in stream.events():
+        if event_type == "wait":
+            # Also gives Streamlit a point to stop the script when the user presses Cancel
+            status.info(f"Thinking like a travel expert... ({data['elapsed']:.0f}s)")
+        elif event_type == "session" and on_session is not None:
+            on_session(data["session_id"])
+        elif event_type == "tool_call":
+            status.info(f"Looking things up ({data['name']})...")
+        elif event_type == "text":
+            text += data["text"]
+            if time.monotonic() - drawn_at >= REDRAW_SECONDS:
+                output.markdown(text)
+                drawn_at = time.monotonic()
+        elif event_type == "final":
+            output.markdown(data["text"])
+            if data.get("degraded"):
+                status.warning("The full plan took too long, so here is a quick answer. Ask again for more detail.")
+                raise PlanDegraded()
+            status.success("Here's your travel guide!")
+            return data["text"]
+        elif event_type == "error":
+            if data.get("retry_after"):
+                raise PlannerBusy(data["message"], data["retry_after"])
+            raise PlannerError(data.get("message", "The planner failed."))
+    if not text:
+        raise PlannerError("The planner returned no answer. Try again.")
+    output.markdown(text)
+    status.success("Here's your travel guide!")
+    return text
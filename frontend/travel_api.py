@@ -0,0 +1,141 @@
+# frontend/travel_api.py – Pooled, time-bounded client for the Travel Planner API
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+import httpx
+
+# The frontend can run in its own container, so it is configured from the environment
+API_URL = os.environ.get("TRAVEL_API_URL", "http://localhost:8000").rstrip("/")
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("TRAVEL_API_CONNECT_TIMEOUT", 5))
+# Longest silence allowed between two streamed events before the request is abandoned
+READ_TIMEOUT_SECONDS = float(os.environ.get("TRAVEL_API_READ_TIMEOUT", 60))
+# Upper bound for one whole plan, however steadily it streams
+TOTAL_TIMEOUT_SECONDS = float(os.environ.get("TRAVEL_API_TOTAL_TIMEOUT", 180))
+POOL_SIZE = int(os.environ.get("TRAVEL_API_POOL_SIZE", 20))
+# Answers to prompts without conversation context are reused by every user for this long
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("TRAVEL_ANSWER_CACHE_TTL", 600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("TRAVEL_ANSWER_CACHE_MAX_ENTRIES", 200))
+
+
+class PlannerError(Exception):
+    """The API answered with an error, timed out or could not be reached."""
+
+
+class PlannerBusy(PlannerError):
+    """The API is at capacity (429); retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PlanDegraded(Exception):
+    """A quick fallback answer was shown because the full plan missed the API's deadline.
+
+    Raised after it is drawn, so a cached caller does not keep it for later users.
+    """
+
+
+def make_client() -> httpx.Client:
+    """One keep-alive connection pool per frontend process (the app caches it with st.cache_resource)."""
+    return httpx.Client(
+        base_url=API_URL,
+        timeout=httpx.Timeout(connect=CONNECT_TIMEOUT_SECONDS, read=READ_TIMEOUT_SECONDS,
+                              write=CONNECT_TIMEOUT_SECONDS, pool=CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+    )
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+def iter_sse(lines) -> Iterator[Tuple[str, dict]]:
+    """Yield (event, data) pairs from the lines of a text/event-stream response."""
+    event_type, data = None, ""
+    for line in lines:
+        if line.startswith("event:"):
+            event_type = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data += line[len("data:"):].strip()
+        elif not line and event_type:
+            yield event_type, json.loads(data) if data else {}
+            event_type, data = None, ""
+
+
+class PlanStream:
+    """One streamed plan, read on a background thread.
+
+    `events()` yields (event, data) pairs as they arrive and ("wait", {"elapsed": seconds}) while
+    nothing arrives, so the Streamlit script keeps touching the page: that is where a click on
+    Cancel (a rerun) interrupts it. Leaving the `with` block, normally or by interruption,
+    closes the connection, which also stops the run on the server.
+    """
+
+    def __init__(self, client: httpx.Client, prompt: str, session_id: Optional[str] = None,
+                 total_timeout: float = TOTAL_TIMEOUT_SECONDS):
+        self.client = client
+        self.body = {"prompt": prompt, "session_id": session_id}
+        self.total_timeout = total_timeout
+        self._events: "queue.Queue" = queue.Queue()
+        self._closed = threading.Event()
+        self._response: Optional[httpx.Response] = None
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def __enter__(self) -> "PlanStream":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._closed.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the reader thread if it is waiting on the socket
+            response.close()
+
+    def events(self, poll_seconds: float = 0.25) -> Iterator[Tuple[str, dict]]:
+        started = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed > self.total_timeout:
+                raise PlannerError(f"No complete answer after {self.total_timeout:.0f}s; please try again.")
+            try:
+                item = self._events.get(timeout=poll_seconds)
+            except queue.Empty:
+                yield "wait", {"elapsed": elapsed}
+                continue
+            if isinstance(item, Exception):
+                raise item
+            if item is None:
+                return
+            yield item
+
+    def _read(self) -> None:
+        try:
+            with self.client.stream("POST", "/travel-plan/stream", json=self.body) as response:
+                self._response = response
+                if response.status_code == 429:
+                    raise PlannerBusy("The planner is busy right now. Please try again in a moment.",
+                                      int(response.headers.get("Retry-After", 1)))
+                if response.status_code != 200:
+                    raise PlannerError(f"Failed to fetch travel plan (HTTP {response.status_code}). Try again.")
+                for item in iter_sse(response.iter_lines()):
+                    if self._closed.is_set():
+                        return
+                    self._events.put(item)
+            self._events.put(None)
+        except PlannerError as e:
+            self._events.put(e)
+        except httpx.TimeoutException:
+            self._events.put(PlannerError("The planner stopped responding. Please try again."))
+        except (httpx.HTTPError, OSError) as e:
+            if not self._closed.is_set():
+                self._events.put(PlannerError(f"Could not reach the planner at {API_URL}: {e}"))